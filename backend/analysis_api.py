@@ -0,0 +1,599 @@
+"""
+analysis_api.py — 音声解析エンドポイント（/analyze, /analyze-karaoke, 解析ジョブ, /ws/live-pitch）
+
+CREPE / Demucs を使う CPU 負荷の高いエンドポイント群。
+単独起動時はワーカー起動時に解析スタックとモデルを事前ロードし、初回リクエストの待ち時間をなくす。
+
+単独起動:
+  uvicorn analysis_api:app --host 0.0.0.0 --port 8002 --workers 2
+"""
+from fastapi import (
+    APIRouter, File, UploadFile, Depends, Form, HTTPException, Request, WebSocket, WebSocketDisconnect,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import contextvars
+import copy
+import json
+import logging
+import os
+import time
+
+from upload_ingest import UploadRejected, ingest_upload_array
+from config import (
+    ANALYSIS_RESULT_CACHE_TTL, ANALYSIS_RESULT_CACHE_MAX_ENTRIES, CREPE_SR, CREPE_HOP_LENGTH,
+    VOCAL_REGION_DETECTION, ANALYSIS_PREVIEW_SECONDS, ANALYSIS_PREVIEW_HOP_FACTOR,
+    ANALYSIS_JOB_EVENT_POLL_SECONDS, ANALYSIS_JOB_EVENT_KEEPALIVE_SECONDS,
+    LIVE_PITCH_MAX_STREAMS, LIVE_PITCH_SUMMARY_SECONDS, LIVE_PITCH_MAX_MESSAGE_BYTES,
+)
+import analysis_jobs as jobs
+from analysis_jobs import create_job, get_job, init_jobs_db, update_job
+from vocal_regions import parse_time_ranges
+from ttl_cache import TTLCache
+
+# ※ analyzer (torch / torchcrepe / librosa) と vocal_separator は import が重いため、
+#    モジュール読込時には import しない。初回の解析リクエストで読み込む（_analyze_array / _separate_vocals_array）。
+#    main.py から読み込まれた場合、/songs や /auth だけを処理するワーカーは音声解析スタックを一切ロードしない。
+
+# recommender（おすすめ曲・似てるアーティスト・声質タイプの付加）
+from recommender import enrich_analysis_result
+
+from database_supabase import (
+    update_vocal_range, create_analysis_record, get_favorite_artist_ids,
+)
+from auth import get_optional_user
+from app_factory import create_app
+from tracing import start_trace, trace_stage
+from progress import progress_reporter, report_progress
+from metrics import gauge
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+ANALYSIS_IN_FLIGHT = gauge("analysis_in_flight", "処理中の解析リクエスト数", ("endpoint",))
+
+# (sha256, エンドポイント, no_falsetto[, ボーカル区間の指定]) -> おすすめ曲などを付ける前の解析結果
+# 同じファイルの再アップロード（再解析ボタン・リトライ）で CREPE / Demucs をやり直さない
+_result_cache = TTLCache("analysis_result", ANALYSIS_RESULT_CACHE_TTL, ANALYSIS_RESULT_CACHE_MAX_ENTRIES)
+
+# ============================================================
+# ファイル管理
+# ============================================================
+
+# 音声は float32 配列のままパイプラインを流れる。ディスクを使うのは MP4 の一時保存のみ
+UPLOAD_DIR = "uploads"
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+DEMUCS_SR = 44100   # Demucs はステレオ 44.1kHz で最適に動作する
+
+
+def _analyze_array(y, sr: int, **kwargs) -> dict:
+    """analyzer.analyze_array の遅延ロード版（初回呼び出し時に torch 等を import）"""
+    from analyzer import analyze_array
+    return analyze_array(y, sr, **kwargs)
+
+
+def _separate_vocals_array(y, sr: int, **kwargs):
+    """vocal_separator.separate_vocals_array の遅延ロード版（16kHz モノラルのボーカルを返す）"""
+    from vocal_separator import separate_vocals_array
+    return separate_vocals_array(y, sr, **kwargs)
+
+
+def _detect_vocal_regions(y, sr: int) -> list:
+    """vocal_regions.detect_vocal_regions の遅延ロード版（scipy を初回に import）"""
+    from vocal_regions import detect_vocal_regions
+    return detect_vocal_regions(y, sr)
+
+
+def _enrich_result(result: dict, user: dict | None = None) -> dict:
+    """解析結果におすすめ曲・似てるアーティストを追加（ログイン済みならお気に入りアーティスト優先）"""
+    if "error" in result:
+        return result
+    fav_ids: list[int] = []
+    if user:
+        try:
+            fav_ids = get_favorite_artist_ids(user["id"])
+        except Exception as e:
+            logger.warning("お気に入りアーティストID取得失敗: %s", e)
+    return enrich_analysis_result(result, fav_ids)
+
+
+def _save_history(user: dict, result: dict, source_type: str, file_name: str | None) -> None:
+    """解析結果を履歴に保存し、プロファイルの最新声域を更新する（失敗しても解析結果は返す）"""
+    try:
+        create_analysis_record(
+            user_id=user["id"],
+            vocal_min=result.get("overall_min"),
+            vocal_max=result.get("overall_max"),
+            falsetto=result.get("falsetto_max"),
+            source_type=source_type,
+            file_name=file_name,
+            result_json=jsonable_encoder(result)
+        )
+        update_vocal_range(
+            user["id"],
+            result.get("overall_min"),
+            result.get("overall_max"),
+            result.get("falsetto_max"),
+        )
+    except Exception as e:
+        logger.warning("履歴保存失敗: %s", e)
+
+
+# ============================================================
+# 音声分析エンドポイント（認証オプショナル）
+# ============================================================
+
+@router.post("/analyze")
+async def analyze_voice(
+    file: UploadFile = File(...),
+    no_falsetto: bool = Form(False),
+    debug: bool = Form(False),
+    user: dict | None = Depends(get_optional_user),
+):
+    """アカペラ/マイク録音用 (Demucsなし)。ログイン済みなら履歴に自動保存
+
+    debug=True の場合、ステージ別の処理時間を result["timings"] に含める。
+    """
+    start_time = time.time()
+    logger.info("アカペラ音源分析リクエスト受信: %s", file.filename)
+
+    with start_trace("analyze") as trace, ANALYSIS_IN_FLIGHT.track_inprogress(endpoint="analyze"):
+        try:
+            # WAV は書かず、ffmpeg の出力を 16kHz モノラルの float32 配列として直接受け取る
+            logger.info("[1/2] アップロード受信・デコード中...")
+            with trace_stage("ingest_upload"):
+                upload = await ingest_upload_array(file, output_dir=UPLOAD_DIR)
+            logger.info("デコード完了: %.1f秒", len(upload.audio) / upload.sr)
+
+            cache_key = (upload.sha256, "analyze", no_falsetto)
+            result = _result_cache.get(cache_key)
+            if result is not None:
+                logger.info("[2/2] 同一ファイルの解析結果を再利用")
+                result = copy.deepcopy(result)
+            else:
+                logger.info("[2/2] 音域解析実行中...")
+                # CREPE・音域解析は同期の CPU 処理なので、イベントループ（WS / SSE も担当）を止めないよう
+                # スレッドプールで実行する
+                result = await run_in_threadpool(_analyze_array, upload.audio, upload.sr, no_falsetto=no_falsetto)
+                if "error" not in result:
+                    _result_cache.set(cache_key, copy.deepcopy(result))
+
+            # 2. その result におすすめ曲などを追加する
+            with trace_stage("enrich_result"):
+                result = await run_in_threadpool(_enrich_result, result, user)
+
+            # 3. 最後に、完全な result を使って履歴を保存する
+            if user and not result.get("error"):
+                with trace_stage("save_history"):
+                    await run_in_threadpool(_save_history, user, result, "microphone", file.filename)
+
+            elapsed_time = time.time() - start_time
+            logger.info("アカペラ音源分析完了 (処理時間: %.2f秒)", elapsed_time)
+
+            if debug:
+                result["timings"] = trace.to_dict()
+            return result
+
+        except UploadRejected as e:
+            logger.warning("アップロードを拒否: %s", e)
+            return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+        except Exception as e:
+            elapsed_time = time.time() - start_time
+            logger.exception("アカペラ音源分析エラー (経過時間: %.2f秒)", elapsed_time)
+            return {"error": f"エラーが発生しました: {str(e)}"}
+
+
+def _karaoke_cache_key(sha256: str, no_falsetto: bool, user_regions) -> tuple:
+    return (sha256, "analyze_karaoke", no_falsetto, tuple(user_regions) if user_regions else None)
+
+
+def _run_karaoke_pipeline(upload, no_falsetto: bool, user_regions) -> dict:
+    """ボーカル区間推定 → Demucs 分離 → 音域解析（おすすめ曲などを付ける前の結果）"""
+    regions = user_regions
+    if regions is None and VOCAL_REGION_DETECTION:
+        report_progress("detect_vocal_regions")
+        with trace_stage("detect_vocal_regions"):
+            regions = _detect_vocal_regions(upload.audio, upload.sr)
+
+    # ボーカルは 16kHz モノラルで返るので、解析側での読込・モノラル化・リサンプルは不要
+    logger.info("[2/3] Demucsボーカル分離実行中...")
+    report_progress("separate_vocals")
+    with trace_stage("separate_vocals"):
+        vocals = _separate_vocals_array(upload.audio, upload.sr, ultra_fast_mode=True,
+                                        regions=regions)
+    upload.audio = None   # ミックス音源はもう使わない（メモリを早めに解放）
+
+    logger.info("[3/3] 音域解析実行中...")
+    return _analyze_array(vocals, CREPE_SR, already_separated=True, no_falsetto=no_falsetto)
+
+
+def _run_karaoke_preview(upload, no_falsetto: bool, user_regions) -> dict:
+    """
+    速報: いちばん歌が詰まった ANALYSIS_PREVIEW_SECONDS 秒だけを分離し、CREPE の hop を
+    ANALYSIS_PREVIEW_HOP_FACTOR 倍に間引いて解析する（結果の形は通常の解析と同じ）
+    """
+    from vocal_regions import best_window
+
+    report_progress("preview_window")
+    with trace_stage("preview_window"):
+        start, end = best_window(upload.audio, upload.sr, ANALYSIS_PREVIEW_SECONDS, user_regions)
+    logger.info("速報解析: %.1f〜%.1f秒", start, end)
+    mix = upload.audio[int(start * upload.sr):int(end * upload.sr)]
+    report_progress("separate_vocals")
+    with trace_stage("preview_separate"):
+        vocals = _separate_vocals_array(mix, upload.sr, ultra_fast_mode=True)
+    with trace_stage("preview_analyze"):
+        return _analyze_array(vocals, CREPE_SR, already_separated=True, no_falsetto=no_falsetto,
+                              hop_length=CREPE_HOP_LENGTH * ANALYSIS_PREVIEW_HOP_FACTOR)
+
+
+@router.post("/analyze-karaoke")
+async def analyze_karaoke(
+    file: UploadFile = File(...),
+    no_falsetto: bool = Form(False),
+    debug: bool = Form(False),
+    vocal_ranges: str | None = Form(None),
+    user: dict | None = Depends(get_optional_user),
+):
+    """カラオケ音源用 (Demucsあり)。ログイン済みなら履歴に自動保存
+
+    debug=True の場合、ステージ別の処理時間を result["timings"] に含める。
+    vocal_ranges（例: "0:45-1:30,2:10-3:00"）を指定するとその区間だけを分離・解析する。
+    未指定ならミックス音源から歌っている区間を推定する（VOCAL_REGION_DETECTION=0 で曲全体）。
+    """
+    start_time = time.time()
+    logger.info("カラオケ音源分析リクエスト受信: %s", file.filename)
+    try:
+        user_regions = parse_time_ranges(vocal_ranges)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    with start_trace("analyze_karaoke") as trace, ANALYSIS_IN_FLIGHT.track_inprogress(endpoint="analyze_karaoke"):
+        try:
+            # Demucs 用に 44.1kHz ステレオの float32 配列として受け取る（WAV は書かない）
+            logger.info("[1/3] アップロード受信・高品質デコード中...")
+            with trace_stage("ingest_upload"):
+                upload = await ingest_upload_array(file, output_dir=UPLOAD_DIR,
+                                                   sr=DEMUCS_SR, channels=2)
+            logger.info("デコード完了: %.1f秒", len(upload.audio) / upload.sr)
+
+            cache_key = _karaoke_cache_key(upload.sha256, no_falsetto, user_regions)
+            result = _result_cache.get(cache_key)
+            if result is not None:
+                logger.info("[2/3] 同一ファイルの解析結果を再利用（ボーカル分離・解析を省略）")
+                result = copy.deepcopy(result)
+            else:
+                result = await run_in_threadpool(_run_karaoke_pipeline, upload, no_falsetto, user_regions)
+                if "error" not in result:
+                    _result_cache.set(cache_key, copy.deepcopy(result))
+
+            # 2. その result におすすめ曲などを追加する
+            with trace_stage("enrich_result"):
+                result = await run_in_threadpool(_enrich_result, result, user)
+
+            # 3. 最後に、完全な result を使って履歴を保存する
+            if user and not result.get("error"):
+                with trace_stage("save_history"):
+                    await run_in_threadpool(_save_history, user, result, "karaoke", file.filename)
+
+            elapsed_time = time.time() - start_time
+            minutes = int(elapsed_time // 60)
+            seconds = int(elapsed_time % 60)
+            time_str = f"{minutes}分{seconds}秒" if minutes > 0 else f"{seconds}秒"
+            logger.info("カラオケ音源分析完了 (処理時間: %s)", time_str)
+            if elapsed_time > 240:
+                logger.warning("処理時間が長いです (%s)", time_str)
+
+            if debug:
+                result["timings"] = trace.to_dict()
+            return result
+
+        except UploadRejected as e:
+            logger.warning("アップロードを拒否: %s", e)
+            return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+        except Exception as e:
+            logger.exception("カラオケ音源分析エラー")
+            return {"error": f"処理中にエラーが発生しました: {str(e)}"}
+
+
+# ============================================================
+# 解析ジョブ（速報 → 最終結果）
+# ============================================================
+
+# パイプラインのステージ → 1回の解析（速報 or 本解析）の中での進捗範囲（%、おおよその処理時間の比）
+_STAGE_SPANS = {
+    "preview_window":       (0, 5),
+    "detect_vocal_regions": (0, 5),
+    "separate_vocals":      (5, 55),
+    "preprocess":           (55, 58),
+    "pitch_detection":      (58, 80),
+    "filter_frames":        (80, 82),
+    "register_filter":      (82, 84),
+    "classify_frames":      (84, 98),
+    "build_result":         (98, 100),
+}
+_PREVIEW_SHARE = 15   # ジョブ全体の進捗のうち速報に割り当てる割合（%）
+
+
+class _JobProgress:
+    """report_progress の通知 → jobs.db の stage / progress
+
+    ステージが変わったときと 1% 以上進んだときだけ書き込む。progress は戻らない。
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.low, self.high = 0.0, 100.0
+        self.stage: str | None = None
+        self.percent = 0.0
+
+    def phase(self, low: float, high: float) -> None:
+        """以降のステージを全体の low〜high% に割り当てる"""
+        self.low, self.high = low, high
+
+    def __call__(self, stage: str, fraction: float) -> None:
+        start, end = _STAGE_SPANS.get(stage, (0, 0))
+        percent = self.low + (self.high - self.low) * (start + (end - start) * fraction) / 100
+        percent = max(percent, self.percent)
+        if stage == self.stage and percent - self.percent < 1:
+            return
+        self.stage, self.percent = stage, percent
+        update_job(self.job_id, stage=stage, progress=round(percent, 1))
+
+
+def _run_karaoke_job(job_id: str, upload, no_falsetto: bool, user_regions,
+                     user: dict | None, file_name: str | None) -> None:
+    """ジョブ実行スレッド: 速報（preview）を書き込んでから通常の解析結果（result）を書き込む"""
+    tracker = _JobProgress(job_id)
+    with start_trace("analyze_karaoke_job"), progress_reporter(tracker), \
+            ANALYSIS_IN_FLIGHT.track_inprogress(endpoint="analyze_karaoke_job"):
+        try:
+            update_job(job_id, status=jobs.RUNNING)
+            cache_key = _karaoke_cache_key(upload.sha256, no_falsetto, user_regions)
+            result = _result_cache.get(cache_key)
+            if result is not None:
+                logger.info("同一ファイルの解析結果を再利用（速報を省略）")
+                result = copy.deepcopy(result)
+            else:
+                tracker.phase(0, _PREVIEW_SHARE)
+                try:
+                    preview = _run_karaoke_preview(upload, no_falsetto, user_regions)
+                    if "error" not in preview:
+                        preview = _enrich_result(preview, user)
+                        preview["provisional"] = True
+                        update_job(job_id, status=jobs.PREVIEW, preview=jsonable_encoder(preview))
+                except Exception:
+                    logger.exception("速報解析に失敗（通常の解析は続行）")
+
+                tracker.phase(_PREVIEW_SHARE, 100)
+                result = _run_karaoke_pipeline(upload, no_falsetto, user_regions)
+                if "error" not in result:
+                    _result_cache.set(cache_key, copy.deepcopy(result))
+
+            if "error" in result:
+                update_job(job_id, status=jobs.ERROR, stage=None, error=result["error"])
+                return
+            result = _enrich_result(result, user)
+            if user:
+                _save_history(user, result, "karaoke", file_name)
+            update_job(job_id, status=jobs.DONE, stage=None, progress=100, result=jsonable_encoder(result))
+        except Exception as e:
+            logger.exception("解析ジョブエラー: %s", job_id)
+            update_job(job_id, status=jobs.ERROR, stage=None, error=f"処理中にエラーが発生しました: {str(e)}")
+
+
+@router.post("/analyze-karaoke/jobs", status_code=202)
+async def start_karaoke_job(
+    file: UploadFile = File(...),
+    no_falsetto: bool = Form(False),
+    vocal_ranges: str | None = Form(None),
+    user: dict | None = Depends(get_optional_user),
+):
+    """/analyze-karaoke のジョブ版。アップロードを受け取ったらすぐ job_id を返す
+    （このワーカーの実行中＋待機中のジョブが ANALYSIS_JOB_MAX_PENDING 件に達していれば 503）
+
+    GET /analysis-jobs/{job_id} で、まず preview（provisional: true の暫定結果）、
+    続いて result（通常の解析結果。/analyze-karaoke の応答と同じ形）が取れる。
+    """
+    logger.info("カラオケ音源分析ジョブ受付: %s", file.filename)
+    try:
+        user_regions = parse_time_ranges(vocal_ranges)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    # 待機中のジョブもデコード済みの音声を持つので、枠が無ければデコードする前に断る
+    if not jobs.reserve_slot():
+        logger.warning("解析ジョブが混雑しているため受付を拒否")
+        return JSONResponse(status_code=503, content={"error": "解析が混み合っています。しばらくしてからお試しください"},
+                            headers={"Retry-After": "30"})
+    submitted = False
+    try:
+        try:
+            with trace_stage("ingest_upload"):
+                upload = await ingest_upload_array(file, output_dir=UPLOAD_DIR, sr=DEMUCS_SR, channels=2)
+        except UploadRejected as e:
+            logger.warning("アップロードを拒否: %s", e)
+            return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+
+        job_id = await run_in_threadpool(create_job, "analyze_karaoke", user["id"] if user else None)
+        # リクエストIDをジョブのログにも載せる
+        ctx = contextvars.copy_context()
+        jobs.submit(ctx.run, _run_karaoke_job, job_id, upload, no_falsetto, user_regions,
+                    user, file.filename)
+        submitted = True
+        return {"job_id": job_id, "status": jobs.QUEUED}
+    finally:
+        if not submitted:
+            jobs.release_slot()
+
+
+def _get_own_job(job_id: str, user: dict | None) -> dict:
+    """ジョブを取得（ログイン中に作ったジョブは本人だけが見られる。それ以外は 404）"""
+    job = get_job(job_id)
+    if job is None or (job["user_id"] and (not user or user["id"] != job["user_id"])):
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return job
+
+
+@router.get("/analysis-jobs/{job_id}")
+async def get_analysis_job(job_id: str, user: dict | None = Depends(get_optional_user)):
+    """ジョブの状態・速報・最終結果"""
+    return jobs.public_view(_get_own_job(job_id, user))
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _job_events(request: Request, job_id: str):
+    """
+    jobs.db を ANALYSIS_JOB_EVENT_POLL_SECONDS ごとに確認し、変化があればイベントを送る:
+      progress  {"status", "stage", "progress"}   状態・ステージ・進捗(%)が変わったとき
+      preview   速報の解析結果                   1回だけ
+      done      最終結果                         送ったら終了
+      error     {"error": ...}                   送ったら終了
+    変化が無い間も ANALYSIS_JOB_EVENT_KEEPALIVE_SECONDS ごとにコメント行を送り、プロキシに切られないようにする。
+    """
+    last_progress = None
+    preview_sent = False
+    last_sent = time.monotonic()
+    while not await request.is_disconnected():
+        job = await run_in_threadpool(get_job, job_id)
+        if job is None:   # 期限切れで削除された
+            yield _sse("error", {"error": "ジョブが見つかりません"})
+            return
+        chunks = []
+        progress = {"status": job["status"], "stage": job["stage"], "progress": job["progress"]}
+        if progress != last_progress:
+            chunks.append(_sse("progress", progress))
+            last_progress = progress
+        if job["preview"] is not None and not preview_sent:
+            chunks.append(_sse("preview", job["preview"]))
+            preview_sent = True
+        if job["status"] == jobs.DONE:
+            chunks.append(_sse("done", job["result"]))
+        elif job["status"] == jobs.ERROR:
+            chunks.append(_sse("error", {"error": job["error"]}))
+
+        if chunks:
+            yield "".join(chunks)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= ANALYSIS_JOB_EVENT_KEEPALIVE_SECONDS:
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+        if job["status"] in jobs.FINISHED:
+            return
+        await asyncio.sleep(ANALYSIS_JOB_EVENT_POLL_SECONDS)
+
+
+@router.get("/analysis-jobs/{job_id}/events")
+async def stream_analysis_job(job_id: str, request: Request,
+                              user: dict | None = Depends(get_optional_user)):
+    """ジョブの進捗を Server-Sent Events で送る（完了・エラーで接続を閉じる）"""
+    _get_own_job(job_id, user)
+    return StreamingResponse(
+        _job_events(request, job_id),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx にこのレスポンスをバッファさせない
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ============================================================
+# リアルタイム音高解析（WebSocket）
+# ============================================================
+
+LIVE_STREAMS = gauge("live_pitch_streams", "接続中のリアルタイム音高解析ストリーム数")
+_live_stream_count = 0   # このワーカーの接続数（イベントループ上でだけ増減する）
+
+
+def _new_live_session(no_falsetto: bool):
+    """live_pitch.LivePitchSession の遅延ロード版（初回接続時に torch 等を import）"""
+    from live_pitch import LivePitchSession
+    return LivePitchSession(no_falsetto=no_falsetto)
+
+
+@router.websocket("/ws/live-pitch")
+async def live_pitch(websocket: WebSocket, no_falsetto: bool = False, sample_format: str = "f32"):
+    """
+    マイクの 16kHz モノラル PCM（バイナリメッセージ。sample_format=f32: float32 LE / s16: int16 LE）を
+    受け取りながら解析し、LIVE_PITCH_SUMMARY_SECONDS ごとに {"type": "summary", ...} を返す。
+    テキストメッセージ "end" で残りを解析して {"type": "final", ...} を返し、接続を閉じる。
+    サマリーのキーは /analyze の結果と同じ（overall_min, chest_max, falsetto_max, ...）に
+    seconds / voiced_frames / current_hz / current_note を加えたもの。
+    """
+    global _live_stream_count
+    await websocket.accept()
+    if sample_format not in ("f32", "s16"):
+        await websocket.send_json({"type": "error", "error": "sample_format は f32 か s16 です"})
+        await websocket.close(code=1003)
+        return
+    if _live_stream_count >= LIVE_PITCH_MAX_STREAMS:
+        await websocket.send_json({"type": "error", "error": "混み合っています。しばらくしてからお試しください"})
+        await websocket.close(code=1013)
+        return
+
+    _live_stream_count += 1
+    session = None
+    try:
+        with LIVE_STREAMS.track_inprogress():
+            from live_pitch import LiveSessionFull, decode_pcm
+
+            session = await run_in_threadpool(_new_live_session, no_falsetto)
+            last_summary = time.monotonic()
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                data, text = message.get("bytes"), message.get("text")
+                if data:
+                    if len(data) > LIVE_PITCH_MAX_MESSAGE_BYTES:
+                        await websocket.close(code=1009)
+                        return
+                    try:
+                        await run_in_threadpool(session.feed, decode_pcm(data, sample_format))
+                    except LiveSessionFull:
+                        text = "end"
+                    except ValueError as e:
+                        await websocket.send_json({"type": "error", "error": str(e)})
+                        await websocket.close(code=1003)
+                        return
+                    if text != "end" and time.monotonic() - last_summary >= LIVE_PITCH_SUMMARY_SECONDS:
+                        summary = await run_in_threadpool(session.summary)
+                        await websocket.send_json({"type": "summary", **summary})
+                        last_summary = time.monotonic()
+                if text == "end":
+                    await run_in_threadpool(session.flush)
+                    summary = await run_in_threadpool(session.summary)
+                    await websocket.send_json({"type": "final", **summary})
+                    await websocket.close()
+                    return
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        logger.exception("リアルタイム解析エラー")
+        try:
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        _live_stream_count -= 1
+        if session is not None:
+            session.close()
+
+
+def preload_analysis_stack():
+    """解析スタックの import・MLモデルのロード・CREPEの初期化を先に済ませる（解析ワーカー起動時）"""
+    start_time = time.time()
+    import analyzer
+    import vocal_separator
+    analyzer.warmup()
+    vocal_separator.preload_model(ultra_fast_mode=True)
+    logger.info("解析スタックを事前ロードしました (%.1f秒)", time.time() - start_time)
+
+
+app = create_app("Voice Range Analysis API", router, on_startup=[init_jobs_db, preload_analysis_stack])
@@ -0,0 +1,183 @@
+"""
+analysis_jobs.py — 解析ジョブの状態管理
+
+時間のかかる解析（カラオケ音源）をバックグラウンドで実行し、クライアントは job_id で
+状態・速報（preview）・最終結果（result）を取りに来る。
+
+状態は jobs.db（SQLite）に置く。解析 API は uvicorn の複数ワーカーで動くため、
+ジョブを実行したワーカーとポーリングを受けたワーカーが違っても同じ状態が見える。
+終了から ANALYSIS_JOB_TTL 秒経ったジョブは新しいジョブの作成時に削除する。
+ANALYSIS_JOB_STALE_SECONDS 秒更新の無い未終了のジョブ（実行中にワーカーが再起動した等）は、
+ワーカー起動時・ジョブの作成時・参照時に error にする。
+
+ジョブはワーカープロセスごとのスレッドで実行し、実行中＋待機中は ANALYSIS_JOB_MAX_PENDING 件までとする
+（reserve_slot で枠を取ってから submit する。枠が無ければ呼び出し側が 503 を返す）。
+
+status の遷移: queued → running → (preview) → done / error
+実行中は stage（パイプラインのステージ名）と progress（全体の進み具合 0〜100）を随時更新する。
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from config import ANALYSIS_JOB_TTL, ANALYSIS_JOB_WORKERS, ANALYSIS_JOB_MAX_PENDING, ANALYSIS_JOB_STALE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB_PATH = os.path.join(os.path.dirname(__file__), "jobs.db")
+
+QUEUED, RUNNING, PREVIEW, DONE, ERROR = "queued", "running", "preview", "done", "error"
+FINISHED = (DONE, ERROR)
+
+_JSON_FIELDS = ("preview", "result")
+
+# ジョブ本体を実行するスレッド（CPU を使う解析なので、ワーカープロセスあたりの同時実行数を絞る）
+executor = ThreadPoolExecutor(max_workers=max(1, ANALYSIS_JOB_WORKERS), thread_name_prefix="analysis-job")
+# 実行中＋待機中のジョブの枠（待機中のジョブも音声を持つので、executor のキューを無制限にしない）
+_slots = threading.BoundedSemaphore(max(1, ANALYSIS_JOB_MAX_PENDING))
+
+_STALE_MESSAGE = "ジョブが中断されました（サーバーの再起動など）。もう一度アップロードしてください"
+
+
+def reserve_slot() -> bool:
+    """ジョブの枠を1つ取る（空きが無ければ False）。submit しなかった場合は release_slot で返す"""
+    return _slots.acquire(blocking=False)
+
+
+def release_slot() -> None:
+    _slots.release()
+
+
+def submit(fn, *args) -> None:
+    """reserve_slot で取った枠でジョブを実行する（終了時に枠を返す）"""
+    future = executor.submit(fn, *args)
+    future.add_done_callback(lambda _future: _slots.release())
+
+
+def _connect(db_path: str = JOBS_DB_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_jobs_db(db_path: str = JOBS_DB_PATH) -> None:
+    """jobs テーブルを作成（ワーカー起動時）"""
+    conn = _connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")   # ポーリングの読み込みがジョブの書き込みを待たない
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                user_id TEXT,
+                status TEXT NOT NULL,
+                stage TEXT,
+                progress REAL NOT NULL DEFAULT 0,
+                preview TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_updated_at ON jobs(updated_at);
+        """)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "progress" not in columns:   # progress 列が無い頃の jobs.db
+            conn.execute("ALTER TABLE jobs ADD COLUMN progress REAL NOT NULL DEFAULT 0")
+        _fail_stale(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _purge_expired(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        f"DELETE FROM jobs WHERE status IN ({','.join('?' * len(FINISHED))}) AND updated_at < ?",
+        (*FINISHED, time.time() - ANALYSIS_JOB_TTL),
+    )
+
+
+def _fail_stale(conn: sqlite3.Connection, job_id: Optional[str] = None) -> None:
+    """更新が ANALYSIS_JOB_STALE_SECONDS 秒止まっている未終了のジョブを error にする（job_id 指定でその1件だけ）"""
+    now = time.time()
+    query = (f"UPDATE jobs SET status = ?, stage = NULL, error = ?, updated_at = ? "
+             f"WHERE status NOT IN ({','.join('?' * len(FINISHED))}) AND updated_at < ?")
+    params = [ERROR, _STALE_MESSAGE, now, *FINISHED, now - ANALYSIS_JOB_STALE_SECONDS]
+    if job_id is not None:
+        query += " AND id = ?"
+        params.append(job_id)
+    if conn.execute(query, params).rowcount and job_id is None:
+        logger.warning("止まったままの解析ジョブを error にしました")
+
+
+def create_job(kind: str, user_id: Optional[str] = None) -> str:
+    """ジョブを作成して job_id を返す"""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = _connect()
+    try:
+        _purge_expired(conn)
+        _fail_stale(conn)
+        conn.execute(
+            "INSERT INTO jobs (id, kind, user_id, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, kind, user_id, QUEUED, now, now),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return job_id
+
+
+def update_job(job_id: str, **fields) -> None:
+    """status / stage / progress / preview / result / error を更新（preview・result は dict のまま渡す）"""
+    for key in _JSON_FIELDS:
+        if key in fields and fields[key] is not None:
+            fields[key] = json.dumps(fields[key], ensure_ascii=False)
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{key} = ?" for key in fields)
+    conn = _connect()
+    try:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """ジョブの状態（preview・result は dict に戻す）。存在しなければ None"""
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if (row is not None and row["status"] not in FINISHED
+                and row["updated_at"] < time.time() - ANALYSIS_JOB_STALE_SECONDS):
+            _fail_stale(conn, job_id)
+            conn.commit()
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    job = dict(row)
+    for key in _JSON_FIELDS:
+        if job[key] is not None:
+            job[key] = json.loads(job[key])
+    return job
+
+
+def public_view(job: dict) -> dict:
+    """クライアントに返す形（user_id などの内部項目を除く）"""
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job["progress"],
+        "preview": job["preview"],
+        "result": job["result"],
+        "error": job["error"],
+    }
@@ -1,10 +1,16 @@
+import logging
 import numpy as np
-import soundfile as sf
 import torch
 import torchcrepe
-import librosa
-from register_classifier import classify_register, new_register_stats, print_register_summary
+from math import gcd
+from scipy.signal import resample_poly
+from register_classifier import (
+    classify_registers, new_register_stats, print_register_summary, record_register_metrics,
+)
 from note_converter import hz_to_label_and_hz
+from audio_converter import decode_to_array
+from tracing import trace_stage
+from progress import report_progress
 from config import (
     VOICE_MIN_HZ, VOICE_MAX_HZ, CREPE_SR, CREPE_HOP_LENGTH,
     FALSETTO_DISPLAY_MIN_HZ, CONF_THRESHOLDS, CONF_MIN_FRAMES,
@@ -17,8 +23,11 @@ from config import (
     MIN_SUSTAIN_FRAMES,
     FALSETTO_MIN_CONSECUTIVE, FALSETTO_MIN_RATIO, FALSETTO_RMS_RATIO,
     FALSETTO_RESCUE_SEMITONES,
+    REGISTER_BATCH_FRAMES,
 )
 
+logger = logging.getLogger(__name__)
+
 
 # ============================================================
 # fix_octave_errors
@@ -33,23 +42,29 @@ def fix_octave_errors(f0: np.ndarray, conf: np.ndarray) -> np.ndarray:
     reference = np.median(f0[hc]) if hc.sum() >= 5 else np.median(f0)
 
     for i, freq in enumerate(f0_fixed):
-        if freq <= 0:
-            continue
-        # 高音保護: 中央値の1.5倍以上かつ人声範囲内かつ高信頼度 → 正当な高音跳躍なので補正しない
-        # ノイズフレーム(conf<0.5)は保護せずオクターブ補正の対象に残す
-        if freq > reference * 1.5 and VOICE_MIN_HZ <= freq <= VOICE_MAX_HZ and conf[i] >= 0.5:
-            continue
-        doubled, halved = freq * 2, freq / 2
-        can_up   = VOICE_MIN_HZ <= doubled <= VOICE_MAX_HZ
-        can_down = VOICE_MIN_HZ <= halved  <= VOICE_MAX_HZ
-        d_orig   = abs(freq    - reference)
-        d_up     = abs(doubled - reference) if can_up   else float('inf')
-        d_down   = abs(halved  - reference) if can_down else float('inf')
-        if can_up   and d_up   < d_orig and d_up   < d_down: f0_fixed[i] = doubled
-        elif can_down and d_down < d_orig and d_down < d_up:  f0_fixed[i] = halved
+        f0_fixed[i] = fix_octave_error(freq, conf[i], reference)
     return f0_fixed
 
 
+def fix_octave_error(freq: float, conf: float, reference: float) -> float:
+    """1フレーム分のオクターブ補正（reference に近いほうへ 2倍 / 1/2 にする）"""
+    if freq <= 0:
+        return freq
+    # 高音保護: 中央値の1.5倍以上かつ人声範囲内かつ高信頼度 → 正当な高音跳躍なので補正しない
+    # ノイズフレーム(conf<0.5)は保護せずオクターブ補正の対象に残す
+    if freq > reference * 1.5 and VOICE_MIN_HZ <= freq <= VOICE_MAX_HZ and conf >= 0.5:
+        return freq
+    doubled, halved = freq * 2, freq / 2
+    can_up   = VOICE_MIN_HZ <= doubled <= VOICE_MAX_HZ
+    can_down = VOICE_MIN_HZ <= halved  <= VOICE_MAX_HZ
+    d_orig   = abs(freq    - reference)
+    d_up     = abs(doubled - reference) if can_up   else float('inf')
+    d_down   = abs(halved  - reference) if can_down else float('inf')
+    if can_up   and d_up   < d_orig and d_up   < d_down: return doubled
+    if can_down and d_down < d_orig and d_down < d_up:  return halved
+    return freq
+
+
 # ============================================================
 # remove_unrealistic_range
 # 非対称フィルタ: 下限は厳格（サブハーモニクス除去）、上限は緩和（高音保持）
@@ -59,12 +74,24 @@ def remove_unrealistic_range(f0: np.ndarray, conf: np.ndarray) -> tuple:
         return f0.copy(), conf.copy()
     hc     = conf >= 0.3
     median = np.median(f0[hc]) if hc.sum() >= 3 else np.median(f0)
-    lower_factor = 2 ** UNREALISTIC_LOWER_OCT
-    upper_factor = 2 ** UNREALISTIC_UPPER_OCT
-    mask = (f0 >= median / lower_factor) & (f0 <= median * upper_factor)
+    lower, upper = realistic_bounds(median)
+    mask = (f0 >= lower) & (f0 <= upper)
     return f0[mask], conf[mask]
 
 
+def realistic_bounds(median: float) -> tuple:
+    """中央値から見て現実的な音域 (下限Hz, 上限Hz)"""
+    return median / 2 ** UNREALISTIC_LOWER_OCT, median * 2 ** UNREALISTIC_UPPER_OCT
+
+
+def weighted_median(values: np.ndarray, weights: np.ndarray) -> float:
+    """重み付き中央値（重みの累積が半分を超える最初の値）"""
+    sort_idx = np.argsort(values)
+    cum      = np.cumsum(weights[sort_idx])
+    mid_idx  = np.searchsorted(cum, cum[-1] / 2)
+    return values[sort_idx[mid_idx]]
+
+
 # ============================================================
 # remove_isolated_extremes
 # 孤立した極端な高音フレームを除去（ノイズ対策の最終防衛線）
@@ -91,7 +118,8 @@ def remove_isolated_extremes(notes, min_neighbors=4):
         else:
             removed += 1
     if removed > 0:
-        print(f"[DEBUG] 孤立フレーム除去: {removed}フレーム削除 (閾値={high_threshold:.1f}Hz以上, 近傍{min_neighbors}未満)")
+        logger.debug("孤立フレーム除去: %sフレーム削除 (閾値=%.1fHz以上, 近傍%s未満)",
+                     removed, high_threshold, min_neighbors)
     return result if result else notes  # 全除去を防止
 
 
@@ -110,8 +138,8 @@ def remove_statistical_outliers(notes, percentile=97, max_semitones_gap=6):
     result = [f for f in notes if f <= threshold]
     removed = len(notes) - len(result)
     if removed > 0:
-        print(f"[DEBUG] 統計外れ値除去: {removed}フレーム削除 "
-              f"(参照P{percentile}={ref:.1f}Hz, 閾値={threshold:.1f}Hz)")
+        logger.debug("統計外れ値除去: %sフレーム削除 (参照P%s=%.1fHz, 閾値=%.1fHz)",
+                     removed, percentile, ref, threshold)
     return result if result else notes  # 全除去を防止
 
 
@@ -173,7 +201,7 @@ def check_octave_by_spectrum(y_seg: np.ndarray, sr: int, candidate_hz: float) ->
     ratio = e_doubled / e_candidate
     # doubled が candidate より明確に強い場合のみ補正（閾値1.2）
     if ratio >= 1.2:
-        print(f"[DEBUG] 最高音オクターブ修正: {candidate_hz:.1f}→{doubled:.1f}Hz ratio={ratio:.2f}")
+        logger.debug("最高音オクターブ修正: %.1f→%.1fHz ratio=%.2f", candidate_hz, doubled, ratio)
         return doubled
     return candidate_hz
 
@@ -222,9 +250,8 @@ def get_min_max_from_crepe(f0: np.ndarray, conf: np.ndarray,
             break
     overall_min = float(np.min(f0[mask_min]))
 
-    print(f"[DEBUG] max_th={max_th:.2f} min_th={min_th:.2f} "
-          f"max_frames={mask_max.sum()} min_frames={mask_min.sum()} "
-          f"raw_min={overall_min:.1f} raw_max={raw_max:.1f}")
+    logger.debug("max_th=%.2f min_th=%.2f max_frames=%s min_frames=%s raw_min=%.1f raw_max=%.1f",
+                 max_th, min_th, mask_max.sum(), mask_min.sum(), overall_min, raw_max)
     return overall_min, raw_max
 
 
@@ -244,13 +271,13 @@ def run_crepe(audio_tensor, sr, hop_length, device, model_size='tiny'):
         ("none",            None),
     ]:
         try:
-            print(f"[DEBUG] デコーダー '{name}' で試行中...")
+            logger.debug("デコーダー '%s' で試行中...", name)
             kw = {**common, "decoder": get_dec()} if get_dec else common
             f0, conf = torchcrepe.predict(**kw)
-            print(f"[INFO] ✅ CREPE ({model_size}, {name}) 成功")
+            logger.info("CREPE (%s, %s) 成功", model_size, name)
             return f0, conf
         except (AttributeError, TypeError) as e:
-            print(f"[WARN] ⚠️ decoder={name} 失敗: {e}")
+            logger.warning("decoder=%s 失敗: %s", name, e)
         except Exception:
             raise
     raise RuntimeError("torchcrepe: 全デコーダーで失敗")
@@ -261,46 +288,67 @@ def run_crepe(audio_tensor, sr, hop_length, device, model_size='tiny'):
 # ============================================================
 
 def _load_audio(wav_path: str) -> dict:
-    """WAV読込+バリデーション → dict(y, sr) or dict(error)"""
-    print(f"\n{'='*60}")
-    print(f"[INFO] 🎵 分析開始: {wav_path}")
-    print(f"{'='*60}")
+    """音声ファイルを ffmpeg で 16kHz モノラルの float32 配列にデコード → dict(y, sr) or dict(error)"""
+    logger.info("分析開始: %s", wav_path)
 
-    print(f"[STEP 1/7] 📁 WAVファイル読み込み中...")
+    logger.info("[STEP 1/7] 音声ファイル読み込み中...")
+    report_progress("load_audio")
     try:
-        y, sr = sf.read(wav_path)
-        if len(y.shape) > 1:
-            print(f"[INFO] ステレオをモノラルに変換中...")
-            y = np.mean(y, axis=1)
-        y = y.astype(np.float32)
+        y, sr = decode_to_array(wav_path, sr=CREPE_SR, channels=1)
     except Exception as e:
         return {"error": f"WAVファイルの読み込みに失敗しました: {str(e)}"}
+    return {"y": y, "sr": sr}
+
+
+def _validate_audio(y: np.ndarray, sr: int) -> dict:
+    """モノラル化+長さ・音量のバリデーション → dict(y, sr) or dict(error)"""
+    if y.ndim > 1:
+        logger.info("ステレオをモノラルに変換中...")
+        y = np.mean(y, axis=1)
+    y = y.astype(np.float32, copy=False)
 
     duration = len(y) / sr
-    print(f"[DEBUG] ✅ 読込完了: SR={sr}, duration={duration:.2f}s, max={np.max(np.abs(y)):.4f}")
+    peak = float(np.max(np.abs(y))) if len(y) else 0.0
+    logger.debug("読込完了: SR=%s, duration=%.2fs, max=%.4f", sr, duration, peak)
 
     if duration < 0.3:
         return {"error": "音声が短すぎます（0.3秒以上必要）。"}
-    if np.max(np.abs(y)) < 0.0001:
+    if peak < 0.0001:
         return {"error": "音が小さすぎます（ほぼ無音）。"}
 
     return {"y": y, "sr": sr}
 
 
-def _preprocess(y: np.ndarray, sr: int) -> dict:
-    """正規化+リサンプル+テンソル → dict(y_16k, sr_crepe, hop_length, device, audio_tensor)"""
-    print(f"\n[STEP 2/7] 🔧 音声前処理中...")
-    print(f"[INFO] 音量正規化中... (目標: 0.95)")
-    y = y / (np.max(np.abs(y)) + 1e-8) * 0.95
+def _resample(y: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+    """ポリフェーズ・リサンプル（44.1kHz → 16kHz は 160/441）。float32 のまま返す"""
+    g = gcd(int(orig_sr), int(target_sr))
+    return resample_poly(y, target_sr // g, orig_sr // g).astype(np.float32, copy=False)
+
+
+def _preprocess(y: np.ndarray, sr: int, hop_length: int = CREPE_HOP_LENGTH) -> dict:
+    """正規化+リサンプル+テンソル → dict(y_16k, sr_crepe, hop_length, device, audio_tensor)
+
+    y はその場で正規化する（呼び出し側の配列を書き換える）。16kHz の入力は
+    y_16k・audio_tensor ともに y と同じメモリを共有し、コピーを作らない。
+    """
+    logger.info("[STEP 2/7] 音声前処理中...")
+    report_progress("preprocess")
+    logger.info("音量正規化中... (目標: 0.95)")
+    if not y.flags.writeable:
+        y = y.copy()
+    y *= 0.95 / (np.max(np.abs(y)) + 1e-8)
 
     sr_crepe   = CREPE_SR
-    print(f"[INFO] リサンプリング中: {sr}Hz → {sr_crepe}Hz")
-    y_16k      = librosa.resample(y, orig_sr=sr, target_sr=sr_crepe) if sr != sr_crepe else y.copy()
-    hop_length = CREPE_HOP_LENGTH
+    if sr != sr_crepe:
+        logger.info("リサンプリング中: %sHz → %sHz", sr, sr_crepe)
+        y_16k = _resample(y, sr, sr_crepe)
+    else:
+        y_16k = y
+    y_16k      = np.ascontiguousarray(y_16k)
     device     = 'cuda' if torch.cuda.is_available() else 'cpu'
-    print(f"[INFO] デバイス: {device.upper()} (hop_length={hop_length})")
-    audio_tensor = torch.tensor(np.copy(y_16k)).unsqueeze(0)
-    print(f"[DEBUG] ✅ 前処理完了: tensor shape={audio_tensor.shape}")
+    logger.info("デバイス: %s (hop_length=%s)", device.upper(), hop_length)
+    audio_tensor = torch.from_numpy(y_16k).unsqueeze(0)
+    logger.debug("前処理完了: tensor shape=%s", audio_tensor.shape)
 
     return {
         "y_16k": y_16k, "sr_crepe": sr_crepe,
@@ -311,37 +359,41 @@ def _preprocess(y: np.ndarray, sr: int) -> dict:
 
 def _run_pitch_detection(audio_tensor, sr: int, hop_length: int, device: str) -> dict:
     """CREPE実行 → dict(f0, conf) or dict(error)"""
-    print(f"\n[STEP 3/7] 🎼 CREPE音高推定中...")
+    logger.info("[STEP 3/7] CREPE音高推定中...")
+    report_progress("pitch_detection")
     f0_raw = conf_raw = None
     for model_size in ['tiny', 'small']:
         try:
-            print(f"[INFO] CREPEモデル '{model_size}' で試行中... (device={device})")
+            logger.info("CREPEモデル '%s' で試行中... (device=%s)", model_size, device)
             f0_raw, conf_raw = run_crepe(audio_tensor, sr, hop_length, device, model_size)
-            print(f"[DEBUG] ✅ CREPE ({model_size}) 成功")
+            logger.debug("CREPE (%s) 成功", model_size)
             break
         except Exception as e:
-            print(f"[ERROR] ❌ CREPE ({model_size}) 失敗: {type(e).__name__}: {e}")
+            logger.error("CREPE (%s) 失敗: %s: %s", model_size, type(e).__name__, e)
 
     if f0_raw is None:
         return {"error": "解析エンジン(CREPE)の実行に失敗しました。"}
 
     f0_np   = f0_raw.squeeze().detach().cpu().numpy()
     conf_np = conf_raw.squeeze().detach().cpu().numpy()
-    print(f"[DEBUG] CREPE完了: frames={len(f0_np)} conf_max={np.max(conf_np):.4f} conf_mean={np.mean(conf_np):.4f}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("CREPE完了: frames=%s conf_max=%.4f conf_mean=%.4f",
+                     len(f0_np), np.max(conf_np), np.mean(conf_np))
 
     return {"f0": f0_np, "conf": conf_np}
 
 
 def _filter_frames(f0_np: np.ndarray, conf_np: np.ndarray) -> dict:
     """フィルタリング+オクターブ補正+中央値 → dict or dict(error)"""
-    print(f"\n[STEP 4/7] 🎯 信頼度フィルタリング中...")
+    logger.info("[STEP 4/7] 信頼度フィルタリング中...")
+    report_progress("filter_frames")
 
     # --- confidence フィルタ ---
     for th in CONF_THRESHOLDS:
         idx = np.where(conf_np >= th)[0]
         if len(idx) >= CONF_MIN_FRAMES:
             valid_indices = idx
-            print(f"[INFO] ✅ 有効フレーム検出: {len(idx)}個 (confidence threshold={th:.2f})")
+            logger.info("有効フレーム検出: %s個 (confidence threshold=%.2f)", len(idx), th)
             break
     else:
         return {"error": f"歌声が検出できませんでした。(conf_max={np.max(conf_np):.4f})"}
@@ -349,44 +401,41 @@ def _filter_frames(f0_np: np.ndarray, conf_np: np.ndarray) -> dict:
     f0_v   = f0_np[valid_indices].copy()
     conf_v = conf_np[valid_indices].copy()
 
-    print(f"[INFO] 人声音域フィルタ適用中 ({VOICE_MIN_HZ}Hz - {VOICE_MAX_HZ}Hz)...")
+    logger.info("人声音域フィルタ適用中 (%sHz - %sHz)...", VOICE_MIN_HZ, VOICE_MAX_HZ)
     # --- 人声絶対範囲 ---
     mask   = (f0_v >= VOICE_MIN_HZ) & (f0_v <= VOICE_MAX_HZ)
     f0_v   = f0_v[mask]
     conf_v = conf_v[mask]
     valid_indices_filtered = valid_indices[mask]
-    print(f"[DEBUG] ✅ 人声範囲内: {len(f0_v)}フレーム")
+    logger.debug("人声範囲内: %sフレーム", len(f0_v))
 
     if len(f0_v) == 0:
         return {"error": "人声の音域範囲内の音が検出できませんでした。"}
 
-    print(f"\n[STEP 5/7] 📊 音域データ処理中...")
+    logger.info("[STEP 5/7] 音域データ処理中...")
+    report_progress("register_filter")
     # --- レジスター判定用フィルタ（min/maxとは独立） ---
-    print(f"[INFO] 異常値除去中 (下{UNREALISTIC_LOWER_OCT}oct / 上{UNREALISTIC_UPPER_OCT}oct)...")
+    logger.info("異常値除去中 (下%soct / 上%soct)...", UNREALISTIC_LOWER_OCT, UNREALISTIC_UPPER_OCT)
     f0_reg, conf_reg = remove_unrealistic_range(f0_v, conf_v)
     if len(f0_reg) == 0:
         return {"error": "有効な音域データが残りませんでした。"}
-    print(f"[DEBUG] ✅ 残留フレーム: {len(f0_reg)}個")
+    logger.debug("残留フレーム: %s個", len(f0_reg))
 
     # remove_unrealistic_range後もvalid_indicesを対応させる
     # ★ 同じ定数を使って再導出（旧コードの 2.0 vs 1.75 不一致を修正）
-    lower_factor = 2 ** UNREALISTIC_LOWER_OCT
-    upper_factor = 2 ** UNREALISTIC_UPPER_OCT
     hc      = conf_v >= 0.3
     median0 = np.median(f0_v[hc]) if hc.sum() >= 3 else np.median(f0_v)
-    reg_mask = (f0_v >= median0 / lower_factor) & (f0_v <= median0 * upper_factor)
+    lower, upper = realistic_bounds(median0)
+    reg_mask = (f0_v >= lower) & (f0_v <= upper)
     valid_indices_reg = valid_indices_filtered[reg_mask]
 
-    print(f"[INFO] オクターブエラー修正中...")
+    logger.info("オクターブエラー修正中...")
     f0_reg_fixed = fix_octave_errors(f0_reg, conf_reg)
 
     # 信頼度重み付き中央値
-    print(f"[INFO] 中央値計算中...")
-    sort_idx    = np.argsort(f0_reg_fixed)
-    cum_conf    = np.cumsum(conf_reg[sort_idx])
-    mid_idx     = np.searchsorted(cum_conf, cum_conf[-1] / 2)
-    median_freq = f0_reg_fixed[sort_idx[mid_idx]]
-    print(f"[DEBUG] ✅ 中央値={median_freq:.1f} Hz, レジスター判定フレーム数={len(f0_reg_fixed)}")
+    logger.info("中央値計算中...")
+    median_freq = weighted_median(f0_reg_fixed, conf_reg)
+    logger.debug("中央値=%.1f Hz, レジスター判定フレーム数=%s", median_freq, len(f0_reg_fixed))
 
     return {
         "f0_reg": f0_reg, "f0_reg_fixed": f0_reg_fixed,
@@ -439,8 +488,8 @@ def filter_falsetto_consecutive(falsetto_data, min_consecutive):
             removed += len(g)
 
     if removed > 0:
-        print(f"[FILTER] 連続フレームフィルタ: {removed}フレーム除外 "
-              f"(連続{min_consecutive}未満のグループ除去, 残{len(result)}フレーム)")
+        logger.debug("[FILTER] 連続フレームフィルタ: %sフレーム除外 (連続%s未満のグループ除去, 残%sフレーム)",
+                     removed, min_consecutive, len(result))
     return result
 
 
@@ -467,8 +516,8 @@ def filter_falsetto_rms(falsetto_data, chest_rms_values, rms_ratio):
     removed = len(falsetto_data) - len(result)
 
     if removed > 0:
-        print(f"[FILTER] RMSパワーフィルタ: {removed}フレーム除外 "
-              f"(地声RMS中央={chest_rms_median:.4f}, 閾値={rms_threshold:.4f}, 残{len(result)}フレーム)")
+        logger.debug("[FILTER] RMSパワーフィルタ: %sフレーム除外 (地声RMS中央=%.4f, 閾値=%.4f, 残%sフレーム)",
+                     removed, chest_rms_median, rms_threshold, len(result))
     return result
 
 
@@ -503,44 +552,51 @@ def filter_falsetto_min_ratio(falsetto_notes, chest_notes, min_ratio):
             rescued = [f for f in falsetto_notes if f <= rescue_threshold]
             discarded = [f for f in falsetto_notes if f > rescue_threshold]
             chest_notes = chest_notes + rescued
-            print(f"[FILTER] 最小比率フィルタ: 裏声{len(falsetto_notes)}フレーム "
-                  f"({actual_ratio*100:.1f}% < {min_ratio*100:.0f}%) "
-                  f"→ {len(rescued)}フレーム地声に復帰 (P97={chest_p97:.1f}Hz, 上限={rescue_threshold:.1f}Hz), "
-                  f"{len(discarded)}フレームをノイズ除外")
+            logger.debug("[FILTER] 最小比率フィルタ: 裏声%sフレーム (%.1f%% < %.0f%%) → %sフレーム地声に復帰 "
+                         "(P97=%.1fHz, 上限=%.1fHz), %sフレームをノイズ除外",
+                         len(falsetto_notes), actual_ratio*100, min_ratio*100,
+                         len(rescued), chest_p97, rescue_threshold, len(discarded))
         else:
-            print(f"[FILTER] 最小比率フィルタ: 裏声{len(falsetto_notes)}フレーム "
-                  f"({actual_ratio*100:.1f}% < {min_ratio*100:.0f}%) → ノイズとして除外")
+            logger.debug("[FILTER] 最小比率フィルタ: 裏声%sフレーム (%.1f%% < %.0f%%) → ノイズとして除外",
+                         len(falsetto_notes), actual_ratio*100, min_ratio*100)
         falsetto_notes = []
 
     return chest_notes, falsetto_notes
 
 
+def graduated_min_conf(freq: float, median_freq: float) -> float:
+    """中央値より高い音に要求する CREPE 信頼度（中央値から遠いほど高い）。中央値以下は 0"""
+    if freq <= median_freq:
+        return 0.0
+    octaves_above = np.log2(freq / median_freq)
+    if octaves_above > 1.5:
+        return GRADUATED_CONF_FAR
+    if octaves_above > 1.0:
+        return GRADUATED_CONF_MID
+    return GRADUATED_CONF_NEAR
+
+
 def _classify_frames(filtered: dict, y_16k: np.ndarray, sr_crepe: int,
                      hop_length: int, no_falsetto: bool,
-                     already_separated: bool) -> tuple:
-    """レジスター判定 → (chest_notes, falsetto_notes)"""
+                     already_separated: bool, stats=None) -> tuple:
+    """レジスター判定 → (chest_notes, falsetto_notes)
+
+    stats: new_register_stats() の戻り値。解析開始時に固定したMLモデルを保持する。
+    """
     f0_reg_fixed     = filtered["f0_reg_fixed"]
     f0_reg           = filtered["f0_reg"]
     conf_reg         = filtered["conf_reg"]
     valid_indices_reg = filtered["valid_indices_reg"]
     median_freq      = filtered["median_freq"]
 
-    print(f"\n[STEP 6/7] 🎤 レジスター判定中...")
+    logger.info("[STEP 6/7] レジスター判定中...")
+    report_progress("classify_frames")
 
     if no_falsetto:
         # === no_falsetto モード: 全フレームを地声として扱う ===
-        print(f"[INFO] no_falsetto=True: 裏声判定をスキップし、全フレームを地声として処理")
+        logger.info("no_falsetto=True: 裏声判定をスキップし、全フレームを地声として処理")
         chest_notes = [f for f in f0_reg_fixed if VOICE_MIN_HZ <= f <= VOICE_MAX_HZ]
-        falsetto_notes = []
-        # no_falsettoではレジスター判定がないため、伴奏混入やCREPEオクターブエラーが
-        # 全て地声に含まれP97が汚染される。P95を使い、主歌声分布の上端を基準にする。
-        chest_notes = remove_statistical_outliers(
-            chest_notes,
-            percentile=NO_FALSETTO_OUTLIER_PERCENTILE,
-            max_semitones_gap=NO_FALSETTO_OUTLIER_GAP_ST,
-        )
-        chest_notes = remove_isolated_extremes(chest_notes)
-        return chest_notes, falsetto_notes
+        return finalize_chest_only(chest_notes), []
 
     # === 通常モード: レジスター判定 ===
     chest_notes    = []
@@ -548,32 +604,22 @@ def _classify_frames(filtered: dict, y_16k: np.ndarray, sr_crepe: int,
     chest_rms      = []   # 地声フレームのRMS値（RMSフィルタ用）
     frame_len      = 2048
     total_frames   = len(f0_reg_fixed)
-    progress_interval = max(1, total_frames // 10)
 
-    stats = new_register_stats()
+    if stats is None:
+        stats = new_register_stats()
     graduated_conf_filtered = 0
-    print(f"[INFO] {total_frames}フレームを処理中...")
+    logger.info("%sフレームを処理中...", total_frames)
+
+    # 判定対象のフレームを集め、REGISTER_BATCH_FRAMES 件ずつまとめて判定する（ML推論はバッチごとに1回）
+    candidates = []   # (array_index, freq, rms, frame, crepe_conf)
     for i in range(total_frames):
-        if i % progress_interval == 0 and i > 0:
-            progress = (i / total_frames) * 100
-            n_falsetto_so_far = len(falsetto_data)
-            print(f"[INFO] 進捗: {progress:.0f}% ({i}/{total_frames}) - 地声:{len(chest_notes)} 裏声:{n_falsetto_so_far}")
         freq = f0_reg_fixed[i]
         if not (VOICE_MIN_HZ <= freq <= VOICE_MAX_HZ):
             continue
         # --- 段階的信頼度要求: 中央値から遠いほど高い信頼度を要求 ---
-        orig_freq = f0_reg[i]
-        if orig_freq > median_freq:
-            octaves_above = np.log2(orig_freq / median_freq)
-            if octaves_above > 1.5:
-                min_conf = GRADUATED_CONF_FAR
-            elif octaves_above > 1.0:
-                min_conf = GRADUATED_CONF_MID
-            else:
-                min_conf = GRADUATED_CONF_NEAR
-            if conf_reg[i] < min_conf:
-                graduated_conf_filtered += 1
-                continue
+        if conf_reg[i] < graduated_min_conf(f0_reg[i], median_freq):
+            graduated_conf_filtered += 1
+            continue
         frame_idx = valid_indices_reg[i]
         center    = int(frame_idx) * hop_length
         start     = max(0, center - frame_len // 2)
@@ -583,34 +629,62 @@ def _classify_frames(filtered: dict, y_16k: np.ndarray, sr_crepe: int,
             continue
         # フレームのRMSを計算（RMSフィルタ用、計算コスト小）
         frame_rms = float(np.sqrt(np.mean(frame ** 2)))
-        try:
-            reg = classify_register(
-                frame,
-                sr_crepe,
-                freq,
-                median_freq,
-                already_separated,
-                crepe_conf=float(conf_reg[i]),
-                stats=stats,
-            )
+        candidates.append((i, freq, frame_rms, frame, float(conf_reg[i])))
+
+    for b in range(0, len(candidates), REGISTER_BATCH_FRAMES):
+        if b > 0:
+            i = candidates[b][0]
+            logger.debug("進捗: %.0f%% (%s/%s) - 地声:%s 裏声:%s",
+                         i / total_frames * 100, i, total_frames, len(chest_notes), len(falsetto_data))
+            report_progress("classify_frames", i / total_frames)
+        batch = candidates[b:b + REGISTER_BATCH_FRAMES]
+        regs = classify_registers(
+            [(frame, freq, conf) for _, freq, _, frame, conf in batch],
+            sr_crepe,
+            median_freq,
+            already_separated,
+            stats=stats,
+        )
+        for (i, freq, frame_rms, _, _), reg in zip(batch, regs):
             if reg == "falsetto":
                 falsetto_data.append((i, freq, frame_rms))
             elif reg == "chest":
                 chest_notes.append(freq)
                 chest_rms.append(frame_rms)
             # reg == "unknown" はスキップ（無声音・異常データ）
-        except Exception:
-            continue
 
     print_register_summary(stats)  # レジスター判定のサマリーを出力
 
     if graduated_conf_filtered > 0:
-        print(f"[DEBUG] 段階的信頼度フィルタ: {graduated_conf_filtered}フレーム除外")
+        logger.debug("段階的信頼度フィルタ: %sフレーム除外", graduated_conf_filtered)
+
+    return finalize_registers(chest_notes, chest_rms, falsetto_data, f0_reg_fixed)
+
 
+def finalize_chest_only(chest_notes: list) -> list:
+    """no_falsetto モードの外れ値除去（全フレームを地声として扱う）"""
+    # no_falsettoではレジスター判定がないため、伴奏混入やCREPEオクターブエラーが
+    # 全て地声に含まれP97が汚染される。P95を使い、主歌声分布の上端を基準にする。
+    chest_notes = remove_statistical_outliers(
+        chest_notes,
+        percentile=NO_FALSETTO_OUTLIER_PERCENTILE,
+        max_semitones_gap=NO_FALSETTO_OUTLIER_GAP_ST,
+    )
+    return remove_isolated_extremes(chest_notes)
+
+
+def finalize_registers(chest_notes: list, chest_rms: list, falsetto_data: list,
+                       f0_reg_fixed: np.ndarray, verbose: bool = True) -> tuple:
+    """フレームごとの判定結果 → 裏声ノイズフィルタ・外れ値除去後の (chest_notes, falsetto_notes)
+
+    falsetto_data: (array_index, freq, rms) のリスト。chest_notes は書き換えない。
+    verbose=False で INFO ログを出さない（リアルタイム解析のように何度も集計する場合）。
+    """
+    chest_notes = list(chest_notes)
     # === 裏声ノイズフィルタ（demucs残留楽器対策） ===
     # フィルタ前のカウントを記録
     falsetto_before_filter = len(falsetto_data)
-    print(f"[DEBUG] 裏声ノイズフィルタ開始: 裏声={falsetto_before_filter}フレーム")
+    logger.debug("裏声ノイズフィルタ開始: 裏声=%sフレーム", falsetto_before_filter)
 
     if falsetto_data:
         # フィルタ1: 連続フレーム要件 - 孤立した裏声はノイズ
@@ -630,8 +704,8 @@ def _classify_frames(filtered: dict, y_16k: np.ndarray, sr_crepe: int,
 
     falsetto_after_filter = len(falsetto_notes)
     if falsetto_before_filter != falsetto_after_filter:
-        print(f"[DEBUG] 裏声ノイズフィルタ完了: {falsetto_before_filter} → {falsetto_after_filter}フレーム "
-              f"({falsetto_before_filter - falsetto_after_filter}フレーム除外)")
+        logger.debug("裏声ノイズフィルタ完了: %s → %sフレーム (%sフレーム除外)",
+                     falsetto_before_filter, falsetto_after_filter, falsetto_before_filter - falsetto_after_filter)
 
     # 裏声表示フィルタ: 330Hz未満の「裏声」は息混じり地声の可能性が高い
     falsetto_orig  = list(falsetto_notes)
@@ -639,28 +713,29 @@ def _classify_frames(filtered: dict, y_16k: np.ndarray, sr_crepe: int,
     low_falsetto   = [f for f in falsetto_orig if f < FALSETTO_DISPLAY_MIN_HZ]
     chest_notes.extend(low_falsetto)
     if low_falsetto:
-        print(f"[DEBUG] {len(low_falsetto)}フレームを裏声→地声に再分類")
+        logger.debug("%sフレームを裏声→地声に再分類", len(low_falsetto))
 
     if not chest_notes and not falsetto_notes:
-        print(f"[WARN] ⚠️ レジスター判定結果なし。全フレームを地声として処理")
+        logger.warning("レジスター判定結果なし。全フレームを地声として処理")
         chest_notes = f0_reg_fixed.tolist()
     else:
-        print(f"[DEBUG] レジスター判定直後: 地声={len(chest_notes)}フレーム, 裏声={len(falsetto_notes)}フレーム")
+        logger.debug("レジスター判定直後: 地声=%sフレーム, 裏声=%sフレーム", len(chest_notes), len(falsetto_notes))
 
     # デバッグ: 最高音付近（上位10Hz）の判定状況を確認
-    if chest_notes or falsetto_notes:
+    if logger.isEnabledFor(logging.DEBUG) and (chest_notes or falsetto_notes):
         all_freqs = chest_notes + falsetto_notes
         if all_freqs:
             max_freq = max(all_freqs)
             high_threshold = max_freq - 10
             high_chest = [f for f in chest_notes if f >= high_threshold]
             high_falsetto = [f for f in falsetto_notes if f >= high_threshold]
-            print(f"[DEBUG] 最高音付近（{high_threshold:.1f}Hz以上）: 地声{len(high_chest)}フレーム, 裏声{len(high_falsetto)}フレーム")
+            logger.debug("最高音付近（%.1fHz以上）: 地声%sフレーム, 裏声%sフレーム",
+                         high_threshold, len(high_chest), len(high_falsetto))
             if high_chest and high_falsetto:
-                print(f"[DEBUG] → 地声最高: {max(high_chest):.1f}Hz, 裏声最高: {max(high_falsetto):.1f}Hz")
+                logger.debug("→ 地声最高: %.1fHz, 裏声最高: %.1fHz", max(high_chest), max(high_falsetto))
 
     # === 統計的外れ値除去（パーセンタイルベースの安全ネット） ===
-    print(f"[DEBUG] フィルタリング前: 地声={len(chest_notes)}, 裏声={len(falsetto_notes)}")
+    logger.debug("フィルタリング前: 地声=%s, 裏声=%s", len(chest_notes), len(falsetto_notes))
     chest_notes_before = len(chest_notes)
     falsetto_notes_before = len(falsetto_notes)
     
@@ -674,7 +749,9 @@ def _classify_frames(filtered: dict, y_16k: np.ndarray, sr_crepe: int,
         percentile=FALSETTO_OUTLIER_PERCENTILE,
         max_semitones_gap=FALSETTO_OUTLIER_GAP_ST,
     )
-    print(f"[DEBUG] 統計外れ値除去後: 地声={len(chest_notes)} ({chest_notes_before}→{len(chest_notes)}), 裏声={len(falsetto_notes)} ({falsetto_notes_before}→{len(falsetto_notes)})")
+    logger.debug("統計外れ値除去後: 地声=%s (%s→%s), 裏声=%s (%s→%s)",
+                 len(chest_notes), chest_notes_before, len(chest_notes),
+                 len(falsetto_notes), falsetto_notes_before, len(falsetto_notes))
 
     # === 孤立した極端値を除去（ノイズ最終防衛線） ===
     chest_notes_before = len(chest_notes)
@@ -682,10 +759,12 @@ def _classify_frames(filtered: dict, y_16k: np.ndarray, sr_crepe: int,
     
     chest_notes = remove_isolated_extremes(chest_notes)
     falsetto_notes = remove_isolated_extremes(falsetto_notes)
-    print(f"[DEBUG] 孤立フレーム除去後: 地声={len(chest_notes)} ({chest_notes_before}→{len(chest_notes)}), 裏声={len(falsetto_notes)} ({falsetto_notes_before}→{len(falsetto_notes)})")
+    logger.debug("孤立フレーム除去後: 地声=%s (%s→%s), 裏声=%s (%s→%s)",
+                 len(chest_notes), chest_notes_before, len(chest_notes),
+                 len(falsetto_notes), falsetto_notes_before, len(falsetto_notes))
 
     # === 最高音付近の混在判定を解消 ===
-    print(f"[DEBUG] 最高音付近の混在判定前: 地声={len(chest_notes)}, 裏声={len(falsetto_notes)}")
+    logger.debug("最高音付近の混在判定前: 地声=%s, 裏声=%s", len(chest_notes), len(falsetto_notes))
     if chest_notes and falsetto_notes:
         all_freqs = chest_notes + falsetto_notes
         max_freq = max(all_freqs)
@@ -698,7 +777,9 @@ def _classify_frames(filtered: dict, y_16k: np.ndarray, sr_crepe: int,
         # 両方存在する場合、最高音付近では裏声を優先（高音は裏声で出すのが自然）
         if high_chest_frames and high_falsetto_frames:
             chest_notes = [f for f in chest_notes if f < high_range_threshold]
-            print(f"[INFO] 最高音付近の地声{len(high_chest_frames)}フレームを除外（裏声{len(high_falsetto_frames)}フレームを優先採用）")
+            if verbose:
+                logger.info("最高音付近の地声%sフレームを除外（裏声%sフレームを優先採用）",
+                            len(high_chest_frames), len(high_falsetto_frames))
 
         # ラベル変換後の安全チェック: 量子化で同じ音名になるケースを防止
         if chest_notes and falsetto_notes:
@@ -709,52 +790,61 @@ def _classify_frames(filtered: dict, y_16k: np.ndarray, sr_crepe: int,
                 chest_notes = [f for f in chest_notes
                                if hz_to_label_and_hz(f)[0] != f_label]
                 removed = before_count - len(chest_notes)
-                print(f"[INFO] ラベル一致'{c_label}'の地声{removed}フレームを除外")
+                if verbose:
+                    logger.info("ラベル一致'%s'の地声%sフレームを除外", c_label, removed)
     
-    print(f"[DEBUG] 最高音付近の混在判定後: 地声={len(chest_notes)}, 裏声={len(falsetto_notes)}")
+    logger.debug("最高音付近の混在判定後: 地声=%s, 裏声=%s", len(chest_notes), len(falsetto_notes))
 
     return chest_notes, falsetto_notes
 
 
+def range_fields(notes: list, prefix: str, verbose: bool = True) -> dict:
+    """{prefix}_min / _max / _min_hz / _max_hz / _count（最高音は持続フレーム要件つき）。notes が空なら {}
+
+    verbose=False で最高音堅牢化のログを出さない（リアルタイム解析のように何度も集計する場合）。
+    """
+    if not notes:
+        return {}
+    arr = np.array(notes)
+    lo_label, lo_hz = hz_to_label_and_hz(float(np.min(arr)))
+    robust_max = _get_robust_max(notes)
+    hi_label, hi_hz = hz_to_label_and_hz(float(robust_max))
+    raw_max = float(np.max(arr))
+    if verbose and robust_max < raw_max:
+        logger.info("%s 最高音堅牢化: %.1fHz → %.1fHz (持続不足フレームをスキップ)", prefix, raw_max, robust_max)
+    return {
+        f"{prefix}_min":    lo_label,
+        f"{prefix}_max":    hi_label,
+        f"{prefix}_min_hz": lo_hz,
+        f"{prefix}_max_hz": hi_hz,
+        f"{prefix}_count":  len(arr),
+    }
+
+
 def _build_result(chest_notes: list, falsetto_notes: list,
                   f0_reg_fixed: np.ndarray, conf_reg: np.ndarray) -> dict:
     """結果dict構築 → result"""
-    print(f"\n[STEP 7/7] 📋 結果集計中...")
+    logger.info("[STEP 7/7] 結果集計中...")
+    report_progress("build_result")
 
     all_notes   = chest_notes + falsetto_notes
     overall_min = float(np.min(all_notes))
     overall_max = float(np.max(all_notes))
-    print(f"[DEBUG] 全体音域: min={overall_min:.1f}Hz max={overall_max:.1f}Hz")
+    logger.debug("全体音域: min=%.1fHz max=%.1fHz", overall_min, overall_max)
 
     result = {}
     chest_avg_hz = float(np.mean(chest_notes)) if chest_notes else 0.0
 
-    def add_range(notes, prefix):
-        if not notes:
-            return
-        arr = np.array(notes)
-        lo_label, lo_hz = hz_to_label_and_hz(float(np.min(arr)))
-        robust_max = _get_robust_max(notes)
-        hi_label, hi_hz = hz_to_label_and_hz(float(robust_max))
-        raw_max = float(np.max(arr))
-        if robust_max < raw_max:
-            print(f"[INFO] {prefix} 最高音堅牢化: {raw_max:.1f}Hz → {robust_max:.1f}Hz (持続不足フレームをスキップ)")
-        result[f"{prefix}_min"]    = lo_label
-        result[f"{prefix}_max"]    = hi_label
-        result[f"{prefix}_min_hz"] = lo_hz
-        result[f"{prefix}_max_hz"] = hi_hz
-        result[f"{prefix}_count"]  = len(arr)
-
-    add_range(chest_notes,    "chest")
-    add_range(falsetto_notes, "falsetto")
+    result.update(range_fields(chest_notes,    "chest"))
+    result.update(range_fields(falsetto_notes, "falsetto"))
 
     # デバッグ: 地声と裏声の最高音Hz値を出力
     if chest_notes and falsetto_notes:
         chest_max_hz = float(np.max(chest_notes))
         falsetto_max_hz = float(np.max(falsetto_notes))
-        print(f"[DEBUG] 地声最高音: {chest_max_hz:.1f}Hz, 裏声最高音: {falsetto_max_hz:.1f}Hz")
+        logger.debug("地声最高音: %.1fHz, 裏声最高音: %.1fHz", chest_max_hz, falsetto_max_hz)
         if abs(chest_max_hz - falsetto_max_hz) < 5:
-            print(f"[WARN] ⚠️ 地声と裏声の最高音が近い（差: {abs(chest_max_hz - falsetto_max_hz):.1f}Hz）")
+            logger.warning("地声と裏声の最高音が近い（差: %.1fHz）", abs(chest_max_hz - falsetto_max_hz))
 
     ovr_min_label, ovr_min_hz = hz_to_label_and_hz(overall_min)
     ovr_max_label, ovr_max_hz = hz_to_label_and_hz(overall_max)
@@ -769,10 +859,9 @@ def _build_result(chest_notes: list, falsetto_notes: list,
     result["chest_avg_hz"]   = round(chest_avg_hz, 1)
     
     # === デバッグ出力 ===
-    print(f"[DEBUG] 声区バランス計算:")
-    print(f"  地声: {len(chest_notes)}フレーム ({result['chest_ratio']}%)")
-    print(f"  裏声: {len(falsetto_notes)}フレーム ({result['falsetto_ratio']}%)")
-    print(f"  合計: {total}フレーム")
+    logger.debug("声区バランス: 地声=%dフレーム (%s%%) 裏声=%dフレーム (%s%%) 合計=%dフレーム",
+                 len(chest_notes), result["chest_ratio"],
+                 len(falsetto_notes), result["falsetto_ratio"], total)
 
     # === 歌唱力分析 ===
     try:
@@ -786,43 +875,82 @@ def _build_result(chest_notes: list, falsetto_notes: list,
             overall_max_hz=overall_max,
         )
     except Exception as e:
-        print(f"[WARN] 歌唱力分析スキップ: {e}")
-
-    print(f"\n{'='*60}")
-    print(f"[INFO] ✅ 解析完了!")
-    print(f"{'='*60}")
-    print(f"📊 最終結果:")
-    print(f"  全体音域: {result.get('overall_min', 'N/A')} - {result.get('overall_max', 'N/A')}")
-    if 'chest_min' in result:
-        print(f"  地声音域: {result.get('chest_min', 'N/A')} - {result.get('chest_max', 'N/A')} ({result.get('chest_ratio', 0)}%)")
-    if 'falsetto_min' in result:
-        print(f"  裏声音域: {result.get('falsetto_min', 'N/A')} - {result.get('falsetto_max', 'N/A')} ({result.get('falsetto_ratio', 0)}%)")
-    print(f"{'='*60}\n")
+        logger.warning("歌唱力分析スキップ: %s", e)
+
+    logger.info(
+        "解析完了: 全体音域=%s-%s 地声音域=%s-%s (%s%%) 裏声音域=%s-%s (%s%%)",
+        result.get("overall_min", "N/A"), result.get("overall_max", "N/A"),
+        result.get("chest_min", "N/A"), result.get("chest_max", "N/A"), result.get("chest_ratio", 0),
+        result.get("falsetto_min", "N/A"), result.get("falsetto_max", "N/A"), result.get("falsetto_ratio", 0),
+    )
     return result
 
 
+# ============================================================
+# warmup — 解析ワーカー起動時の事前ロード
+# ============================================================
+def warmup():
+    """CREPEの重みとレジスター判定モデルを先にロードしておく（初回リクエストの待ち時間削減）"""
+    from register_classifier import preload_model
+    preload_model()
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    silence = torch.zeros(1, CREPE_SR // 10)
+    try:
+        run_crepe(silence, CREPE_SR, CREPE_HOP_LENGTH, device, 'tiny')
+    except Exception as e:
+        logger.warning("CREPEの事前ロード失敗: %s", e)
+
+
 # ============================================================
 # analyze — オーケストレータ
 # ============================================================
 def analyze(wav_path: str, already_separated: bool = False, no_falsetto: bool = False) -> dict:
-    audio = _load_audio(wav_path)
+    with trace_stage("load_audio"):
+        audio = _load_audio(wav_path)
     if "error" in audio:
         return audio
+    return analyze_array(audio["y"], audio["sr"],
+                         already_separated=already_separated, no_falsetto=no_falsetto)
 
-    prep = _preprocess(audio["y"], audio["sr"])
 
-    pitch = _run_pitch_detection(prep["audio_tensor"], prep["sr_crepe"],
-                                 prep["hop_length"], prep["device"])
+def analyze_array(y: np.ndarray, sr: int, already_separated: bool = False,
+                  no_falsetto: bool = False, hop_length: int = CREPE_HOP_LENGTH) -> dict:
+    """デコード済みの波形（モノラル or (frames, channels)）を解析する。analyze と同じ結果を返す
+
+    メモリ節約のため y は正規化でその場書き換えされる（呼び出し後に元の波形として使わないこと）。
+    hop_length を大きくすると CREPE のフレームが間引かれて速くなる（速報用。フレーム数で
+    決めている閾値はそのままなので、持続・連続の判定は実時間では hop の倍率だけ甘くなる）。
+    """
+    audio = _validate_audio(y, sr)
+    if "error" in audio:
+        return audio
+
+    with trace_stage("preprocess"):
+        prep = _preprocess(audio["y"], audio["sr"], hop_length)
+
+    with trace_stage("pitch_detection"):
+        pitch = _run_pitch_detection(prep["audio_tensor"], prep["sr_crepe"],
+                                     prep["hop_length"], prep["device"])
     if "error" in pitch:
         return pitch
 
-    filtered = _filter_frames(pitch["f0"], pitch["conf"])
+    with trace_stage("filter_frames"):
+        filtered = _filter_frames(pitch["f0"], pitch["conf"])
     if "error" in filtered:
         return filtered
 
-    chest, falsetto = _classify_frames(
-        filtered, prep["y_16k"], prep["sr_crepe"],
-        prep["hop_length"], no_falsetto, already_separated,
-    )
+    # モデル更新チェックは解析ごとに1回だけ（フレームごとにstatしない）
+    stats = new_register_stats()
+    with trace_stage("classify_frames"):
+        chest, falsetto = _classify_frames(
+            filtered, prep["y_16k"], prep["sr_crepe"],
+            prep["hop_length"], no_falsetto, already_separated,
+            stats=stats,
+        )
+    record_register_metrics(stats)
 
-    return _build_result(chest, falsetto, filtered["f0_reg_fixed"], filtered["conf_reg"])
\ No newline at end of file
+    with trace_stage("build_result"):
+        result = _build_result(chest, falsetto, filtered["f0_reg_fixed"], filtered["conf_reg"])
+    result["register_model"] = stats.model.version if stats.model is not None else None
+    return result
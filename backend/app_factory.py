@@ -0,0 +1,99 @@
+"""
+app_factory.py — FastAPI アプリの共通設定
+
+main.py（全エンドポイント）・catalogue_api.py・analysis_api.py の各アプリは
+ここで同じ CORS・起動処理・/metrics・ログ設定（リクエストID付き）を持つアプリとして組み立てる。
+"""
+import time
+from typing import Callable, Iterable
+
+from fastapi import APIRouter, FastAPI, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+
+from config import MAX_UPLOAD_BYTES
+from database import init_db
+from logging_setup import new_request_id, reset_request_id, set_request_id, setup_logging
+from metrics import CONTENT_TYPE, HTTP_REQUEST_SECONDS, render_text
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# multipart の境界・フォーム項目の分だけ上限に余裕を持たせる
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+def create_app(title: str, *routers: APIRouter,
+               on_startup: Iterable[Callable[[], None]] = ()) -> FastAPI:
+    """ルーターをまとめて1つのアプリにする。on_startup はワーカー起動時に順に実行される"""
+    setup_logging()
+    app = FastAPI(title=title)
+
+    # 【修正】DB初期化をサーバー起動時に実行するように変更
+    @app.on_event("startup")
+    def on_startup_handler():
+        init_db()
+        for hook in on_startup:
+            hook()
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # TODO: 本番環境では具体的なオリジンに限定すること
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    @app.middleware("http")
+    async def record_request_metrics(request: Request, call_next):
+        """ルート（パステンプレート）単位でレイテンシを記録"""
+        t0 = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - t0,
+                method=request.method,
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            )
+
+    @app.middleware("http")
+    async def reject_oversized_body(request: Request, call_next):
+        """
+        Content-Length が上限を超えるリクエストは本文を受信する前に 413 で返す
+        （FastAPI が UploadFile を一時ファイルに書き出すより前）。
+        Content-Length の無いチャンク転送はここでは断れず、FastAPI が受信し終えた後に
+        upload_ingest が一時ファイルを読みながら上限を確認する。
+        """
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES + _MULTIPART_OVERHEAD_BYTES:
+            return JSONResponse(
+                status_code=413,
+                content={"error": f"ファイルサイズが上限（{MAX_UPLOAD_BYTES // (1024 * 1024)}MB）を超えています"},
+                # この応答は CORSMiddleware の外側で返るため、ブラウザがエラー内容を読めるよう付けておく
+                headers={"Access-Control-Allow-Origin": "*"},
+            )
+        return await call_next(request)
+
+    @app.middleware("http")
+    async def assign_request_id(request: Request, call_next):
+        """リクエストIDを採番（nginx 等が付けた X-Request-ID があればそれを使う）し、ログに載せる"""
+        request_id = request.headers.get(REQUEST_ID_HEADER) or new_request_id()
+        token = set_request_id(request_id)
+        try:
+            response = await call_next(request)
+        finally:
+            reset_request_id(token)
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics_endpoint():
+        """プロセス内メトリクス（Prometheus テキスト形式）"""
+        return Response(render_text(), media_type=CONTENT_TYPE)
+
+    for router in routers:
+        app.include_router(router)
+    return app
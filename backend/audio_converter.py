@@ -1,7 +1,14 @@
+import asyncio
+import logging
 import os
 import shutil
 import subprocess
 import uuid
+from typing import AsyncIterator, Iterator, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
 
 def find_ffmpeg():
     """ffmpegの実行パスを探す"""
@@ -27,12 +34,12 @@ def _run_ffmpeg(cmd: list, input_path: str, output_path: str):
     if not os.path.exists(input_path):
         raise FileNotFoundError(f"入力ファイルが見つかりません: {input_path}")
 
-    print(f"[INFO] Converting: {input_path} -> {output_path}")
+    logger.info("Converting: %s -> %s", input_path, output_path)
     try:
         subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     except subprocess.CalledProcessError as e:
         error_msg = e.stderr.decode() if e.stderr else "Unknown error"
-        print(f"[ERROR] FFmpeg conversion failed: {error_msg}")
+        logger.error("FFmpeg conversion failed: %s", error_msg)
         raise RuntimeError(f"音声変換に失敗しました: {error_msg}")
 
     if not os.path.exists(output_path):
@@ -85,3 +92,221 @@ def convert_to_wav_hq(input_path: str, output_dir: str = "uploads") -> str:
         output_path
     ]
     return _run_ffmpeg(cmd, input_path, output_path)
+
+
+async def _feed_stdin(proc, chunks: AsyncIterator[bytes]) -> None:
+    """
+    chunks を ffmpeg の標準入力に書き込み、最後に閉じる。
+    ffmpeg が先に終了しても chunks は最後まで読む（サイズ上限・ハッシュの計算のため）。
+    chunks が例外を送出した場合も標準入力を閉じてから送出する（ffmpeg の出力側が EOF になる）。
+    """
+    writable = True
+    try:
+        async for chunk in chunks:
+            if not writable:
+                continue
+            try:
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                writable = False   # -t に達した・入力が壊れている → 残りは読み捨てる
+    finally:
+        if writable:
+            proc.stdin.close()
+
+
+# ============================================================
+# float32 配列への直接デコード（WAV を経由しない）
+# ============================================================
+_PCM_INITIAL_SECONDS = 60.0   # 最初に確保するバッファの長さ（足りなければ倍に拡張）
+_PCM_READ_BYTES = 256 * 1024  # 非同期版で1回に読む量
+
+
+def _pcm_output_args(sr: int, channels: int, max_seconds: Optional[float] = None) -> list:
+    """生の float32 PCM（リトルエンディアン・インターリーブ）を標準出力に出す ffmpeg 引数"""
+    args = ["-vn", "-ac", str(channels), "-ar", str(sr), "-f", "f32le"]
+    if max_seconds:
+        args += ["-t", f"{max_seconds:g}"]
+    return args + ["pipe:1"]
+
+
+class _PcmBuffer:
+    """
+    ffmpeg の f32le 出力を受ける float32 バッファ。
+    チャンネル数・サンプリングレートは ffmpeg 側で固定しているので、
+    バイト列を一度も bytes オブジェクトに溜めずにそのまま配列へ読み込める。
+    """
+
+    def __init__(self, sr: int, channels: int, max_seconds: Optional[float] = None):
+        self.channels = channels
+        seconds = min(_PCM_INITIAL_SECONDS, max_seconds) if max_seconds else _PCM_INITIAL_SECONDS
+        self._buf = np.empty(max(1, int(seconds * sr)) * channels, dtype=np.float32)
+        self._nbytes = 0
+
+    def _free_view(self, min_bytes: int = 1) -> memoryview:
+        """未使用部分のバイトビュー（min_bytes 分の空きが無ければ倍に拡張）"""
+        if self._buf.nbytes - self._nbytes < min_bytes:
+            size = max(self._buf.size * 2, (self._nbytes + min_bytes) // 4 + 1)
+            grown = np.empty(size, dtype=np.float32)
+            memoryview(grown).cast("B")[:self._nbytes] = memoryview(self._buf).cast("B")[:self._nbytes]
+            self._buf = grown
+        return memoryview(self._buf).cast("B")[self._nbytes:]
+
+    def readinto(self, stream) -> int:
+        """stream（ファイルライク）から空き領域へ直接読み込む。EOF なら 0"""
+        n = stream.readinto(self._free_view()) or 0
+        self._nbytes += n
+        return n
+
+    def append(self, data: bytes) -> None:
+        self._free_view(len(data))[:len(data)] = data
+        self._nbytes += len(data)
+
+    @property
+    def frames(self) -> int:
+        return self._nbytes // (4 * self.channels)
+
+    def to_array(self) -> np.ndarray:
+        """モノラルは (frames,)、それ以外は (frames, channels)（soundfile.read と同じ形）"""
+        y = self._buf[:self.frames * self.channels]
+        return y if self.channels == 1 else y.reshape(-1, self.channels)
+
+
+def _raise_decode_error(stderr: bytes) -> None:
+    error_msg = stderr.decode(errors="replace") or "Unknown error"
+    logger.error("FFmpeg decode failed: %s", error_msg)
+    raise RuntimeError(f"音声のデコードに失敗しました: {error_msg}")
+
+
+def _decode_cmd(input_path: str, sr: int, channels: int, max_seconds: Optional[float]) -> list:
+    ffmpeg_bin = find_ffmpeg()
+    if not ffmpeg_bin:
+        raise RuntimeError("ffmpegが見つかりません。brew install ffmpegを実行してください。")
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"入力ファイルが見つかりません: {input_path}")
+    # -loglevel error で stderr を小さく保つ（stdout を読み切るまで stderr は読まないため）
+    return [ffmpeg_bin, "-nostdin", "-loglevel", "error", "-i", input_path,
+            *_pcm_output_args(sr, channels, max_seconds)]
+
+
+def decode_to_array(
+    input_path: str,
+    sr: int = 16000,
+    channels: int = 1,
+    max_seconds: Optional[float] = None,
+) -> Tuple[np.ndarray, int]:
+    """
+    音声ファイルを ffmpeg で float32 配列に直接デコードする → (y, sr)
+    （WAV の書き出し・読み直しをしない）。既定は CREPE 用の 16kHz・モノラル。
+    """
+    cmd = _decode_cmd(input_path, sr, channels, max_seconds)
+    logger.info("Decoding: %s (%dHz, %dch)", input_path, sr, channels)
+    buf = _PcmBuffer(sr, channels, max_seconds)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while buf.readinto(proc.stdout):
+            pass
+        stderr = proc.stderr.read()
+        returncode = proc.wait()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+
+    if returncode != 0:
+        _raise_decode_error(stderr)
+    return buf.to_array(), sr
+
+
+def iter_decode_chunks(
+    input_path: str,
+    sr: int = 16000,
+    channels: int = 1,
+    chunk_seconds: float = 30.0,
+    max_seconds: Optional[float] = None,
+) -> Iterator[np.ndarray]:
+    """
+    長い音源用: chunk_seconds ごとの float32 配列を順に返す（最後のチャンクは短い場合がある）。
+    途中でループを抜けると ffmpeg を止める。
+    """
+    cmd = _decode_cmd(input_path, sr, channels, max_seconds)
+    chunk_frames = max(1, int(chunk_seconds * sr))
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            chunk = np.empty(chunk_frames * channels, dtype=np.float32)
+            view = memoryview(chunk).cast("B")
+            filled = 0
+            while filled < len(view):
+                n = proc.stdout.readinto(view[filled:]) or 0
+                if n == 0:
+                    break
+                filled += n
+            frames = filled // (4 * channels)
+            if frames:
+                chunk = chunk[:frames * channels]
+                yield chunk if channels == 1 else chunk.reshape(-1, channels)
+            if filled < len(view):
+                break
+        stderr = proc.stderr.read()
+        if proc.wait() != 0:
+            _raise_decode_error(stderr)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+
+
+async def decode_stream_to_array(
+    chunks: AsyncIterator[bytes],
+    input_format: str,
+    sr: int = 16000,
+    channels: int = 1,
+    max_seconds: Optional[float] = None,
+) -> Tuple[np.ndarray, int]:
+    """
+    バイト列のストリームを ffmpeg の標準入力に流し、標準出力の f32le をそのまま配列に読む → (y, sr)
+    （アップロードをディスクに一切書かない）。書き込みと読み出しは並行して行う。
+    chunks が例外を送出した場合は ffmpeg を止め、その例外をそのまま送出する。
+    """
+    ffmpeg_bin = find_ffmpeg()
+    if not ffmpeg_bin:
+        raise RuntimeError("ffmpegが見つかりません。brew install ffmpegを実行してください。")
+
+    cmd = [
+        ffmpeg_bin, "-loglevel", "error",
+        "-f", input_format, "-i", "pipe:0",
+        *_pcm_output_args(sr, channels, max_seconds),
+    ]
+    logger.info("Decoding (stream, %s) -> %dHz, %dch", input_format, sr, channels)
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+    buf = _PcmBuffer(sr, channels, max_seconds)
+    feed_task = asyncio.create_task(_feed_stdin(proc, chunks))
+    stderr_task = asyncio.create_task(proc.stderr.read())
+    try:
+        while True:
+            data = await proc.stdout.read(_PCM_READ_BYTES)
+            if not data:
+                break
+            buf.append(data)
+        await feed_task
+        returncode = await proc.wait()
+        stderr = await stderr_task
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        feed_task.cancel()
+        stderr_task.cancel()
+        raise
+
+    if returncode != 0:
+        _raise_decode_error(stderr)
+    return buf.to_array(), sr
@@ -1,18 +1,226 @@
 """
 Supabase認証のヘルパー関数
 """
+import base64
+import hashlib
+import hmac
+import json
+import logging
 import os
+import time
 from typing import Optional, Dict, Any
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from supabase import Client
 from database_supabase import supabase
+from metrics import SUPABASE_CALL_SECONDS, counter
+from config import (
+    AUTH_TOKEN_CACHE_TTL, USER_CACHE_MAX_ENTRIES,
+    JWT_AUDIENCE, JWT_LEEWAY_SECONDS, JWKS_CACHE_SECONDS,
+)
+from ttl_cache import TTLCache
 from dotenv import load_dotenv
 
+# 非対称鍵 (RS256 / ES256) の JWKS 検証に使う（任意）。無ければ HS256 のみローカル検証する
+try:
+    import jwt as pyjwt
+except ImportError:
+    pyjwt = None
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 security = HTTPBearer()
 
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+
+TOKEN_VERIFICATIONS = counter(
+    "auth_token_verifications_total", "アクセストークンの検証回数", ("method", "result"),
+)
+
+# 検証済みトークン → ユーザー情報（キーはトークンの sha256。トークン自体は保持しない）
+_token_cache = TTLCache("auth_token", AUTH_TOKEN_CACHE_TTL, USER_CACHE_MAX_ENTRIES)
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _token_exp(token: str) -> Optional[float]:
+    """JWT の exp（署名は検証しない。キャッシュ期限の上限にだけ使う）"""
+    try:
+        exp = json.loads(_b64url_decode(token.split(".")[1])).get("exp")
+        return float(exp) if exp is not None else None
+    except (IndexError, ValueError, TypeError):
+        return None
+
+
+# ============================================================
+# ローカル検証（Supabase への往復なし）
+# ============================================================
+class InvalidToken(Exception):
+    """署名不一致・期限切れ・aud 不一致など、ローカルで無効と判断できたトークン"""
+
+
+_jwks_client = None
+
+
+def _get_jwks_client():
+    global _jwks_client
+    if _jwks_client is None and pyjwt is not None and SUPABASE_URL:
+        _jwks_client = pyjwt.PyJWKClient(
+            f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json",
+            cache_keys=True, lifespan=JWKS_CACHE_SECONDS,
+        )
+    return _jwks_client
+
+
+def _check_claims(claims: dict) -> dict:
+    now = time.time()
+    exp = claims.get("exp")
+    if exp is None or float(exp) + JWT_LEEWAY_SECONDS < now:
+        raise InvalidToken("トークンの有効期限が切れています")
+    nbf = claims.get("nbf")
+    if nbf is not None and float(nbf) - JWT_LEEWAY_SECONDS > now:
+        raise InvalidToken("トークンはまだ有効ではありません")
+    aud = claims.get("aud")
+    audiences = aud if isinstance(aud, list) else [aud]
+    if JWT_AUDIENCE and JWT_AUDIENCE not in audiences:
+        raise InvalidToken("aud が一致しません")
+    if not claims.get("sub"):
+        raise InvalidToken("sub がありません")
+    return claims
+
+
+def _decode_hs256(token: str) -> dict:
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        signature = _b64url_decode(signature_b64)
+        claims = json.loads(_b64url_decode(payload_b64))
+    except ValueError as e:
+        raise InvalidToken(f"トークンの形式が不正です: {e}")
+    expected = hmac.new(
+        SUPABASE_JWT_SECRET.encode(), f"{header_b64}.{payload_b64}".encode(), hashlib.sha256,
+    ).digest()
+    if not hmac.compare_digest(signature, expected):
+        raise InvalidToken("署名が一致しません")
+    return _check_claims(claims)
+
+
+def _decode_jwks(token: str, alg: str) -> Optional[dict]:
+    client = _get_jwks_client()
+    if client is None:
+        return None
+    try:
+        key = client.get_signing_key_from_jwt(token).key
+    except pyjwt.PyJWKClientError as e:
+        # JWKS が取れない（ネットワーク・鍵ローテーション直後など）→ リモート検証に任せる
+        logger.warning("JWKS の取得に失敗しました: %s", e)
+        return None
+    try:
+        claims = pyjwt.decode(
+            token, key, algorithms=[alg], leeway=JWT_LEEWAY_SECONDS,
+            options={"verify_aud": False, "require": ["exp", "sub"]},
+        )
+    except pyjwt.InvalidTokenError as e:
+        raise InvalidToken(str(e))
+    return _check_claims(claims)
+
+
+def _claims_to_user(claims: dict) -> Dict[str, Any]:
+    """JWT のクレームから supabase.auth.get_user と同じ形のユーザー情報を組み立てる"""
+    return {
+        "id": claims["sub"],
+        "aud": claims.get("aud"),
+        "role": claims.get("role"),
+        "email": claims.get("email"),
+        "phone": claims.get("phone"),
+        "app_metadata": claims.get("app_metadata") or {},
+        "user_metadata": claims.get("user_metadata") or {},
+        "is_anonymous": claims.get("is_anonymous", False),
+    }
+
+
+def verify_token_locally(token: str) -> Optional[Dict[str, Any]]:
+    """
+    JWT を署名・exp・aud でローカル検証する。
+    ローカルで判断できない（秘密鍵未設定・JWT 形式でない・JWKS 取得不可）場合は None、
+    無効と判断できた場合は InvalidToken を送出する。
+    """
+    if token.count(".") != 2:
+        return None
+    try:
+        header = json.loads(_b64url_decode(token.split(".")[0]))
+    except ValueError:
+        return None
+
+    alg = header.get("alg")
+    if alg == "HS256" and SUPABASE_JWT_SECRET:
+        claims = _decode_hs256(token)
+    elif alg in ("RS256", "ES256"):
+        claims = _decode_jwks(token, alg)
+    else:
+        claims = None
+    return _claims_to_user(claims) if claims is not None else None
+
+
+# ============================================================
+# トークン検証（ローカル → キャッシュ → Supabase）
+# ============================================================
+def verify_token_remote(token: str) -> Optional[Dict[str, Any]]:
+    """Supabase にトークンを問い合わせる（失効済みセッションも検出できる）"""
+    with SUPABASE_CALL_SECONDS.time(call="auth.get_user"):
+        response = supabase.auth.get_user(token)
+    ok = bool(response and response.user)
+    TOKEN_VERIFICATIONS.inc(method="remote", result="ok" if ok else "invalid")
+    return response.user.model_dump() if ok else None
+
+
+def verify_token(token: str) -> Optional[Dict[str, Any]]:
+    """
+    トークンを検証してユーザー情報を返す（無効なら None）。
+
+    1. ローカル検証できればそれを使う（ネットワーク呼び出しなし）
+    2. できなければ Supabase に問い合わせ、結果を exp と AUTH_TOKEN_CACHE_TTL の
+       早い方までキャッシュする
+
+    ローカル検証はログアウト済みのセッションを検出できないため、
+    パスワード変更など失効に敏感な操作は get_current_user_strict を使うこと。
+    """
+    try:
+        user = verify_token_locally(token)
+    except InvalidToken as e:
+        TOKEN_VERIFICATIONS.inc(method="local", result="invalid")
+        logger.info("トークン検証失敗: %s", e)
+        return None
+    if user is not None:
+        TOKEN_VERIFICATIONS.inc(method="local", result="ok")
+        return user
+
+    key = _token_key(token)
+    cached = _token_cache.get(key)
+    if cached is not None:
+        return cached
+
+    user = verify_token_remote(token)
+    if user is None:
+        return None
+    exp = _token_exp(token)
+    ttl = None if exp is None else exp - time.time()
+    _token_cache.set(key, user, ttl=ttl)
+    return user
+
+
+def invalidate_user_tokens(user_id: str) -> None:
+    """ログアウト・パスワード変更時に、そのユーザーの検証済みトークンを捨てる"""
+    _token_cache.invalidate_where(lambda _key, user: user.get("id") == user_id)
+
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
     """
@@ -26,14 +234,14 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
     token = credentials.credentials
     
     try:
-        # Supabaseでトークンを検証
-        user = supabase.auth.get_user(token)
+        # Supabaseでトークンを検証（検証済みならキャッシュから）
+        user = verify_token(token)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="無効なトークンです"
             )
-        return user.user.model_dump()
+        return user
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -50,12 +258,31 @@ def get_optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depe
         return None
     
     try:
-        user = supabase.auth.get_user(credentials.credentials)
-        return user.user.model_dump() if user else None
+        return verify_token(credentials.credentials)
     except Exception:
         return None
 
 
+def get_current_user_strict(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
+    """
+    get_current_user と同じだが、ローカル検証・キャッシュを使わず必ず Supabase に問い合わせる。
+    ログアウト済みセッションのトークンを拒否する必要がある操作（パスワード変更など）用。
+    """
+    try:
+        user = verify_token_remote(credentials.credentials)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="無効なトークンです"
+            )
+        return user
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"認証エラー: {str(e)}"
+        )
+
+
 # ============================================================
 # 認証関連の関数
 # ============================================================
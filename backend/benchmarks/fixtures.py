@@ -0,0 +1,176 @@
+"""
+fixtures.py — ベンチマーク用の合成歌声
+
+乱数シード固定で毎回同じ波形を生成する。各フィクスチャは波形と一緒に
+10ms 単位の正解 f0 / 声区ラベルを持つので、CREPE の代わりにスタブの f0 を
+流し込んだり、解析結果と正解を突き合わせたりできる。
+
+  - 地声:  倍音が豊富（H1〜H20、-6dB/oct 程度の減衰、H2 が強い）
+  - 裏声:  基音中心のサイン波に近い音色 + 息漏れノイズ
+  - グライド（しゃくり・フォール）、ビブラート、無音区間、背景ノイズ
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+
+FRAME_SEC = 0.01   # 正解トラックの時間分解能（CREPE_HOP_LENGTH=160 @16kHz と同じ）
+
+
+@dataclass
+class Note:
+    """1区間の発声。f0_end を指定するとその区間で f0_start → f0_end へ対数的に移行する"""
+    register: str              # "chest" / "falsetto" / "silence"
+    seconds: float
+    f0_start: float = 0.0
+    f0_end: float | None = None
+    vibrato_hz: float = 0.0
+    vibrato_cents: float = 0.0
+
+
+@dataclass
+class Fixture:
+    name: str
+    y: np.ndarray              # float32 モノラル
+    sr: int
+    f0: np.ndarray             # FRAME_SEC ごとの正解 f0（無音は 0）
+    register: np.ndarray       # FRAME_SEC ごとの正解ラベル
+    notes: list = field(default_factory=list, repr=False)
+
+    @property
+    def duration(self) -> float:
+        return len(self.y) / self.sr
+
+    def f0_at(self, times: np.ndarray) -> np.ndarray:
+        """任意の時刻列での正解 f0（最近傍フレーム）"""
+        idx = np.clip(np.round(times / FRAME_SEC).astype(int), 0, len(self.f0) - 1)
+        return self.f0[idx]
+
+
+# ============================================================
+# 音色
+# ============================================================
+# 倍音ごとの振幅（dB）。地声は H2 が H1 と同程度、裏声は H1 が突出する
+_CHEST_HARMONICS_DB = np.array([0, -1, -6, -9, -12, -14, -17, -19, -21, -23,
+                                -25, -27, -29, -31, -33, -35, -37, -39, -41, -43], dtype=np.float64)
+_FALSETTO_HARMONICS_DB = np.array([0, -15, -26, -36, -45], dtype=np.float64)
+
+
+def _f0_curve(note: Note, n: int, sr: int) -> np.ndarray:
+    t = np.arange(n) / sr
+    if note.f0_end is None or note.f0_end == note.f0_start:
+        f0 = np.full(n, note.f0_start)
+    else:
+        f0 = note.f0_start * (note.f0_end / note.f0_start) ** (t / max(note.seconds, 1e-9))
+    if note.vibrato_hz > 0 and note.vibrato_cents > 0:
+        f0 = f0 * 2 ** (note.vibrato_cents / 1200 * np.sin(2 * np.pi * note.vibrato_hz * t))
+    return f0
+
+
+def _render(note: Note, sr: int, rng: np.random.Generator) -> tuple:
+    n = int(round(note.seconds * sr))
+    if note.register == "silence":
+        return np.zeros(n), np.zeros(n)
+
+    f0 = _f0_curve(note, n, sr)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    table = _CHEST_HARMONICS_DB if note.register == "chest" else _FALSETTO_HARMONICS_DB
+    y = np.zeros(n)
+    for k, db in enumerate(table, start=1):
+        # ナイキストを超える倍音は鳴らさない
+        audible = (f0 * k) < (sr / 2 - 200)
+        y += np.where(audible, 10 ** (db / 20) * np.sin(k * phase), 0.0)
+    if note.register == "falsetto":
+        y += 0.03 * rng.standard_normal(n)   # 息漏れ
+
+    # アタック/リリース 20ms（クリック防止）
+    ramp = min(int(0.02 * sr), n // 2)
+    if ramp > 0:
+        env = np.ones(n)
+        env[:ramp] = np.linspace(0, 1, ramp)
+        env[-ramp:] = np.linspace(1, 0, ramp)
+        y *= env
+    return y, f0
+
+
+def synthesize(name: str, notes: list, sr: int = 44100, snr_db: float | None = 30.0,
+               seed: int = 0) -> Fixture:
+    """Note の列から波形と正解トラックを作る"""
+    rng = np.random.default_rng(seed)
+    ys, f0s, regs = [], [], []
+    for note in notes:
+        y, f0 = _render(note, sr, rng)
+        ys.append(y)
+        f0s.append(f0)
+        regs.append(np.full(len(y), note.register, dtype=object))
+    y = np.concatenate(ys)
+    f0 = np.concatenate(f0s)
+    reg = np.concatenate(regs)
+
+    peak = np.max(np.abs(y)) or 1.0
+    y = 0.5 * y / peak
+    if snr_db is not None:
+        signal_rms = np.sqrt(np.mean(y[f0 > 0] ** 2)) if np.any(f0 > 0) else 0.1
+        y = y + signal_rms * 10 ** (-snr_db / 20) * rng.standard_normal(len(y))
+
+    hop = int(round(FRAME_SEC * sr))
+    return Fixture(
+        name=name,
+        y=y.astype(np.float32),
+        sr=sr,
+        f0=f0[::hop].astype(np.float64),
+        register=reg[::hop],
+        notes=list(notes),
+    )
+
+
+# ============================================================
+# シナリオ
+# ============================================================
+def _phrase(rng: np.random.Generator, base_hz: float) -> list:
+    """地声の中低音 → しゃくり上げ → 裏声の高音 → フォール、の1フレーズ"""
+    low = base_hz * 2 ** (rng.integers(-3, 4) / 12)
+    return [
+        Note("chest", 1.2, low, vibrato_hz=5.5, vibrato_cents=30),
+        Note("chest", 0.4, low, low * 2 ** (5 / 12)),                    # グライド
+        Note("chest", 1.0, low * 2 ** (5 / 12), vibrato_hz=5.8, vibrato_cents=40),
+        Note("silence", 0.3),
+        Note("falsetto", 1.2, low * 2 ** (14 / 12), vibrato_hz=5.0, vibrato_cents=25),
+        Note("falsetto", 0.5, low * 2 ** (14 / 12), low * 2 ** (9 / 12)),  # フォール
+        Note("silence", 0.4),
+    ]
+
+
+def _song(name: str, seconds: float, base_hz: float, sr: int, seed: int) -> Fixture:
+    rng = np.random.default_rng(seed)
+    notes, total = [], 0.0
+    while total < seconds:
+        phrase = _phrase(rng, base_hz)
+        notes.extend(phrase)
+        total += sum(n.seconds for n in phrase)
+    return synthesize(name, notes, sr=sr, snr_db=25.0, seed=seed)
+
+
+SCENARIOS = {
+    "chest_5s": lambda sr: synthesize("chest_5s", [
+        Note("chest", 2.0, 130.8),
+        Note("chest", 1.0, 130.8, 196.0),
+        Note("chest", 2.0, 196.0, vibrato_hz=5.5, vibrato_cents=35),
+    ], sr=sr, seed=1),
+    "falsetto_5s": lambda sr: synthesize("falsetto_5s", [
+        Note("falsetto", 2.5, 523.3, vibrato_hz=5.0, vibrato_cents=30),
+        Note("falsetto", 2.5, 587.3, 440.0),
+    ], sr=sr, seed=2),
+    "mixed_30s": lambda sr: _song("mixed_30s", 30, 146.8, sr, seed=3),
+    "mixed_120s": lambda sr: _song("mixed_120s", 120, 146.8, sr, seed=4),
+    "long_600s": lambda sr: _song("long_600s", 600, 130.8, sr, seed=5),
+}
+
+# 既定で回すシナリオ（long_600s は --scenarios で明示したときだけ）
+DEFAULT_SCENARIOS = ["chest_5s", "falsetto_5s", "mixed_30s", "mixed_120s"]
+
+
+def build(name: str, sr: int = 44100) -> Fixture:
+    if name not in SCENARIOS:
+        raise ValueError(f"未知のシナリオです: {name} (候補: {', '.join(SCENARIOS)})")
+    return SCENARIOS[name](sr)
@@ -0,0 +1,202 @@
+"""
+load_test.py — API の負荷試験ドライバー
+
+起動済みの API に対して、楽曲検索・おすすめ・お気に入り・解析の混合トラフィックを
+同時接続数 --concurrency で --duration 秒間流し、ルートごとの p50/p95/p99 と
+スループットを出力する。
+
+外部サービスなしで回す場合は、インメモリの Supabase で API を起動する:
+  cd backend
+  SUPABASE_BACKEND=memory SUPABASE_MEMORY_LATENCY_MS=30 uvicorn main:app --workers 1
+  python benchmarks/load_test.py --concurrency 32 --duration 60 --out load.json
+
+  （インメモリの Supabase はワーカーごとに別データなので、--workers 1 で起動するか
+    ログイン系のルートを --mix で外すこと）
+
+--mix でトラフィック比率を変えられる（例: --mix songs=5,recommend=3,favorites=2,analyze=0）。
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import random
+import statistics
+import struct
+import time
+import uuid
+import wave
+
+import httpx
+
+DEFAULT_MIX = {"songs": 40, "recommend": 30, "favorites": 20, "analyze": 10}
+SEARCH_QUERIES = ["Lemon", "米津", "ミセス", "back number", "あいみょん", "ヨルシカ", "a", "存在しない曲名xyz"]
+
+
+# ============================================================
+# テスト用データ
+# ============================================================
+def make_wav(seconds: float = 3.0, f0: float = 220.0, sr: int = 16000) -> bytes:
+    """倍音付きの持続音（標準ライブラリのみで生成）"""
+    n = int(seconds * sr)
+    frames = bytearray()
+    for i in range(n):
+        t = i / sr
+        v = sum(0.5 / k * math.sin(2 * math.pi * f0 * k * t) for k in range(1, 6))
+        frames += struct.pack("<h", int(max(-1.0, min(1.0, v * 0.6)) * 32767))
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(bytes(frames))
+    return buf.getvalue()
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo, hi = math.floor(k), math.ceil(k)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+# ============================================================
+# シナリオ
+# ============================================================
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, wav: bytes, users: int):
+        self.client = client
+        self.wav = wav
+        self.n_users = users
+        self.tokens: list = []
+        self.samples: dict = {}   # route -> [(秒, ステータス)]
+
+    async def setup_users(self) -> None:
+        """お気に入り系のためのユーザーを登録（インメモリ Supabase なら即座にセッションが返る）"""
+        for _ in range(self.n_users):
+            email = f"load-{uuid.uuid4().hex[:10]}@example.com"
+            resp = await self.client.post("/auth/signup", json={"email": email, "password": "loadtest-pass"})
+            session = (resp.json() or {}).get("session") if resp.status_code == 200 else None
+            if session and session.get("access_token"):
+                self.tokens.append(session["access_token"])
+        if not self.tokens:
+            print("[WARN] ユーザーを登録できませんでした。favorites は匿名のまま 401 として計測されます")
+
+    def _auth(self) -> dict:
+        return {"Authorization": f"Bearer {random.choice(self.tokens)}"} if self.tokens else {}
+
+    async def _timed(self, route: str, coro) -> None:
+        t0 = time.perf_counter()
+        try:
+            resp = await coro
+            status = resp.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.samples.setdefault(route, []).append((time.perf_counter() - t0, status))
+
+    async def songs(self) -> None:
+        q = random.choice(SEARCH_QUERIES)
+        await self._timed("GET /songs?q=", self.client.get("/songs", params={"q": q, "limit": 20}))
+
+    async def recommend(self) -> None:
+        low = random.uniform(90, 140)
+        params = {"chest_min_hz": low, "chest_max_hz": low * 3, "chest_avg_hz": low * 1.8,
+                  "falsetto_max_hz": low * 4.5}
+        await self._timed("GET /recommend",
+                          self.client.get("/recommend", params=params, headers=self._auth()))
+
+    async def favorites(self) -> None:
+        headers = self._auth()
+        if random.random() < 0.3:
+            body = {"song_id": random.randint(1, 3900)}
+            await self._timed("POST /favorites", self.client.post("/favorites", json=body, headers=headers))
+        else:
+            await self._timed("GET /favorites", self.client.get("/favorites", headers=headers))
+
+    async def analyze(self) -> None:
+        files = {"file": ("load.wav", self.wav, "audio/wav")}
+        await self._timed("POST /analyze", self.client.post("/analyze", files=files, timeout=300))
+
+    async def worker(self, mix: dict, deadline: float) -> None:
+        names, weights = zip(*[(k, v) for k, v in mix.items() if v > 0])
+        while time.perf_counter() < deadline:
+            await getattr(self, random.choices(names, weights)[0])()
+
+    def report(self, elapsed: float) -> dict:
+        routes = {}
+        for route, samples in sorted(self.samples.items()):
+            latencies = sorted(s for s, _ in samples)
+            errors = sum(1 for _, st in samples if not (isinstance(st, int) and st < 400))
+            routes[route] = {
+                "requests": len(samples),
+                "errors": errors,
+                "throughput_rps": round(len(samples) / elapsed, 2),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+                "mean_ms": round(statistics.fmean(latencies) * 1000, 1),
+            }
+        total = sum(r["requests"] for r in routes.values())
+        return {"elapsed_s": round(elapsed, 1), "total_requests": total,
+                "throughput_rps": round(total / elapsed, 2), "routes": routes}
+
+
+def parse_mix(text: str | None) -> dict:
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"未知のルートです: {name} (候補: {', '.join(DEFAULT_MIX)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def run(args) -> dict:
+    random.seed(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        test = LoadTest(client, make_wav(args.wav_seconds), args.users)
+        mix = parse_mix(args.mix)
+        if mix.get("favorites") or mix.get("recommend"):
+            await test.setup_users()
+
+        deadline = time.perf_counter() + args.duration
+        t0 = time.perf_counter()
+        await asyncio.gather(*(test.worker(mix, deadline) for _ in range(args.concurrency)))
+        return test.report(time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API の負荷試験")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=16, help="同時接続数")
+    parser.add_argument("--duration", type=float, default=30.0, help="計測時間（秒）")
+    parser.add_argument("--users", type=int, default=20, help="事前に登録するユーザー数")
+    parser.add_argument("--mix", help="ルートの比率 (例: songs=4,recommend=3,favorites=2,analyze=1)")
+    parser.add_argument("--wav-seconds", type=float, default=3.0, help="/analyze に送る WAV の長さ")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="結果 JSON の出力先")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    report["config"] = {k: getattr(args, k) for k in ("url", "concurrency", "duration", "users", "mix")}
+
+    print(f"{'route':<20}{'req':>7}{'err':>6}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for route, r in report["routes"].items():
+        print(f"{route:<20}{r['requests']:>7}{r['errors']:>6}{r['throughput_rps']:>8}"
+              f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}")
+    print(f"[INFO] 合計 {report['total_requests']} リクエスト / {report['elapsed_s']}秒 "
+          f"({report['throughput_rps']} req/s)")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[INFO] 結果を保存: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+run_benchmarks.py — 解析パイプラインのベンチマーク
+
+合成歌声（fixtures.py）で以下を計測し、結果を JSON に書き出す。
+
+  analyze/<シナリオ>/<ステージ>   analyzer.analyze のステージ別時間と最大 RSS の伸び（tracing の計測をそのまま使う）
+  classify_register/<シナリオ>    1フレームあたりの地声/裏声判定時間（classify_registers でまとめて判定）
+  extract_features/<シナリオ>     1フレームあたりの特徴量抽出時間
+  online_stats/<シナリオ>         online_stats（ヒストグラム）とバッチの統計の差 (error_cents) と集計時間
+  recommend_songs                 おすすめ曲計算1回あたり
+  search_songs                    楽曲検索1回あたり
+
+各項目は --repeat 回の中央値 (median_ms) と実時間比 (rtf = 処理時間 / 音声長) を持つ。
+thresholds.json の上限や --baseline で渡した前回結果と比べて悪化していれば終了コード 1 を返す。
+
+使い方:
+  cd backend
+  python benchmarks/run_benchmarks.py --stub-f0                  # CREPE を使わない（CPU のみの CI 向け）
+  python benchmarks/run_benchmarks.py --out results.json
+  python benchmarks/run_benchmarks.py --baseline results.json --max-regression 0.2
+  python benchmarks/run_benchmarks.py --scenarios long_600s --repeat 1
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# benchmarks/ から実行時に親ディレクトリ (backend/) のモジュールを見つける
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_HERE, ".."))
+
+import fixtures  # noqa: E402  (benchmarks/ 自身)
+from config import CREPE_HOP_LENGTH, CREPE_SR  # noqa: E402
+
+DEFAULT_THRESHOLDS = os.path.join(_HERE, "thresholds.json")
+SEARCH_QUERIES = ["Lemon", "米津", "ミセス", "a", "あいみょん", "存在しない曲名xyz"]
+
+
+# ============================================================
+# 計測ヘルパー
+# ============================================================
+def _median_ms(samples: list) -> float:
+    return round(statistics.median(samples) * 1000, 3)
+
+
+def _time_calls(fn, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def make_stub_f0(fixture: fixtures.Fixture):
+    """analyzer.run_crepe の代わりに正解 f0 を返す関数（CREPE のモデルを使わない）"""
+    import torch
+
+    def stub_run_crepe(audio_tensor, sr, hop_length, device, model_size="tiny"):
+        n_frames = 1 + audio_tensor.shape[-1] // hop_length
+        times = np.arange(n_frames) * hop_length / sr
+        f0 = fixture.f0_at(times)
+        conf = np.where(f0 > 0, 0.9, 0.05)
+        return (torch.from_numpy(f0.astype(np.float32)).unsqueeze(0),
+                torch.from_numpy(conf.astype(np.float32)).unsqueeze(0))
+
+    return stub_run_crepe
+
+
+# ============================================================
+# 個別ベンチマーク
+# ============================================================
+def bench_analyze(fixture: fixtures.Fixture, repeat: int, stub_f0: bool) -> dict:
+    import soundfile as sf
+    import analyzer
+    from tracing import start_trace
+
+    original = analyzer.run_crepe
+    if stub_f0:
+        analyzer.run_crepe = make_stub_f0(fixture)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            wav_path = os.path.join(tmp, f"{fixture.name}.wav")
+            sf.write(wav_path, fixture.y, fixture.sr)
+
+            per_stage: dict = {}
+            peak_growth: dict = {}
+            totals, result = [], {}
+            for _ in range(repeat):
+                with start_trace(f"bench_{fixture.name}") as trace:
+                    result = analyzer.analyze(wav_path)
+                totals.append(trace.total_seconds)
+                for stage in trace.stages:
+                    per_stage.setdefault(stage["name"], []).append(stage["ms"] / 1000)
+                    if stage.get("peak_growth_mb") is not None:
+                        peak_growth[stage["name"]] = max(peak_growth.get(stage["name"], 0.0),
+                                                         stage["peak_growth_mb"])
+    finally:
+        analyzer.run_crepe = original
+
+    out = {}
+    for name, samples in per_stage.items():
+        out[f"analyze/{fixture.name}/{name}"] = {
+            "median_ms": _median_ms(samples),
+            "rtf": round(statistics.median(samples) / fixture.duration, 5),
+        }
+        if name in peak_growth:
+            out[f"analyze/{fixture.name}/{name}"]["peak_growth_mb"] = peak_growth[name]
+    out[f"analyze/{fixture.name}/total"] = {
+        "median_ms": _median_ms(totals),
+        "rtf": round(statistics.median(totals) / fixture.duration, 5),
+        "result": {k: result.get(k) for k in (
+            "overall_min", "overall_max", "chest_max", "falsetto_max",
+            "chest_ratio", "falsetto_ratio", "error",
+        ) if k in result},
+    }
+    return out
+
+
+def _voiced_frames(fixture: fixtures.Fixture, max_frames: int) -> list:
+    """判定に使う (16kHz 波形, f0) のフレーム（analyzer と同じ 2048 サンプル窓）"""
+    from analyzer import _resample
+
+    y16 = _resample(fixture.y.astype(np.float32), fixture.sr, CREPE_SR)
+    frame_len = 2048
+    frames = []
+    step = max(1, int(np.count_nonzero(fixture.f0 > 0) // max_frames))
+    for i in np.flatnonzero(fixture.f0 > 0)[::step][:max_frames]:
+        center = i * CREPE_HOP_LENGTH
+        start = max(0, center - frame_len // 2)
+        seg = y16[start:start + frame_len]
+        if len(seg) == frame_len:
+            frames.append((seg, float(fixture.f0[i])))
+    return frames
+
+
+def bench_frames(fixture: fixtures.Fixture, repeat: int, max_frames: int) -> dict:
+    from feature_extractor import extract_features
+    from register_classifier import classify_registers, new_register_stats
+
+    frames = _voiced_frames(fixture, max_frames)
+    if not frames:
+        return {}
+    median_f0 = float(np.median([f0 for _, f0 in frames]))
+
+    def run_classify():
+        classify_registers([(seg, f0, 0.9) for seg, f0 in frames], CREPE_SR, median_f0,
+                           stats=new_register_stats())
+
+    def run_features():
+        for seg, f0 in frames:
+            extract_features(seg, CREPE_SR, f0)
+
+    out = {}
+    for key, fn in (("classify_register", run_classify), ("extract_features", run_features)):
+        samples = [s / len(frames) for s in _time_calls(fn, repeat)]
+        out[f"{key}/{fixture.name}"] = {"median_ms": _median_ms(samples), "frames": len(frames)}
+    return out
+
+
+def bench_online_stats(fixture: fixtures.Fixture, repeat: int) -> dict:
+    """
+    正解 f0（1%をオクターブ上の誤検出に置き換え、信頼度は 0.5〜1.0 の乱数）について、
+    重み付き中央値・P97・外れ値除去後の最低音/最高音をバッチ（analyzer）と online_stats で求め、
+    差の最大値をセントで返す（median_ms は online_stats 側の追加＋集計時間、batch_ms はバッチ側）。
+    """
+    from analyzer import (
+        weighted_median, remove_statistical_outliers, remove_isolated_extremes, _get_robust_max,
+    )
+    from online_stats import SemitoneHistogram, summarize_range
+    from config import CHEST_OUTLIER_PERCENTILE, CHEST_OUTLIER_GAP_ST
+
+    rng = np.random.default_rng(0)
+    notes = fixture.f0[fixture.f0 > 0].astype(np.float64)
+    if len(notes) == 0:
+        return {}
+    glitch = rng.random(len(notes)) < 0.01
+    notes = np.where(glitch, notes * 2, notes)
+    conf = rng.uniform(0.5, 1.0, len(notes))
+
+    def run_batch():
+        cleaned = remove_isolated_extremes(remove_statistical_outliers(
+            notes.tolist(), CHEST_OUTLIER_PERCENTILE, CHEST_OUTLIER_GAP_ST))
+        return {
+            "weighted_median": float(weighted_median(notes, conf)),
+            "p97": float(np.percentile(notes, CHEST_OUTLIER_PERCENTILE)),
+            "min": float(min(cleaned)),
+            "robust_max": float(_get_robust_max(cleaned)),
+        }
+
+    def run_online():
+        hist = SemitoneHistogram()
+        hist.add(notes, conf)
+        summary = summarize_range(hist, CHEST_OUTLIER_PERCENTILE, CHEST_OUTLIER_GAP_ST)
+        return {
+            "weighted_median": hist.quantile(0.5, weighted=True),
+            "p97": hist.percentile(CHEST_OUTLIER_PERCENTILE),
+            "min": summary["min_hz"],
+            "robust_max": summary["max_hz"],
+        }
+
+    batch, online = run_batch(), run_online()
+    errors = {k: round(abs(1200 * np.log2(online[k] / batch[k])), 2) for k in batch}
+    return {
+        f"online_stats/{fixture.name}": {
+            "median_ms": _median_ms(_time_calls(run_online, repeat)),
+            "batch_ms": _median_ms(_time_calls(run_batch, repeat)),
+            "error_cents": max(errors.values()),
+            "errors": errors,
+            "frames": len(notes),
+        }
+    }
+
+
+def bench_catalogue(repeat: int) -> dict:
+    from database import search_songs
+    from recommender import recommend_songs
+
+    def run_search():
+        for q in SEARCH_QUERIES:
+            search_songs(q)
+
+    def run_recommend():
+        recommend_songs(chest_min_hz=110.0, chest_max_hz=392.0, chest_avg_hz=220.0,
+                        falsetto_max_hz=587.3, favorite_artist_ids=[1, 2, 3])
+
+    search = [s / len(SEARCH_QUERIES) for s in _time_calls(run_search, repeat)]
+    return {
+        "search_songs": {"median_ms": _median_ms(search)},
+        "recommend_songs": {"median_ms": _median_ms(_time_calls(run_recommend, repeat))},
+    }
+
+
+# ============================================================
+# 閾値チェック
+# ============================================================
+def check_regressions(results: dict, thresholds: dict, baseline: dict | None,
+                      max_regression: float) -> list:
+    """違反メッセージのリストを返す（空なら合格）"""
+    problems = []
+    for key, limits in thresholds.items():
+        entry = results.get(key)
+        if entry is None:
+            continue
+        for metric, limit in limits.items():
+            value = entry.get(metric.removeprefix("max_"))
+            if value is not None and value > limit:
+                problems.append(f"{key}: {metric.removeprefix('max_')}={value} > 上限 {limit}")
+
+    if baseline:
+        for key, entry in results.items():
+            prev = baseline.get(key, {}).get("median_ms")
+            if prev and prev > 0 and entry["median_ms"] > prev * (1 + max_regression):
+                problems.append(
+                    f"{key}: {entry['median_ms']}ms (前回 {prev}ms, +{entry['median_ms'] / prev - 1:.0%})"
+                )
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析パイプラインのベンチマーク")
+    parser.add_argument("--scenarios", nargs="+", default=fixtures.DEFAULT_SCENARIOS,
+                        help=f"シナリオ ({', '.join(fixtures.SCENARIOS)})")
+    parser.add_argument("--repeat", type=int, default=3, help="各計測の繰り返し回数（中央値を採用）")
+    parser.add_argument("--sr", type=int, default=44100, help="フィクスチャのサンプリングレート")
+    parser.add_argument("--stub-f0", action="store_true",
+                        help="CREPE の代わりに正解 f0 を返すスタブを使う")
+    parser.add_argument("--frames", type=int, default=300, help="フレーム単位ベンチのフレーム数")
+    parser.add_argument("--skip-analyze", action="store_true", help="analyze の計測を省く")
+    parser.add_argument("--out", help="結果 JSON の出力先（省略時は標準出力のみ）")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS, help="上限値の JSON")
+    parser.add_argument("--baseline", help="比較する前回の結果 JSON")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="前回比で許容する悪化率（0.25 = 25%%）")
+    args = parser.parse_args()
+
+    results: dict = {}
+    for name in args.scenarios:
+        fixture = fixtures.build(name, sr=args.sr)
+        print(f"[INFO] {name}: {fixture.duration:.1f}秒")
+        if not args.skip_analyze:
+            results.update(bench_analyze(fixture, args.repeat, args.stub_f0))
+        results.update(bench_frames(fixture, args.repeat, args.frames))
+        results.update(bench_online_stats(fixture, args.repeat))
+    results.update(bench_catalogue(args.repeat))
+
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "stub_f0": args.stub_f0,
+            "repeat": args.repeat,
+            "sr": args.sr,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[INFO] 結果を保存: {args.out}")
+    else:
+        print(text)
+
+    thresholds = {}
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds, encoding="utf-8") as f:
+            thresholds = json.load(f)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    problems = check_regressions(results, thresholds, baseline, args.max_regression)
+    for p in problems:
+        print(f"[ERROR] {p}")
+    if not problems:
+        print("[OK] 閾値内です")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
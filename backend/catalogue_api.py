@@ -0,0 +1,404 @@
+"""
+catalogue_api.py — 楽曲カタログ・認証・ユーザーデータ系のエンドポイント
+
+SQLite / Supabase へのクエリのみで完結する軽量なエンドポイント群。
+音声解析スタック（torch 等）は一切 import しないため、安価なプロセスで多数のワーカーを動かせる。
+
+単独起動:
+  uvicorn catalogue_api:app --host 0.0.0.0 --port 8001 --workers 8
+"""
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+
+# recommender 関数群（おすすめ曲・キー・声質タイプ）
+from recommender import (
+    recommend_songs, recommend_key_for_song,
+    find_similar_artists, enrich_analysis_result,
+)
+
+# 楽曲データはローカル SQLite（songs.db に5000曲入ってる）
+from database import get_all_songs, search_songs, count_songs, get_artists, get_artist_songs, count_artists, search_artists
+
+# 認証・ユーザー系は Supabase（非同期クライアント。ネットワーク待ちでスレッドを占有しない）
+from database_supabase_async import (
+    get_user_profile, update_user_profile, update_vocal_range,
+    create_analysis_record, get_analysis_history, get_analysis_record, delete_analysis_record,
+    get_integrated_vocal_range,
+    add_favorite_song, remove_favorite_song, get_favorite_songs, is_favorite,
+    # お気に入りアーティスト
+    add_favorite_artist, remove_favorite_artist,
+    get_favorite_artists, is_favorite_artist, get_favorite_artist_ids,
+)
+from supabase_queries import slim_result_json
+
+# 認証関連
+from auth import (
+    get_current_user, get_optional_user, get_current_user_strict,
+    sign_up_with_email, sign_in_with_email, sign_out,
+    refresh_session, request_password_reset, update_password,
+    invalidate_user_tokens,
+)
+
+# Pydanticモデル
+from models import (
+    SignUpRequest, SignInRequest, RefreshTokenRequest,
+    PasswordResetRequest, PasswordUpdateRequest,
+    UserProfileUpdate, VocalRangeUpdate,
+    AnalysisCreate, FavoriteSongAdd,
+    FavoriteArtistAdd,
+)
+from app_factory import create_app
+
+router = APIRouter()
+
+# ============================================================
+# 認証エンドポイント
+# ============================================================
+
+@router.post("/auth/signup")
+def signup(data: SignUpRequest):
+    """メールアドレスでユーザー登録"""
+    return sign_up_with_email(data.email, data.password, data.display_name)
+
+
+@router.post("/auth/signin")
+def signin(data: SignInRequest):
+    """メールアドレスでログイン"""
+    return sign_in_with_email(data.email, data.password)
+
+
+@router.post("/auth/signout")
+def signout_endpoint(user: dict = Depends(get_current_user)):
+    """ログアウト"""
+    sign_out(user.get("id"))
+    invalidate_user_tokens(user["id"])
+    return {"message": "ログアウトしました"}
+
+
+@router.post("/auth/refresh")
+def refresh(data: RefreshTokenRequest):
+    """セッションをリフレッシュ"""
+    return refresh_session(data.refresh_token)
+
+
+@router.post("/auth/reset-password")
+def reset_password(data: PasswordResetRequest):
+    """パスワードリセットメールを送信"""
+    success = request_password_reset(data.email)
+    if success:
+        return {"message": "パスワードリセットメールを送信しました"}
+    raise HTTPException(status_code=400, detail="メール送信に失敗しました")
+
+
+@router.post("/auth/update-password")
+def update_password_endpoint(data: PasswordUpdateRequest, user: dict = Depends(get_current_user_strict)):
+    """パスワードを更新（要ログイン）"""
+    success = update_password(user.get("id"), data.new_password)
+    if success:
+        invalidate_user_tokens(user["id"])
+        return {"message": "パスワードを更新しました"}
+    raise HTTPException(status_code=400, detail="パスワード更新に失敗しました")
+
+
+# ============================================================
+# ユーザープロファイル
+# ============================================================
+
+@router.get("/profile/me")
+async def get_my_profile(user: dict = Depends(get_current_user)):
+    """自分のプロファイルを取得"""
+    profile = await get_user_profile(user["id"])
+    if not profile:
+        raise HTTPException(status_code=404, detail="プロファイルが見つかりません")
+    return profile
+
+
+@router.put("/profile/me")
+async def update_my_profile(data: UserProfileUpdate, user: dict = Depends(get_current_user)):
+    """自分のプロファイルを更新"""
+    profile = await update_user_profile(user["id"], data.model_dump(exclude_none=True))
+    return profile
+
+
+@router.put("/profile/vocal-range")
+async def update_my_vocal_range(data: VocalRangeUpdate, user: dict = Depends(get_current_user)):
+    """自分の声域情報を更新"""
+    result = await update_vocal_range(
+        user["id"],
+        data.vocal_range_min,
+        data.vocal_range_max,
+        data.falsetto_max
+    )
+    return result
+
+
+# ============================================================
+# 分析履歴
+# ============================================================
+
+@router.post("/analysis")
+async def create_analysis(data: AnalysisCreate, user: dict = Depends(get_current_user)):
+    """分析履歴を保存（履歴の作成と最新声域の更新は独立なので並行に実行）"""
+    record, _ = await asyncio.gather(
+        create_analysis_record(
+            user["id"],
+            data.vocal_range_min,
+            data.vocal_range_max,
+            data.falsetto_max,
+            data.source_type,
+            data.file_name
+        ),
+        update_vocal_range(
+            user["id"],
+            data.vocal_range_min,
+            data.vocal_range_max,
+            data.falsetto_max
+        ),
+    )
+
+    return record
+
+
+@router.get("/analysis/history")
+async def get_my_analysis_history(
+    user: dict = Depends(get_current_user),
+    limit: int = Query(50, ge=1, le=100),
+    before: str | None = Query(None, description="前ページ最後の created_at（これより古い履歴を返す）"),
+):
+    """自分の分析履歴を取得（新しい順。一覧には result_json を含めない）"""
+    return await get_analysis_history(user["id"], limit, before)
+
+
+@router.get("/analysis/history/{record_id}")
+async def get_my_analysis_record(record_id: str, user: dict = Depends(get_current_user)):
+    """自分の分析履歴1件を取得（おすすめ曲・似てるアーティスト・声質タイプは現在のデータで再計算）"""
+    record = await get_analysis_record(user["id"], record_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="履歴が見つかりません")
+    if record.get("result_json"):
+        fav_ids = await get_favorite_artist_ids(user["id"])
+        record["result_json"] = await run_in_threadpool(
+            enrich_analysis_result, slim_result_json(record["result_json"]), fav_ids,
+        )
+    return record
+
+
+@router.get("/analysis/integrated-range")
+async def get_my_integrated_range(user: dict = Depends(get_current_user), limit: int = Query(20, ge=1, le=100)):
+    """直近N件の分析履歴から統合音域を取得"""
+    result = await get_integrated_vocal_range(user["id"], limit)
+    if not result:
+        raise HTTPException(status_code=404, detail="統合可能な分析データが見つかりません")
+    return result
+
+@router.delete("/analysis/history/{record_id}")
+async def delete_my_analysis_history(record_id: str, user: dict = Depends(get_current_user)):
+    """自分の分析履歴を削除"""
+    success = await delete_analysis_record(user["id"], record_id)
+    if success:
+        return {"message": "履歴を削除しました"}
+    raise HTTPException(status_code=400, detail="履歴の削除に失敗しました")
+
+
+# ============================================================
+# お気に入り楽曲
+# ============================================================
+
+@router.post("/favorites")
+async def add_favorite(data: FavoriteSongAdd, user: dict = Depends(get_current_user)):
+    """お気に入りに楽曲を追加"""
+    result = await add_favorite_song(user["id"], data.song_id)
+    if not result:
+        raise HTTPException(status_code=400, detail="既にお気に入りに登録されています")
+    return result
+
+
+@router.delete("/favorites/{song_id}")
+async def remove_favorite(song_id: int, user: dict = Depends(get_current_user)):
+    """お気に入りから楽曲を削除"""
+    success = await remove_favorite_song(user["id"], song_id)
+    if success:
+        return {"message": "お気に入りから削除しました"}
+    raise HTTPException(status_code=404, detail="お気に入りに登録されていません")
+
+
+@router.get("/favorites")
+async def get_my_favorites(user: dict = Depends(get_current_user), limit: int = 100):
+    """自分のお気に入り楽曲一覧を取得"""
+    return await get_favorite_songs(user["id"], limit)
+
+
+@router.get("/favorites/check/{song_id}")
+async def check_favorite(song_id: int, user: dict = Depends(get_current_user)):
+    """楽曲がお気に入りに登録されているか確認"""
+    return {"is_favorite": await is_favorite(user["id"], song_id)}
+
+
+# ============================================================
+# お気に入りアーティスト
+# ============================================================
+
+@router.post("/favorite-artists")
+async def add_favorite_artist_endpoint(
+    data: FavoriteArtistAdd,
+    user: dict = Depends(get_current_user),
+):
+    """
+    お気に入りアーティストを追加（上限10組）。
+    artist_id と artist_name は /songs?q= などで検索して取得してください。
+    """
+    result = await add_favorite_artist(user["id"], data.artist_id, data.artist_name)
+    if result is None:
+        # 上限 or 重複
+        existing = await is_favorite_artist(user["id"], data.artist_id)
+        if existing:
+            raise HTTPException(status_code=400, detail="既にお気に入りに登録されています")
+        raise HTTPException(status_code=400, detail="お気に入りアーティストは10組まで登録できます")
+    return result
+
+
+@router.delete("/favorite-artists/{artist_id}")
+async def remove_favorite_artist_endpoint(
+    artist_id: int,
+    user: dict = Depends(get_current_user),
+):
+    """お気に入りアーティストを削除"""
+    success = await remove_favorite_artist(user["id"], artist_id)
+    if success:
+        return {"message": "お気に入りから削除しました"}
+    raise HTTPException(status_code=404, detail="お気に入りに登録されていません")
+
+
+@router.get("/favorite-artists")
+async def get_my_favorite_artists(user: dict = Depends(get_current_user)):
+    """自分のお気に入りアーティスト一覧を取得"""
+    return await get_favorite_artists(user["id"])
+
+
+@router.get("/favorite-artists/check/{artist_id}")
+async def check_favorite_artist(artist_id: int, user: dict = Depends(get_current_user)):
+    """アーティストがお気に入りに登録されているか確認"""
+    return {"is_favorite": await is_favorite_artist(user["id"], artist_id)}
+
+
+# ============================================================
+# アーティスト一覧（認証不要）
+# ============================================================
+
+@router.get("/artists")
+def read_artists(
+    limit: int = 10, offset: int = 0, q: str | None = None,
+):
+    """アーティスト一覧を取得（ページネーション対応）"""
+    if q:
+        artists = search_artists(q, limit, offset)
+        total = count_artists(q)
+    else:
+        artists = get_artists(limit, offset)
+        total = count_artists()
+    return {"artists": artists, "total": total}
+
+
+@router.get("/artists/{artist_id}/songs")
+def read_artist_songs(
+    artist_id: int,
+    chest_min_hz: float | None = Query(None),
+    chest_max_hz: float | None = Query(None),
+    falsetto_max_hz: float | None = Query(None),
+):
+    """特定アーティストの楽曲一覧を取得"""
+    songs = get_artist_songs(artist_id)
+    if chest_min_hz and chest_max_hz:
+        effective_max = chest_max_hz
+        if falsetto_max_hz and falsetto_max_hz > chest_max_hz:
+            effective_max = falsetto_max_hz
+        for song in songs:
+            try:
+                key_info = recommend_key_for_song(
+                    song.get("lowest_note"),
+                    song.get("highest_note"),
+                    chest_min_hz,
+                    effective_max,
+                )
+                song.update(key_info)
+            except Exception:
+                song["recommended_key"] = 0
+                song["fit"] = "unknown"
+    return songs
+
+
+# ============================================================
+# 楽曲検索（認証不要）
+# ============================================================
+
+@router.get("/songs")
+def read_songs(
+    limit: int = 20, offset: int = 0, q: str | None = None,
+    chest_min_hz: float | None = Query(None, description="ユーザー地声最低(Hz)"),
+    chest_max_hz: float | None = Query(None, description="ユーザー地声最高(Hz)"),
+    falsetto_max_hz: float | None = Query(None, description="ユーザー裏声最高(Hz)"),
+):
+    if q:
+        songs = search_songs(q, limit, offset)
+        total = count_songs(q)
+    else:
+        songs = get_all_songs(limit, offset)
+        total = count_songs()
+
+    if chest_min_hz and chest_max_hz:
+        effective_max = chest_max_hz
+        if falsetto_max_hz and falsetto_max_hz > chest_max_hz:
+            effective_max = falsetto_max_hz
+        for song in songs:
+            try:
+                key_info = recommend_key_for_song(
+                    song.get("lowest_note"),
+                    song.get("highest_note"),
+                    chest_min_hz,
+                    effective_max,
+                )
+                song.update(key_info)
+            except Exception:
+                song["recommended_key"] = 0
+                song["fit"] = "unknown"
+
+    return {"songs": songs, "total": total}
+
+
+# ============================================================
+# おすすめ曲・似てるアーティスト（単体エンドポイント）
+# ============================================================
+
+@router.get("/recommend")
+async def get_recommendations(
+    chest_min_hz: float = Query(...),
+    chest_max_hz: float = Query(...),
+    chest_avg_hz: float = Query(...),
+    falsetto_max_hz: float | None = Query(None),
+    limit: int = Query(10, ge=1, le=50),
+    user: dict | None = Depends(get_optional_user),
+):
+    """音域Hzを指定しておすすめ曲を取得（ログイン済みならお気に入りアーティスト優先）"""
+    fav_ids = await get_favorite_artist_ids(user["id"]) if user else []
+    # recommender は SQLite + CPU 処理なのでイベントループを止めないようスレッドプールで
+    return await run_in_threadpool(
+        recommend_songs,
+        chest_min_hz, chest_max_hz, chest_avg_hz, falsetto_max_hz,
+        limit=limit, favorite_artist_ids=fav_ids,
+    )
+
+
+@router.get("/similar-artists")
+def get_similar_artists(
+    chest_min_hz: float = Query(...),
+    chest_max_hz: float = Query(...),
+    chest_avg_hz: float = Query(...),
+    limit: int = Query(5, ge=1, le=20),
+):
+    """音域Hzを指定して似てるアーティストを取得"""
+    return find_similar_artists(chest_min_hz, chest_max_hz, chest_avg_hz, limit)
+
+
+app = create_app("Voice Range Catalogue API", router)
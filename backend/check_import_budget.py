@@ -0,0 +1,77 @@
+"""
+check_import_budget.py — API ワーカーの起動コスト（import 時間）チェック
+
+`import main` が音声解析スタック (torch / torchcrepe / librosa / soundfile / sklearn) を
+読み込んでいないこと、import 時間が予算内であることを確認する。
+CI やデプロイ前に実行し、違反があれば終了コード 1 を返す。
+
+使い方:
+  python check_import_budget.py
+  python check_import_budget.py --module main --budget 3.0
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# main の import で読み込まれてはいけないモジュール
+FORBIDDEN_MODULES = ["torch", "torchcrepe", "torchaudio", "librosa", "soundfile", "sklearn", "demucs"]
+
+DEFAULT_BUDGET_SECONDS = 3.0
+
+# 子プロセスで import して、経過時間と読み込まれた重いモジュールを JSON で返す
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+loaded = [m for m in {forbidden!r} if m in sys.modules]
+print(json.dumps({{"elapsed": elapsed, "loaded": loaded}}))
+"""
+
+
+def probe_import(module: str) -> dict:
+    env = dict(os.environ)
+    # 接続情報が無くても import できるようにインメモリの Supabase を使う
+    if not env.get("SUPABASE_URL"):
+        env.setdefault("SUPABASE_BACKEND", "memory")
+
+    proc = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, forbidden=FORBIDDEN_MODULES)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{module} の import に失敗しました:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API ワーカーの import 時間チェック")
+    parser.add_argument("--module", default="main", help="チェックするモジュール名")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS,
+                        help="import 時間の上限（秒）")
+    args = parser.parse_args()
+
+    result = probe_import(args.module)
+    ok = True
+
+    print(f"[INFO] import {args.module}: {result['elapsed']:.2f}秒 (予算 {args.budget:.2f}秒)")
+    if result["loaded"]:
+        print(f"[ERROR] 重いモジュールが読み込まれています: {', '.join(result['loaded'])}")
+        ok = False
+    if result["elapsed"] > args.budget:
+        print(f"[ERROR] import 時間が予算を超えています")
+        ok = False
+
+    if ok:
+        print("[OK] import 予算内です")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+compact_model.py — 地声/裏声分類器の軽量推論ランタイム
+
+ml/train_classifier.py が学習した scikit-learn Pipeline (StandardScaler + RandomForest / MLP) を
+NumPy 配列だけの .npz に書き出し、推論時は scikit-learn を import せずに判定する。
+
+  - RandomForest: 全ツリーのノードを1本のフラット配列に連結し、
+                  (サンプル数 × ツリー数) の行列で深さ方向に一斉に辿る
+  - MLP:          重み行列とバイアスの行列積のみ
+
+predict_proba(X) は sklearn と同じ shape=(n_samples, n_classes) を返すので、
+フレームをまとめたバッチでも1フレームでも同じ呼び出し方で使える。
+"""
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+# ============================================================
+# エクスポート（学習時のみ使用。sklearn の属性を読むだけで import はしない）
+# ============================================================
+def export_compact_model(pipeline, path: str) -> None:
+    """学習済み Pipeline を .npz に書き出す"""
+    scaler = pipeline.named_steps["scaler"]
+    clf = pipeline.named_steps["clf"]
+
+    arrays = {
+        "format_version": np.array(FORMAT_VERSION),
+        "classes": np.asarray(clf.classes_),
+        "scaler_mean": np.asarray(scaler.mean_, dtype=np.float64),
+        "scaler_scale": np.asarray(scaler.scale_, dtype=np.float64),
+    }
+
+    if hasattr(clf, "estimators_"):
+        arrays.update(_export_forest(clf))
+    elif hasattr(clf, "coefs_"):
+        arrays.update(_export_mlp(clf))
+    else:
+        raise ValueError(f"未対応のモデルです: {type(clf).__name__}")
+
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def _export_forest(clf) -> dict:
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for est in clf.estimators_:
+        tree = est.tree_
+        n = tree.node_count
+        is_leaf = tree.children_left < 0
+        idx = np.arange(n)
+
+        # 葉ノードは自分自身を指すようにしておけば、最大深さまで辿っても葉に留まる
+        left = np.where(is_leaf, idx, tree.children_left) + offset
+        right = np.where(is_leaf, idx, tree.children_right) + offset
+        feature = np.where(is_leaf, 0, tree.feature)
+
+        value = tree.value[:, 0, :].astype(np.float64)
+        value /= np.maximum(value.sum(axis=1, keepdims=True), 1e-12)
+
+        features.append(feature.astype(np.int32))
+        thresholds.append(tree.threshold.astype(np.float64))
+        lefts.append(left.astype(np.int32))
+        rights.append(right.astype(np.int32))
+        values.append(value)
+        roots.append(offset)
+        offset += n
+        max_depth = max(max_depth, int(tree.max_depth))
+
+    return {
+        "kind": np.array("forest"),
+        "feature": np.concatenate(features),
+        "threshold": np.concatenate(thresholds),
+        "left": np.concatenate(lefts),
+        "right": np.concatenate(rights),
+        "value": np.concatenate(values),
+        "roots": np.array(roots, dtype=np.int32),
+        "max_depth": np.array(max_depth),
+    }
+
+
+def _export_mlp(clf) -> dict:
+    arrays = {
+        "kind": np.array("mlp"),
+        "n_layers": np.array(len(clf.coefs_)),
+        "activation": np.array(clf.activation),
+        "out_activation": np.array(clf.out_activation_),
+    }
+    for i, (W, b) in enumerate(zip(clf.coefs_, clf.intercepts_)):
+        arrays[f"coef_{i}"] = np.asarray(W, dtype=np.float64)
+        arrays[f"intercept_{i}"] = np.asarray(b, dtype=np.float64)
+    return arrays
+
+
+# ============================================================
+# 推論ランタイム
+# ============================================================
+_ACTIVATIONS = {
+    "identity": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0.0),
+    "tanh": np.tanh,
+    "logistic": lambda x: 1.0 / (1.0 + np.exp(-x)),
+}
+
+
+class CompactModel:
+    """export_compact_model で書き出したモデルの推論器"""
+
+    def __init__(self, arrays: dict):
+        self.kind = str(arrays["kind"])
+        self.classes_ = arrays["classes"]
+        self._mean = arrays["scaler_mean"]
+        self._scale = arrays["scaler_scale"]
+
+        if self.kind == "forest":
+            self._feature = arrays["feature"]
+            self._threshold = arrays["threshold"]
+            self._left = arrays["left"]
+            self._right = arrays["right"]
+            self._value = arrays["value"]
+            self._roots = arrays["roots"]
+            self._max_depth = int(arrays["max_depth"])
+        elif self.kind == "mlp":
+            n_layers = int(arrays["n_layers"])
+            self._coefs = [arrays[f"coef_{i}"] for i in range(n_layers)]
+            self._intercepts = [arrays[f"intercept_{i}"] for i in range(n_layers)]
+            self._activation = _ACTIVATIONS[str(arrays["activation"])]
+            self._out_activation = str(arrays["out_activation"])
+        else:
+            raise ValueError(f"未対応のモデル種別です: {self.kind}")
+
+    def _scale_input(self, X: np.ndarray) -> np.ndarray:
+        # sklearn と同じく float32 のまま標準化する（ツリーの閾値比較を一致させるため）
+        Xs = np.array(X, dtype=np.float32, ndmin=2)
+        Xs -= self._mean
+        Xs /= self._scale
+        return Xs
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """shape=(n_samples, n_features) → shape=(n_samples, n_classes)"""
+        Xs = self._scale_input(X)
+        if self.kind == "forest":
+            return self._forest_proba(Xs)
+        return self._mlp_proba(Xs)
+
+    def _forest_proba(self, Xs: np.ndarray) -> np.ndarray:
+        n_samples = Xs.shape[0]
+        rows = np.arange(n_samples)[:, None]
+        node = np.repeat(self._roots[None, :], n_samples, axis=0)
+        for _ in range(self._max_depth):
+            go_left = Xs[rows, self._feature[node]] <= self._threshold[node]
+            node = np.where(go_left, self._left[node], self._right[node])
+        return self._value[node].mean(axis=1)
+
+    def _mlp_proba(self, Xs: np.ndarray) -> np.ndarray:
+        a = Xs.astype(np.float64)
+        last = len(self._coefs) - 1
+        for i, (W, b) in enumerate(zip(self._coefs, self._intercepts)):
+            a = a @ W + b
+            if i < last:
+                a = self._activation(a)
+
+        if self._out_activation == "softmax":
+            a = np.exp(a - a.max(axis=1, keepdims=True))
+            return a / a.sum(axis=1, keepdims=True)
+        p = _ACTIVATIONS["logistic"](a[:, 0])
+        return np.column_stack([1.0 - p, p])
+
+
+def load_compact_model(path: str) -> CompactModel:
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {k: data[k] for k in data.files}
+    version = int(arrays.get("format_version", 0))
+    if version != FORMAT_VERSION:
+        raise ValueError(f"モデル形式のバージョンが一致しません: {version} != {FORMAT_VERSION}")
+    return CompactModel(arrays)
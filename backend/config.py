@@ -43,6 +43,7 @@ ML_CONF_THRESHOLD_HIGH = 0.75      # f0 >= 500Hz
 ML_CONF_THRESHOLD_NOISY = 0.80     # CREPE信頼度低 + 高f0
 ML_CONF_CHEST_HIGH_F0 = 0.85       # 地声 + f0 >= 400Hz
 CREPE_NOISE_GATE = 0.35            # ピッチ推定ノイズゲート
+REGISTER_BATCH_FRAMES = 512        # classify_registers にまとめて渡すフレーム数（ML推論1回分）
 
 # === ピッチ安定性 ===
 STABILITY_MIN_SEGMENT = 3       # 持続音セグメントの最小フレーム数
@@ -70,4 +71,97 @@ FALSETTO_RESCUE_SEMITONES = 4    # P97+4半音以内は高音地声として救
 import os
 # REGISTER_LOG_LEVEL: 0=なし, 1=サマリーのみ, 2=間引き(デフォルト), 3=全て
 REGISTER_LOG_LEVEL = int(os.getenv("REGISTER_LOG_LEVEL", "1"))
-REGISTER_LOG_INTERVAL = int(os.getenv("REGISTER_LOG_INTERVAL", "100"))  # 間引き間隔
\ No newline at end of file
+REGISTER_LOG_INTERVAL = int(os.getenv("REGISTER_LOG_INTERVAL", "100"))  # 間引き間隔
+# ※ フレーム単位のログ (REGISTER_LOG_LEVEL>=2) は LOG_LEVEL=DEBUG のときだけ出力される
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()   # DEBUG / INFO / WARNING / ERROR
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")          # text=人が読む形式, json=1行1JSON（集約用）
+
+# === API プロセス構成 (main.py / catalogue_api.py / analysis_api.py) ===
+# main.py で全エンドポイントを1プロセスに載せる場合に、起動時に解析スタックを事前ロードするか
+# (analysis_api.py 単独起動時は常に事前ロードする)
+PRELOAD_ANALYSIS = os.getenv("PRELOAD_ANALYSIS", "0") == "1"
+
+# === Supabase 応答キャッシュ (auth.py / database_supabase.py) ===
+# 検証済みトークンは JWT の exp とこの TTL の早い方まで再検証しない（0 で無効）
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "60"))
+# 統合音域の計算結果のキャッシュ。キーに集計行の updated_at を含むので、どのワーカーの書き込みでも古い結果は返らない
+USER_DATA_CACHE_TTL = float(os.getenv("USER_DATA_CACHE_TTL", "300"))
+# お気に入りアーティストIDのキャッシュ（おすすめ曲の計算用）。無効化は書き込んだプロセスでしか効かないので、
+# 別のワーカー（複数 uvicorn ワーカー・catalogue/analysis の分割構成）ではこの秒数だけ古い値が残りうる
+FAVORITE_ARTIST_IDS_CACHE_TTL = float(os.getenv("FAVORITE_ARTIST_IDS_CACHE_TTL", "5"))
+USER_CACHE_MAX_ENTRIES = 10000
+
+# === アップロードの取り込み (upload_ingest.py / app_factory.py) ===
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024)  # 超えたら 413
+MAX_UPLOAD_SECONDS = float(os.getenv("MAX_UPLOAD_SECONDS", "600"))  # これより長い音源は先頭だけ解析する
+UPLOAD_CHUNK_BYTES = 1024 * 1024     # 受信済みのアップロードを一時ファイルから読む単位（読みながら ffmpeg に流す）
+# 同じ内容のファイル（sha256 一致）の解析結果を再利用する（0 で無効）
+ANALYSIS_RESULT_CACHE_TTL = float(os.getenv("ANALYSIS_RESULT_CACHE_TTL", "3600"))
+ANALYSIS_RESULT_CACHE_MAX_ENTRIES = 256
+
+# === 統合音域の集計 (database_supabase.py: user_vocal_aggregates) ===
+# 直近この件数分の履歴の数値だけを集計行に保持する。/analysis/integrated-range の limit 上限（100）以上にすること
+INTEGRATED_RANGE_WINDOW = 100
+
+# === Demucs ボーカル分離 (vocal_separator.py) ===
+# 音域さえ取れればよいので、分離品質より待ち時間を優先できるようにしておく。
+# CPU では音源を重なり付きのセグメントに分け、プロセスプールで並列に分離してクロスフェードでつなぐ。
+# プールは uvicorn ワーカーごとに作られ、各プロセスがモデルを1つずつロードするので並列化は明示的に有効にする。
+# DEMUCS_WORKERS=1（既定）で並列化なし（従来どおりワーカー内で1回に分離）。GPU 使用時は常に並列化なし
+DEMUCS_WORKERS = int(os.getenv("DEMUCS_WORKERS", "1"))   # 0 = CPUコア数 / スレッド数 / WEB_CONCURRENCY（要 WEB_CONCURRENCY）
+DEMUCS_THREADS_PER_WORKER = int(os.getenv("DEMUCS_THREADS_PER_WORKER", "2"))  # 各プロセスの torch スレッド数
+# 解析 API の uvicorn ワーカー数。uvicorn は --workers を渡してもこの環境変数を設定しないので、
+# 並列化する場合は --workers と同じ値をここに設定する（未設定なら DEMUCS_WORKERS=0 の自動設定は行わない）
+WEB_CONCURRENCY = int(os.environ["WEB_CONCURRENCY"]) if os.getenv("WEB_CONCURRENCY") else None
+DEMUCS_SEGMENT_SECONDS = float(os.getenv("DEMUCS_SEGMENT_SECONDS", "30"))   # 並列化の単位（これより短い音源は分割しない）
+DEMUCS_CROSSFADE_SECONDS = float(os.getenv("DEMUCS_CROSSFADE_SECONDS", "1.0"))  # セグメント間の重なり（線形クロスフェード）
+# Demucs 内部の設定: shifts を増やすと品質↑・時間は回数倍、overlap を下げると速いが継ぎ目が粗くなる
+DEMUCS_SHIFTS = int(os.getenv("DEMUCS_SHIFTS", "1"))
+DEMUCS_OVERLAP = float(os.getenv("DEMUCS_OVERLAP", "0.25"))
+
+# === ボーカル区間だけの分離 (vocal_regions.py / vocal_separator.py) ===
+# ミックス音源から歌っていそうな区間を推定し、Demucs はその区間（+前後の余白）だけに使う
+VOCAL_REGION_DETECTION = os.getenv("VOCAL_REGION_DETECTION", "1") == "1"
+VOCAL_REGION_PADDING_SECONDS = float(os.getenv("VOCAL_REGION_PADDING_SECONDS", "1.5"))  # Demucs に渡す前後の文脈
+VOCAL_REGION_MIN_GAP_SECONDS = 3.0     # これより短い隙間（息継ぎ・短い間奏）はつなぐ
+VOCAL_REGION_MIN_SECONDS = 1.0         # これより短い区間は捨てる
+# 推定区間が曲全体に対してこの範囲外なら推定を信用せず曲全体を分離する
+VOCAL_REGION_MIN_COVERAGE = 0.2
+VOCAL_REGION_MAX_COVERAGE = 0.95
+
+# === 解析ジョブ・速報モード (analysis_jobs.py / analysis_api.py) ===
+# POST /analyze-karaoke/jobs はアップロード受信後すぐ job_id を返し、解析はバックグラウンドで進む。
+# まず曲中でいちばん歌っていそうな ANALYSIS_PREVIEW_SECONDS 秒だけを分離し、CREPE の hop を
+# ANALYSIS_PREVIEW_HOP_FACTOR 倍に間引いて暫定の音域（preview）を出し、その後に通常の解析結果（result）を出す
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "1"))   # ワーカープロセスあたりの同時実行ジョブ数
+ANALYSIS_JOB_TTL = float(os.getenv("ANALYSIS_JOB_TTL", "3600"))      # 終了したジョブを保持する秒数
+# ワーカープロセスあたりの実行中＋待機中ジョブの上限。待機中のジョブもデコード済みの音声（600秒で約210MB）を
+# 持つので、超えたら 503 で断る
+ANALYSIS_JOB_MAX_PENDING = int(os.getenv("ANALYSIS_JOB_MAX_PENDING", "3"))
+# この秒数更新の無い queued / running / preview のジョブはワーカーの再起動などで止まったとみなし error にする
+ANALYSIS_JOB_STALE_SECONDS = float(os.getenv("ANALYSIS_JOB_STALE_SECONDS", "1800"))
+ANALYSIS_PREVIEW_SECONDS = float(os.getenv("ANALYSIS_PREVIEW_SECONDS", "20"))
+ANALYSIS_PREVIEW_HOP_FACTOR = int(os.getenv("ANALYSIS_PREVIEW_HOP_FACTOR", "4"))  # 10ms → 40ms
+# GET /analysis-jobs/{job_id}/events（SSE）が jobs.db を確認する間隔と、変化が無いときのコメント送信間隔
+ANALYSIS_JOB_EVENT_POLL_SECONDS = float(os.getenv("ANALYSIS_JOB_EVENT_POLL_SECONDS", "0.5"))
+ANALYSIS_JOB_EVENT_KEEPALIVE_SECONDS = float(os.getenv("ANALYSIS_JOB_EVENT_KEEPALIVE_SECONDS", "15"))
+
+# === リアルタイム音高解析 (live_pitch.py / analysis_api.py の /ws/live-pitch) ===
+# マイクの 16kHz モノラル PCM を WebSocket で受け取り、LIVE_PITCH_WINDOW_SECONDS ごとに CREPE をかけて
+# 音域のサマリーを LIVE_PITCH_SUMMARY_SECONDS ごとに返す
+LIVE_PITCH_MAX_STREAMS = int(os.getenv("LIVE_PITCH_MAX_STREAMS", "4"))           # ワーカープロセスあたりの同時接続数
+LIVE_PITCH_WINDOW_SECONDS = float(os.getenv("LIVE_PITCH_WINDOW_SECONDS", "0.25"))
+LIVE_PITCH_SUMMARY_SECONDS = float(os.getenv("LIVE_PITCH_SUMMARY_SECONDS", "0.3"))
+LIVE_PITCH_MAX_SECONDS = float(os.getenv("LIVE_PITCH_MAX_SECONDS", "600"))        # 1接続で解析する最大秒数（メモリ上限）
+LIVE_PITCH_MAX_MESSAGE_BYTES = 256 * 1024                                         # 1メッセージの最大サイズ
+
+# === 音域のオンライン統計 (online_stats.py / live_pitch.py) ===
+# VOICE_MIN_HZ〜VOICE_MAX_HZ を 1/N 半音幅のビンに分けたヒストグラムで中央値・パーセンタイル・最高音を求める
+# （分位点の誤差はビン幅以内。既定の 10 で 10 セント）
+ONLINE_STATS_BINS_PER_SEMITONE = int(os.getenv("ONLINE_STATS_BINS_PER_SEMITONE", "10"))
+
+# === JWT のローカル検証 (auth.py) ===
+# 秘密鍵は .env の SUPABASE_JWT_SECRET（HS256）。非対称鍵のプロジェクトは PyJWT があれば JWKS で検証する
+JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWT_LEEWAY_SECONDS = 10          # exp / nbf の時計ずれ許容
+JWKS_CACHE_SECONDS = 600         # JWKS（公開鍵）の再取得間隔
@@ -3,13 +3,29 @@ database.py — 楽曲音域データベースの接続管理とクエリ関数
 """
 import sqlite3
 import os
+import sys
+import time
 import unicodedata
 import re
 
+from metrics import SQLITE_QUERY_SECONDS
+
 DB_PATH = os.path.join(os.path.dirname(__file__), "songs.db")
 
+class _TimedConnection(sqlite3.Connection):
+    """execute() の所要時間（ソート等を含む最初の1ステップまで）を呼び出し元の関数名ごとに記録する"""
+
+    def execute(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(*args, **kwargs)
+        finally:
+            SQLITE_QUERY_SECONDS.observe(time.perf_counter() - t0,
+                                         caller=sys._getframe(1).f_code.co_name)
+
+
 def get_connection(db_path: str = DB_PATH) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path, factory=_TimedConnection)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
     return conn
@@ -1,11 +1,27 @@
 """
 Supabaseデータベースの接続管理とクエリ関数
+
+クエリの組み立て・応答の整形・統合音域の計算は supabase_queries.py（非同期版と共有）にあり、
+ここでは execute() とエラー処理・キャッシュだけを行う。
 """
+import logging
 import os
 from typing import Optional, List, Dict, Any
 from supabase import create_client, Client
-from database import get_song
 from dotenv import load_dotenv
+from metrics import SUPABASE_CALL_SECONDS, timed
+from config import (
+    USER_DATA_CACHE_TTL, FAVORITE_ARTIST_IDS_CACHE_TTL, USER_CACHE_MAX_ENTRIES,
+)
+from ttl_cache import TTLCache
+import supabase_queries as q
+from supabase_queries import (
+    first_row, flatten_song, merge_search_results, join_favorite_songs,
+    vocal_range_update, analysis_record_row, aggregate_row,
+    summarize_vocal_entries, attach_recommended_songs, FAVORITE_ARTISTS_LIMIT,
+)
+
+logger = logging.getLogger(__name__)
 
 # 環境変数をロード
 load_dotenv()
@@ -14,16 +30,34 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("SUPABASE_URLとSUPABASE_KEYを.envファイルに設定してください")
+# memory: 外部サービスなしで動かすためのインメモリ実装（ローカル負荷試験・開発用）
+SUPABASE_BACKEND = os.getenv("SUPABASE_BACKEND", "remote")
+
+if SUPABASE_BACKEND == "memory":
+    from supabase_memory import MemoryClient
+    supabase: Client = MemoryClient(latency_ms=float(os.getenv("SUPABASE_MEMORY_LATENCY_MS", "0")))
+    logger.warning("SUPABASE_BACKEND=memory: インメモリの Supabase を使用します（データは保存されません）")
+else:
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise ValueError("SUPABASE_URLとSUPABASE_KEYを.envファイルに設定してください")
+    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+def _observed(fn):
+    """Supabase 呼び出しのレイテンシを関数名ごとに記録するデコレータ"""
+    return timed(SUPABASE_CALL_SECONDS, call=fn.__name__)(fn)
+
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# お気に入りアーティストIDのキャッシュ（キーは user_id）。書き込み関数はこのプロセスの分しか無効化できないため、
+# 他のワーカーでの変更が数秒で反映されるよう TTL を短くしている（プロファイルは主キー1行なのでキャッシュしない）
+_favorite_artist_ids_cache = TTLCache("favorite_artist_ids", FAVORITE_ARTIST_IDS_CACHE_TTL, USER_CACHE_MAX_ENTRIES)
 
 
 # ============================================================
 # 楽曲関連のクエリ関数
 # ============================================================
 
+@_observed
 def search_songs(query: str, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
     """
     曲名またはアーティスト名であいまい検索。
@@ -31,117 +65,62 @@ def search_songs(query: str, limit: int = 20, offset: int = 0) -> List[Dict[str,
     [FIX] PostgRESTはJOINテーブルに対して or_().ilike() が使えない。
           タイトル検索とアーティスト検索を分けて実行し、重複をIDで除外する。
     """
-    # 曲名で検索
-    title_resp = supabase.table("songs").select(
-        "id, title, lowest_note, highest_note, falsetto_note, note, source, artists(name)"
-    ).ilike("title", f"%{query}%").range(offset, offset + limit - 1).execute()
-
-    # アーティスト名で検索（artists テーブルで一致するIDを取得）
-    artist_resp = supabase.table("artists").select("id").ilike(
-        "name", f"%{query}%"
-    ).execute()
+    title_resp = q.songs_by_title(supabase, query, limit, offset).execute()
+    artist_resp = q.artist_ids_by_name(supabase, query).execute()
 
     artist_songs: List[Dict[str, Any]] = []
     if artist_resp.data:
         artist_ids = [a["id"] for a in artist_resp.data]
-        for artist_id in artist_ids:
-            resp = supabase.table("songs").select(
-                "id, title, lowest_note, highest_note, falsetto_note, note, source, artists(name)"
-            ).eq("artist_id", artist_id).range(0, limit - 1).execute()
-            artist_songs.extend(resp.data or [])
-
-    # 重複除去（IDベース）
-    seen_ids: set = set()
-    merged: List[Dict[str, Any]] = []
-    for song in (title_resp.data or []) + artist_songs:
-        if song["id"] not in seen_ids:
-            seen_ids.add(song["id"])
-            merged.append(song)
-
-    # artistsをフラットに変換
-    result = []
-    for song in merged[:limit]:
-        result.append({
-            **{k: v for k, v in song.items() if k != "artists"},
-            "artist": song["artists"]["name"] if song.get("artists") else None,
-        })
-    return result
+        artist_songs = q.songs_by_artists(supabase, artist_ids, limit).execute().data or []
+
+    return merge_search_results(title_resp.data or [], artist_songs, limit)
 
 
+@_observed
 def get_song(song_id: int) -> Optional[Dict[str, Any]]:
     """IDで楽曲を取得"""
-    response = supabase.table("songs").select(
-        "id, title, lowest_note, highest_note, falsetto_note, note, source, artists(name)"
-    ).eq("id", song_id).single().execute()
-
-    if response.data:
-        return {
-            **{k: v for k, v in response.data.items() if k != "artists"},
-            "artist": response.data["artists"]["name"] if response.data.get("artists") else None,
-        }
-    return None
+    response = q.song_by_id(supabase, song_id).execute()
+    return flatten_song(response.data) if response.data else None
 
 
+@_observed
 def get_all_songs(limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
     """全曲を取得（ページネーション対応）"""
-    response = supabase.table("songs").select(
-        "id, title, lowest_note, highest_note, falsetto_note, note, source, artists(name)"
-    ).range(offset, offset + limit - 1).execute()
-
-    songs = []
-    for song in response.data:
-        songs.append({
-            **{k: v for k, v in song.items() if k != "artists"},
-            "artist": song["artists"]["name"] if song.get("artists") else None,
-        })
-    return songs
+    return [flatten_song(song) for song in q.all_songs(supabase, limit, offset).execute().data]
 
 
+@_observed
 def get_artist(artist_id: int) -> Optional[Dict[str, Any]]:
     """IDでアーティストを取得"""
-    response = supabase.table("artists").select(
-        "id, name, slug, song_count"
-    ).eq("id", artist_id).single().execute()
-    return response.data
+    return q.artist_by_id(supabase, artist_id).execute().data
 
 
+@_observed
 def get_artists(limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
     """アーティスト一覧を取得"""
-    response = supabase.table("artists").select(
-        "id, name, slug, song_count"
-    ).order("name").range(offset, offset + limit - 1).execute()
-    return response.data
+    return q.artists_page(supabase, limit, offset).execute().data
 
 
+@_observed
 def get_artist_songs(artist_id: int) -> List[Dict[str, Any]]:
     """アーティストの全曲を取得"""
-    response = supabase.table("songs").select(
-        "id, title, lowest_note, highest_note, falsetto_note, note, source, artists(name)"
-    ).eq("artist_id", artist_id).order("title").execute()
-
-    songs = []
-    for song in response.data:
-        songs.append({
-            **{k: v for k, v in song.items() if k != "artists"},
-            "artist": song["artists"]["name"] if song.get("artists") else None,
-        })
-    return songs
+    return [flatten_song(song) for song in q.songs_of_artist(supabase, artist_id).execute().data]
 
 
 # ============================================================
 # ユーザープロファイル関連
 # ============================================================
 
+@_observed
 def get_user_profile(user_id: str) -> Optional[Dict[str, Any]]:
     """ユーザープロファイルを取得"""
-    response = supabase.table("user_profiles").select("*").eq("id", user_id).single().execute()
-    return response.data
+    return q.profile_by_id(supabase, user_id).execute().data
 
 
+@_observed
 def update_user_profile(user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
     """ユーザープロファイルを更新"""
-    response = supabase.table("user_profiles").update(data).eq("id", user_id).execute()
-    return response.data[0] if response.data else None
+    return first_row(q.update_profile(supabase, user_id, data).execute())
 
 
 def update_vocal_range(
@@ -151,21 +130,14 @@ def update_vocal_range(
     falsetto: Optional[str] = None
 ) -> Dict[str, Any]:
     """ユーザーの最新声域を更新"""
-    data = {}
-    if vocal_min:
-        data["current_vocal_range_min"] = vocal_min
-    if vocal_max:
-        data["current_vocal_range_max"] = vocal_max
-    if falsetto:
-        data["current_falsetto_max"] = falsetto
-
-    return update_user_profile(user_id, data)
+    return update_user_profile(user_id, vocal_range_update(vocal_min, vocal_max, falsetto))
 
 
 # ============================================================
 # 分析履歴関連
 # ============================================================
 
+@_observed
 def create_analysis_record(
     user_id: str,
     vocal_min: Optional[str],
@@ -176,90 +148,97 @@ def create_analysis_record(
     result_json: Optional[Dict[str, Any]] = None
 ) -> Optional[Dict[str, Any]]:
     """分析履歴を新規作成"""
-    data = {
-        "user_id": user_id,
-        "vocal_range_min": vocal_min,
-        "vocal_range_max": vocal_max,
-        "falsetto_max": falsetto,
-        "source_type": source_type,
-        "file_name": file_name,
-        "result_json": result_json
-    }
-    response = supabase.table("analysis_history").insert(data).execute()
-    return response.data[0] if response.data else None
-
-
-def get_analysis_history(user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-    """ユーザーの分析履歴を取得（新しい順）"""
-    response = supabase.table("analysis_history").select(
-        "*"
-    ).eq("user_id", user_id).order("created_at", desc=True).limit(limit).execute()
-    return response.data
+    row = analysis_record_row(user_id, vocal_min, vocal_max, falsetto, source_type, file_name, result_json)
+    record = first_row(q.insert_analysis_record(supabase, row).execute())
+    if record is not None:
+        _add_to_vocal_aggregate(user_id, record)
+    return record
+
+
+def _add_to_vocal_aggregate(user_id: str, record: Dict[str, Any]) -> None:
+    """
+    新しい履歴を集計行に追加する（集計行が無ければ履歴から作る）。集計は履歴から作り直せる派生データなので、
+    失敗しても履歴の書き込みは成功扱いにする（次の参照・削除時に補われる）。
+    """
+    try:
+        if not _push_vocal_entry(user_id, record):
+            merge_vocal_aggregate(user_id)
+    except Exception as e:
+        logger.warning("統合音域の集計更新に失敗: %s", e)
+
+
+@_observed
+def get_analysis_history(user_id: str, limit: int = 50, before: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    ユーザーの分析履歴を取得（新しい順、result_json なし）。
+    before に前ページ最後の created_at を渡すと、それより古い履歴を返す（カーソルページネーション）。
+    """
+    return q.history_page(supabase, user_id, limit, before).execute().data
+
+
+@_observed
+def get_analysis_record(user_id: str, record_id: str) -> Optional[Dict[str, Any]]:
+    """分析履歴1件を result_json 付きで取得（他人の履歴は None）"""
+    return first_row(q.analysis_record(supabase, user_id, record_id).execute())
+
+
+@_observed
+def delete_analysis_record(user_id: str, record_id: str) -> bool:
+    """分析履歴を削除"""
+    try:
+        q.delete_analysis_record(supabase, user_id, record_id).execute()
+    except Exception as e:
+        logger.warning("履歴削除エラー: %s", e)
+        return False
+    # 消えた履歴を集計行から除き、窓の外にあった履歴を繰り上げる
+    try:
+        merge_vocal_aggregate(user_id)
+    except Exception as e:
+        logger.warning("統合音域の集計更新に失敗: %s", e)
+    return True
 
 
 # ============================================================
 # お気に入り楽曲関連
 # ============================================================
 
+@_observed
 def add_favorite_song(user_id: str, song_id: int) -> Optional[Dict[str, Any]]:
     """お気に入りに楽曲を追加"""
     try:
-        data = {"user_id": user_id, "song_id": song_id}
-        response = supabase.table("favorite_songs").insert(data).execute()
-        return response.data[0] if response.data else None
+        return first_row(q.insert_favorite_song(supabase, user_id, song_id).execute())
     except Exception as e:
-        print(f"お気に入り追加エラー: {e}")
+        logger.warning("お気に入り追加エラー: %s", e)
         return None
 
 
+@_observed
 def remove_favorite_song(user_id: str, song_id: int) -> bool:
     """お気に入りから楽曲を削除"""
     try:
-        supabase.table("favorite_songs").delete().eq("user_id", user_id).eq("song_id", song_id).execute()
+        q.delete_favorite_song(supabase, user_id, song_id).execute()
         return True
     except Exception:
         return False
 
 
+@_observed
 def get_favorite_songs(user_id: str, limit: int = 100) -> List[Dict[str, Any]]:
     """ユーザーのお気に入り楽曲一覧を取得"""
-    response = supabase.table("favorite_songs").select(
-        "id, song_id, created_at"
-    ).eq("user_id", user_id).order("created_at", desc=True).limit(limit).execute()
-
-    favorites = []
-    import database
-    for fav in response.data:
-        song = database.get_song(fav["song_id"])
-        
-        # SQLite側に曲が存在すればリストに追加
-        if song:
-            favorites.append({
-                "favorite_id": fav["id"],
-                "created_at": fav["created_at"],
-                "song_id": song.get("id"),
-                "title": song.get("title"),
-                "artist": song.get("artist"),
-                "lowest_note": song.get("lowest_note"),
-                "highest_note": song.get("highest_note"),
-                "falsetto_note": song.get("falsetto_note"),
-            })
-            
-    return favorites
+    return join_favorite_songs(q.favorite_songs(supabase, user_id, limit).execute().data)
 
 
+@_observed
 def is_favorite(user_id: str, song_id: int) -> bool:
     """楽曲がお気に入りに登録されているか確認"""
-    response = supabase.table("favorite_songs").select("id").eq(
-        "user_id", user_id
-    ).eq("song_id", song_id).execute()
-    return len(response.data) > 0
+    return len(q.favorite_song_exists(supabase, user_id, song_id).execute().data) > 0
 
 
 # ============================================================
 # お気に入りアーティスト関連
 # ============================================================
 
+@_observed
 def add_favorite_artist(user_id: str, artist_id: int, artist_name: str) -> Optional[Dict[str, Any]]:
     """
     お気に入りアーティストを追加（上限10組）。
@@ -267,75 +246,95 @@ def add_favorite_artist(user_id: str, artist_id: int, artist_name: str) -> Optio
     """
     try:
         # 上限チェック
-        count_resp = supabase.table("favorite_artists").select(
-            "id", count="exact"
-        ).eq("user_id", user_id).execute()
-        if (count_resp.count or 0) >= 10:
+        count_resp = q.favorite_artist_count(supabase, user_id).execute()
+        if (count_resp.count or 0) >= FAVORITE_ARTISTS_LIMIT:
             return None  # 上限超過
 
-        data = {
-            "user_id": user_id,
-            "artist_id": artist_id,
-            "artist_name": artist_name,
-        }
-        response = supabase.table("favorite_artists").insert(data).execute()
-        return response.data[0] if response.data else None
+        response = q.insert_favorite_artist(supabase, user_id, artist_id, artist_name).execute()
+        _favorite_artist_ids_cache.invalidate(user_id)
+        return first_row(response)
     except Exception as e:
-        print(f"お気に入りアーティスト追加エラー: {e}")
+        logger.warning("お気に入りアーティスト追加エラー: %s", e)
         return None
 
 
+@_observed
 def remove_favorite_artist(user_id: str, artist_id: int) -> bool:
     """お気に入りアーティストを削除"""
     try:
-        supabase.table("favorite_artists").delete().eq(
-            "user_id", user_id
-        ).eq("artist_id", artist_id).execute()
+        q.delete_favorite_artist(supabase, user_id, artist_id).execute()
+        _favorite_artist_ids_cache.invalidate(user_id)
         return True
     except Exception:
         return False
 
 
+@_observed
 def get_favorite_artists(user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
     """ユーザーのお気に入りアーティスト一覧を取得（登録が古い順）"""
-    response = supabase.table("favorite_artists").select(
-        "id, artist_id, artist_name, created_at"
-    ).eq("user_id", user_id).order("created_at", desc=False).limit(limit).execute()
-    return response.data or []
+    return q.favorite_artists(supabase, user_id, limit).execute().data or []
 
 
+@_observed
 def is_favorite_artist(user_id: str, artist_id: int) -> bool:
     """アーティストがお気に入りに登録されているか確認"""
-    response = supabase.table("favorite_artists").select("id").eq(
-        "user_id", user_id
-    ).eq("artist_id", artist_id).execute()
-    return len(response.data) > 0
+    return len(q.favorite_artist_exists(supabase, user_id, artist_id).execute().data) > 0
 
 
 def get_favorite_artist_ids(user_id: str) -> List[int]:
     """
     お気に入りアーティストのIDリストを返す（recommenderで使用）。
-    DBエラー時は空リストを返してフォールバック。
+    FAVORITE_ARTIST_IDS_CACHE_TTL 秒のキャッシュを使う（このプロセスでの追加・削除時は即時無効化）。
+    DBエラー時は空リストを返してフォールバック（エラー結果はキャッシュしない）。
     """
-    try:
-        response = supabase.table("favorite_artists").select(
-            "artist_id"
-        ).eq("user_id", user_id).execute()
-        return [row["artist_id"] for row in (response.data or [])]
-    except Exception as e:
-        print(f"[WARN] お気に入りアーティストID取得失敗: {e}")
-        return []
+    ids = _favorite_artist_ids_cache.get(user_id)
+    if ids is None:
+        try:
+            ids = _fetch_favorite_artist_ids(user_id)
+        except Exception as e:
+            logger.warning("お気に入りアーティストID取得失敗: %s", e)
+            return []
+        _favorite_artist_ids_cache.set(user_id, ids)
+    return list(ids)
 
-def delete_analysis_record(user_id: str, record_id: str) -> bool:
-    """分析履歴を削除"""
-    try:
-        supabase.table("analysis_history").delete().eq(
-            "id", record_id
-        ).eq("user_id", user_id).execute()
-        return True
-    except Exception as e:
-        print(f"履歴削除エラー: {e}")
-        return False
+
+@_observed
+def _fetch_favorite_artist_ids(user_id: str) -> List[int]:
+    response = q.favorite_artist_ids(supabase, user_id).execute()
+    return [row["artist_id"] for row in (response.data or [])]
+
+
+# ============================================================
+# 統合音域（user_vocal_aggregates による集計。計算は supabase_queries.py）
+# ============================================================
+# 声質タイプ・おすすめ曲などの計算結果は、集計行の updated_at とお気に入りアーティストIDをキーにキャッシュする。
+# どのワーカーで履歴が更新されても updated_at が変わるので、古い結果は返らない（無効化の呼び出しが要らない）。
+
+# (user_id, limit, updated_at, お気に入りアーティストID) -> get_integrated_vocal_range の結果
+_integrated_range_cache = TTLCache("integrated_range", USER_DATA_CACHE_TTL, USER_CACHE_MAX_ENTRIES)
+
+
+@_observed
+def _read_vocal_aggregate(user_id: str) -> Optional[Dict[str, Any]]:
+    return aggregate_row(q.vocal_aggregate(supabase, user_id).execute())
+
+
+@_observed
+def _push_vocal_entry(user_id: str, record: Dict[str, Any]) -> bool:
+    return bool(q.push_vocal_entry(supabase, user_id, record).execute().data)
+
+
+@_observed
+def merge_vocal_aggregate(user_id: str) -> Optional[Dict[str, Any]]:
+    """直近の履歴を集計行に合わせる（履歴の削除時・集計行がまだ無い既存ユーザーの初回参照時）"""
+    response = q.aggregate_source(supabase, user_id).execute()
+    return aggregate_row(q.merge_vocal_entries(supabase, user_id, response.data or []).execute())
+
+
+def get_vocal_aggregate(user_id: str) -> Dict[str, Any]:
+    """集計行 {"entries", "updated_at"} を読む（無ければ履歴から作る）"""
+    row = _read_vocal_aggregate(user_id) or merge_vocal_aggregate(user_id)
+    return row or {"entries": [], "updated_at": None}
 
 
 def get_integrated_vocal_range(user_id: str, limit: int = 20) -> Optional[Dict[str, Any]]:
@@ -344,186 +343,28 @@ def get_integrated_vocal_range(user_id: str, limit: int = 20) -> Optional[Dict[s
     
     Args:
         user_id: ユーザーID
-        limit: 統合する履歴の件数（デフォルト20件）
+        limit: 統合する履歴の件数（デフォルト20件、最大 INTEGRATED_RANGE_WINDOW）
     
     Returns:
         統合音域・タイプ・おすすめ曲・アーティスト・歌唱力指標を含む辞書
         データがない場合はNone
     """
     try:
-        from note_converter import hz_to_label_and_hz
-        from recommender import recommend_songs, find_similar_artists, classify_voice_type
-        
-        # 直近N件の履歴を取得
-        history = get_analysis_history(user_id, limit=limit)
-        
-        if not history:
+        row = get_vocal_aggregate(user_id)
+        fav_artist_ids = get_favorite_artist_ids(user_id)
+        cache_key = (user_id, limit, row["updated_at"], tuple(fav_artist_ids))
+        cached = _integrated_range_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+        result = summarize_vocal_entries(row["entries"][:limit], limit)
+        if result is None:
             return None
-        
-        # Hz値のリストを収集
-        chest_min_values = []
-        chest_max_values = []
-        falsetto_max_values = []
-        overall_min_values = []
-        overall_max_values = []
-        chest_ratio_values = []
-        
-        # 歌唱力指標の収集
-        range_scores = []
-        stability_scores = []
-        expression_scores = []
-        overall_scores = []
-        
-        valid_count = 0
-        for record in history:
-            # result_jsonがある場合はそこから取得
-            if record.get("result_json"):
-                result = record["result_json"]
-                if result.get("chest_min_hz"):
-                    chest_min_values.append(result["chest_min_hz"])
-                if result.get("chest_max_hz"):
-                    chest_max_values.append(result["chest_max_hz"])
-                if result.get("falsetto_max_hz"):
-                    falsetto_max_values.append(result["falsetto_max_hz"])
-                if result.get("overall_min_hz"):
-                    overall_min_values.append(result["overall_min_hz"])
-                if result.get("overall_max_hz"):
-                    overall_max_values.append(result["overall_max_hz"])
-                if result.get("chest_ratio") is not None:
-                    chest_ratio_values.append(result["chest_ratio"])
-                
-                # 歌唱力指標
-                if result.get("singing_analysis"):
-                    sa = result["singing_analysis"]
-                    if sa.get("range_score") is not None:
-                        range_scores.append(sa["range_score"])
-                    if sa.get("stability_score") is not None:
-                        stability_scores.append(sa["stability_score"])
-                    if sa.get("expression_score") is not None:
-                        expression_scores.append(sa["expression_score"])
-                    if sa.get("overall_score") is not None:
-                        overall_scores.append(sa["overall_score"])
-                
-                valid_count += 1
-            # 古い形式の場合は直接取得
-            elif record.get("vocal_range_min_hz") or record.get("vocal_range_max_hz"):
-                if record.get("vocal_range_min_hz"):
-                    overall_min_values.append(record["vocal_range_min_hz"])
-                    chest_min_values.append(record["vocal_range_min_hz"])
-                if record.get("vocal_range_max_hz"):
-                    overall_max_values.append(record["vocal_range_max_hz"])
-                    chest_max_values.append(record["vocal_range_max_hz"])
-                if record.get("falsetto_max_hz"):
-                    falsetto_max_values.append(record["falsetto_max_hz"])
-                valid_count += 1
-        
-        if valid_count == 0:
-            return None
-        
-        # 統合値を計算（最小値と最大値を採用）
-        result = {
-            "data_count": valid_count,
-            "limit": limit
-        }
-        
-        # 音域情報
-        if overall_min_values:
-            overall_min_hz = min(overall_min_values)
-            overall_min_label, overall_min_hz_defined = hz_to_label_and_hz(overall_min_hz)
-            result["overall_min"] = overall_min_label
-            result["overall_min_hz"] = overall_min_hz_defined
-        
-        if overall_max_values:
-            overall_max_hz = max(overall_max_values)
-            overall_max_label, overall_max_hz_defined = hz_to_label_and_hz(overall_max_hz)
-            result["overall_max"] = overall_max_label
-            result["overall_max_hz"] = overall_max_hz_defined
-        
-        chest_min_hz_defined = None
-        if chest_min_values:
-            chest_min_hz = min(chest_min_values)
-            chest_min_label, chest_min_hz_defined = hz_to_label_and_hz(chest_min_hz)
-            result["chest_min"] = chest_min_label
-            result["chest_min_hz"] = chest_min_hz_defined
-        
-        chest_max_hz_defined = None
-        if chest_max_values:
-            chest_max_hz = max(chest_max_values)
-            chest_max_label, chest_max_hz_defined = hz_to_label_and_hz(chest_max_hz)
-            result["chest_max"] = chest_max_label
-            result["chest_max_hz"] = chest_max_hz_defined
-        
-        falsetto_max_hz_defined = None
-        if falsetto_max_values:
-            falsetto_max_hz = max(falsetto_max_values)
-            falsetto_max_label, falsetto_max_hz_defined = hz_to_label_and_hz(falsetto_max_hz)
-            result["falsetto_max"] = falsetto_max_label
-            result["falsetto_max_hz"] = falsetto_max_hz_defined
-        
-        # 地声比率の平均
-        avg_chest_ratio = sum(chest_ratio_values) / len(chest_ratio_values) if chest_ratio_values else 0.8
-        result["chest_ratio"] = avg_chest_ratio
-        result["falsetto_ratio"] = 1.0 - avg_chest_ratio
-        
-        # 歌唱力指標の平均
-        if range_scores or stability_scores or expression_scores or overall_scores:
-            result["singing_analysis"] = {}
-            if range_scores:
-                result["singing_analysis"]["range_score"] = sum(range_scores) / len(range_scores)
-            if stability_scores:
-                result["singing_analysis"]["stability_score"] = sum(stability_scores) / len(stability_scores)
-            if expression_scores:
-                result["singing_analysis"]["expression_score"] = sum(expression_scores) / len(expression_scores)
-            if overall_scores:
-                result["singing_analysis"]["overall_score"] = sum(overall_scores) / len(overall_scores)
-            
-            # 音域の半音数を計算
-            if chest_min_hz_defined and chest_max_hz_defined:
-                import math
-                result["singing_analysis"]["range_semitones"] = round(
-                    12 * math.log2(chest_max_hz_defined / chest_min_hz_defined)
-                )
-        
-        # 声質タイプを判定（chest_avg_hzを計算）
-        if chest_min_hz_defined and chest_max_hz_defined:
-            import math
-            chest_avg_hz = math.sqrt(chest_min_hz_defined * chest_max_hz_defined)  # 幾何平均
-            
-            # voice_typeを分類
-            voice_type_data = classify_voice_type(
-                chest_min_hz_defined,
-                chest_max_hz_defined,
-                chest_avg_hz,
-                falsetto_max_hz_defined,
-                avg_chest_ratio
-            )
-            result["voice_type"] = voice_type_data
-            
-            # 似ているアーティストを取得
-            similar_artists = find_similar_artists(
-                chest_min_hz_defined,
-                chest_max_hz_defined,
-                chest_avg_hz,
-                limit=5
-            )
-            result["similar_artists"] = similar_artists
-            
-            # おすすめ曲を取得
-            fav_artist_ids = get_favorite_artist_ids(user_id)
-            recommended_songs = recommend_songs(
-                chest_min_hz_defined,
-                chest_max_hz_defined,
-                chest_avg_hz,
-                falsetto_max_hz_defined,
-                limit=10,
-                favorite_artist_ids=fav_artist_ids
-            )
-            result["recommended_songs"] = recommended_songs
-        
-        return result
+        attach_recommended_songs(result, fav_artist_ids)
+        _integrated_range_cache.set(cache_key, result)
+        return dict(result)
         
     except Exception as e:
-        print(f"統合音域計算エラー: {e}")
+        logger.warning("統合音域計算エラー: %s", e)
         import traceback
         traceback.print_exc()
-        return None
\ No newline at end of file
+        return None
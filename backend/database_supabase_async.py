@@ -0,0 +1,353 @@
+"""
+database_supabase_async.py — Supabase データ層の非同期版
+
+database_supabase.py と同じ関数を、非同期の Supabase（PostgREST）クライアントで実装する。
+クエリの組み立て・応答の整形・統合音域の計算は同期版と同じ supabase_queries.py のものを使い、
+ここには await ... .execute() とエラー処理だけを書く。
+async def のエンドポイントから await で呼ぶと、ネットワーク待ちの間スレッドプールの
+スレッドを占有しない。互いに依存しない問い合わせは asyncio.gather で並行に投げる。
+
+  - クライアントは最初の呼び出し時にイベントループ上で作る（acreate_client は await が必要）
+  - ユーザー単位のキャッシュ（お気に入りアーティストID・統合音域）は同期版と共有する
+  - SQLite・recommender（CPU 処理）はイベントループを止めないようスレッドプールで実行する
+"""
+import asyncio
+import functools
+import logging
+from typing import Optional, List, Dict, Any
+
+from fastapi.concurrency import run_in_threadpool
+
+import database_supabase as sync_db
+from database_supabase import (
+    SUPABASE_URL, SUPABASE_KEY, SUPABASE_BACKEND,
+    _favorite_artist_ids_cache, _integrated_range_cache,
+)
+import supabase_queries as q
+from supabase_queries import (
+    first_row, merge_search_results, join_favorite_songs,
+    vocal_range_update, analysis_record_row, aggregate_row,
+    summarize_vocal_entries, attach_recommended_songs, FAVORITE_ARTISTS_LIMIT,
+)
+from metrics import SUPABASE_CALL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_lock: Optional[asyncio.Lock] = None
+
+
+async def get_client():
+    """非同期クライアントを返す（初回のみ作成）"""
+    global _client, _client_lock
+    if _client is not None:
+        return _client
+    if _client_lock is None:
+        _client_lock = asyncio.Lock()
+    async with _client_lock:
+        if _client is None:
+            if SUPABASE_BACKEND == "memory":
+                from supabase_memory import AsyncMemoryClient
+                _client = AsyncMemoryClient(sync_db.supabase)
+            else:
+                from supabase import acreate_client
+                _client = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+    return _client
+
+
+def _observed(fn):
+    """Supabase 呼び出しのレイテンシを関数名ごとに記録するデコレータ（同期版と同じラベル）"""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        with SUPABASE_CALL_SECONDS.time(call=fn.__name__):
+            return await fn(*args, **kwargs)
+    return wrapper
+
+
+# ============================================================
+# 楽曲関連のクエリ関数
+# ============================================================
+
+@_observed
+async def search_songs(query: str, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+    """曲名またはアーティスト名であいまい検索（曲名検索とアーティスト検索を並行に実行）"""
+    client = await get_client()
+    title_resp, artist_resp = await asyncio.gather(
+        q.songs_by_title(client, query, limit, offset).execute(),
+        q.artist_ids_by_name(client, query).execute(),
+    )
+
+    artist_songs: List[Dict[str, Any]] = []
+    if artist_resp.data:
+        artist_ids = [a["id"] for a in artist_resp.data]
+        artist_songs = (await q.songs_by_artists(client, artist_ids, limit).execute()).data or []
+
+    return merge_search_results(title_resp.data or [], artist_songs, limit)
+
+
+# ============================================================
+# ユーザープロファイル関連
+# ============================================================
+
+@_observed
+async def get_user_profile(user_id: str) -> Optional[Dict[str, Any]]:
+    """ユーザープロファイルを取得"""
+    client = await get_client()
+    return (await q.profile_by_id(client, user_id).execute()).data
+
+
+@_observed
+async def update_user_profile(user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """ユーザープロファイルを更新"""
+    client = await get_client()
+    return first_row(await q.update_profile(client, user_id, data).execute())
+
+
+async def update_vocal_range(
+    user_id: str,
+    vocal_min: Optional[str] = None,
+    vocal_max: Optional[str] = None,
+    falsetto: Optional[str] = None
+) -> Dict[str, Any]:
+    """ユーザーの最新声域を更新"""
+    return await update_user_profile(user_id, vocal_range_update(vocal_min, vocal_max, falsetto))
+
+
+# ============================================================
+# 分析履歴関連
+# ============================================================
+
+@_observed
+async def create_analysis_record(
+    user_id: str,
+    vocal_min: Optional[str],
+    vocal_max: Optional[str],
+    falsetto: Optional[str],
+    source_type: str,
+    file_name: Optional[str] = None,
+    result_json: Optional[Dict[str, Any]] = None
+) -> Optional[Dict[str, Any]]:
+    """分析履歴を新規作成"""
+    row = analysis_record_row(user_id, vocal_min, vocal_max, falsetto, source_type, file_name, result_json)
+    client = await get_client()
+    record = first_row(await q.insert_analysis_record(client, row).execute())
+    if record is not None:
+        await _add_to_vocal_aggregate(user_id, record)
+    return record
+
+
+@_observed
+async def get_analysis_history(user_id: str, limit: int = 50, before: Optional[str] = None) -> List[Dict[str, Any]]:
+    """ユーザーの分析履歴を取得（新しい順、result_json なし。before は前ページ最後の created_at）"""
+    client = await get_client()
+    return (await q.history_page(client, user_id, limit, before).execute()).data
+
+
+@_observed
+async def get_analysis_record(user_id: str, record_id: str) -> Optional[Dict[str, Any]]:
+    """分析履歴1件を result_json 付きで取得（他人の履歴は None）"""
+    client = await get_client()
+    return first_row(await q.analysis_record(client, user_id, record_id).execute())
+
+
+@_observed
+async def delete_analysis_record(user_id: str, record_id: str) -> bool:
+    """分析履歴を削除"""
+    try:
+        client = await get_client()
+        await q.delete_analysis_record(client, user_id, record_id).execute()
+    except Exception as e:
+        logger.warning("履歴削除エラー: %s", e)
+        return False
+    # 消えた履歴を集計行から除き、窓の外にあった履歴を繰り上げる
+    try:
+        await merge_vocal_aggregate(user_id)
+    except Exception as e:
+        logger.warning("統合音域の集計更新に失敗: %s", e)
+    return True
+
+
+# ============================================================
+# 統合音域（user_vocal_aggregates による集計。計算は supabase_queries.py）
+# ============================================================
+
+@_observed
+async def _read_vocal_aggregate(user_id: str) -> Optional[Dict[str, Any]]:
+    client = await get_client()
+    return aggregate_row(await q.vocal_aggregate(client, user_id).execute())
+
+
+@_observed
+async def _push_vocal_entry(user_id: str, record: Dict[str, Any]) -> bool:
+    client = await get_client()
+    return bool((await q.push_vocal_entry(client, user_id, record).execute()).data)
+
+
+@_observed
+async def merge_vocal_aggregate(user_id: str) -> Optional[Dict[str, Any]]:
+    """直近の履歴を集計行に合わせる"""
+    client = await get_client()
+    response = await q.aggregate_source(client, user_id).execute()
+    return aggregate_row(await q.merge_vocal_entries(client, user_id, response.data or []).execute())
+
+
+async def _add_to_vocal_aggregate(user_id: str, record: Dict[str, Any]) -> None:
+    """新しい履歴を集計行に追加する（失敗しても履歴の書き込みは成功扱い）"""
+    try:
+        if not await _push_vocal_entry(user_id, record):
+            await merge_vocal_aggregate(user_id)
+    except Exception as e:
+        logger.warning("統合音域の集計更新に失敗: %s", e)
+
+
+async def get_vocal_aggregate(user_id: str) -> Dict[str, Any]:
+    """集計行を読む（無ければ履歴から作る）"""
+    row = await _read_vocal_aggregate(user_id) or await merge_vocal_aggregate(user_id)
+    return row or {"entries": [], "updated_at": None}
+
+
+async def get_integrated_vocal_range(user_id: str, limit: int = 20) -> Optional[Dict[str, Any]]:
+    """
+    直近N件の分析履歴から統合音域と総合分析を計算（同期版と同じ結果・同じキャッシュ）。
+    集計行とお気に入りアーティストIDは並行に取得し、声質・おすすめ曲の計算はスレッドプールで行う。
+    """
+    try:
+        row, fav_artist_ids = await asyncio.gather(
+            get_vocal_aggregate(user_id),
+            get_favorite_artist_ids(user_id),
+        )
+        cache_key = (user_id, limit, row["updated_at"], tuple(fav_artist_ids))
+        cached = _integrated_range_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+
+        def compute() -> Optional[Dict[str, Any]]:
+            result = summarize_vocal_entries(row["entries"][:limit], limit)
+            if result is None:
+                return None
+            return attach_recommended_songs(result, fav_artist_ids)
+
+        result = await run_in_threadpool(compute)
+        if result is None:
+            return None
+        _integrated_range_cache.set(cache_key, result)
+        return dict(result)
+
+    except Exception as e:
+        logger.warning("統合音域計算エラー: %s", e, exc_info=True)
+        return None
+
+
+# ============================================================
+# お気に入り楽曲関連
+# ============================================================
+
+@_observed
+async def add_favorite_song(user_id: str, song_id: int) -> Optional[Dict[str, Any]]:
+    """お気に入りに楽曲を追加"""
+    try:
+        client = await get_client()
+        return first_row(await q.insert_favorite_song(client, user_id, song_id).execute())
+    except Exception as e:
+        logger.warning("お気に入り追加エラー: %s", e)
+        return None
+
+
+@_observed
+async def remove_favorite_song(user_id: str, song_id: int) -> bool:
+    """お気に入りから楽曲を削除"""
+    try:
+        client = await get_client()
+        await q.delete_favorite_song(client, user_id, song_id).execute()
+        return True
+    except Exception:
+        return False
+
+
+@_observed
+async def get_favorite_songs(user_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+    """ユーザーのお気に入り楽曲一覧を取得（楽曲情報の SQLite 参照はスレッドプールで行う）"""
+    client = await get_client()
+    response = await q.favorite_songs(client, user_id, limit).execute()
+    return await run_in_threadpool(join_favorite_songs, response.data)
+
+
+@_observed
+async def is_favorite(user_id: str, song_id: int) -> bool:
+    """楽曲がお気に入りに登録されているか確認"""
+    client = await get_client()
+    return len((await q.favorite_song_exists(client, user_id, song_id).execute()).data) > 0
+
+
+# ============================================================
+# お気に入りアーティスト関連
+# ============================================================
+
+@_observed
+async def add_favorite_artist(user_id: str, artist_id: int, artist_name: str) -> Optional[Dict[str, Any]]:
+    """
+    お気に入りアーティストを追加（上限10組）。
+    既に登録済みの場合はNoneを返す。
+    """
+    try:
+        client = await get_client()
+        # 上限チェック（挿入はこの結果に依存するので直列）
+        count_resp = await q.favorite_artist_count(client, user_id).execute()
+        if (count_resp.count or 0) >= FAVORITE_ARTISTS_LIMIT:
+            return None  # 上限超過
+
+        response = await q.insert_favorite_artist(client, user_id, artist_id, artist_name).execute()
+        _favorite_artist_ids_cache.invalidate(user_id)
+        return first_row(response)
+    except Exception as e:
+        logger.warning("お気に入りアーティスト追加エラー: %s", e)
+        return None
+
+
+@_observed
+async def remove_favorite_artist(user_id: str, artist_id: int) -> bool:
+    """お気に入りアーティストを削除"""
+    try:
+        client = await get_client()
+        await q.delete_favorite_artist(client, user_id, artist_id).execute()
+        _favorite_artist_ids_cache.invalidate(user_id)
+        return True
+    except Exception:
+        return False
+
+
+@_observed
+async def get_favorite_artists(user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+    """ユーザーのお気に入りアーティスト一覧を取得（登録が古い順）"""
+    client = await get_client()
+    return (await q.favorite_artists(client, user_id, limit).execute()).data or []
+
+
+@_observed
+async def is_favorite_artist(user_id: str, artist_id: int) -> bool:
+    """アーティストがお気に入りに登録されているか確認"""
+    client = await get_client()
+    return len((await q.favorite_artist_exists(client, user_id, artist_id).execute()).data) > 0
+
+
+async def get_favorite_artist_ids(user_id: str) -> List[int]:
+    """
+    お気に入りアーティストのIDリストを返す（recommenderで使用）。
+    同期版と同じキャッシュを使い、DBエラー時は空リストを返す（エラー結果はキャッシュしない）。
+    """
+    ids = _favorite_artist_ids_cache.get(user_id)
+    if ids is None:
+        try:
+            ids = await _fetch_favorite_artist_ids(user_id)
+        except Exception as e:
+            logger.warning("お気に入りアーティストID取得失敗: %s", e)
+            return []
+        _favorite_artist_ids_cache.set(user_id, ids)
+    return list(ids)
+
+
+@_observed
+async def _fetch_favorite_artist_ids(user_id: str) -> List[int]:
+    client = await get_client()
+    response = await q.favorite_artist_ids(client, user_id).execute()
+    return [row["artist_id"] for row in (response.data or [])]
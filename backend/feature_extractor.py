@@ -13,6 +13,9 @@ register_classifier.py の既存ロジックから6特徴量を抽出する共
   5: f0          基本周波数 (Hz)
 """
 
+from dataclasses import dataclass
+from functools import cached_property
+
 import numpy as np
 import librosa
 
@@ -58,17 +61,65 @@ def compute_hnr(y: np.ndarray, sr: int, f0: float) -> float:
         return 0.5
 
 
-def extract_features(y: np.ndarray, sr: int, f0: float) -> np.ndarray | None:
+@dataclass(eq=False)
+class SpectralFrame:
     """
-    音声フレームから6特徴量を抽出。
+    1フレーム分のスペクトル解析結果（ML判定とルール判定で共有）。
+
+    FFT・倍音ピーク・ノイズフロアは生成時に1回だけ計算する。
+    HNR とスペクトル重心は地声即決などで不要な場合があるため初回アクセス時に計算する。
+    """
+    y: np.ndarray
+    sr: int
+    f0: float
+    H: list            # H1〜H10 のピーク (dB)
+    noise_db: float    # ノイズフロア (dB, FFT振幅の5パーセンタイル)
+
+    @property
+    def h1(self) -> float:
+        return self.H[0]
+
+    @property
+    def h1_h2(self) -> float:
+        return self.H[0] - self.H[1]
+
+    @property
+    def is_voiced(self) -> bool:
+        """H1が十分に強く、H1-H2が異常値でない（判定可能なフレーム）"""
+        return self.h1 > -60 and self.h1_h2 >= -20.0
+
+    @cached_property
+    def hcount(self) -> int:
+        """有効倍音本数"""
+        return sum(1 for db in self.H[:10] if db > self.noise_db + 8.0)
+
+    @cached_property
+    def slope(self) -> float | None:
+        """倍音減衰スロープ。有効倍音が3本未満なら None"""
+        slope_pts = [(i + 1, self.H[i]) for i in range(8) if self.H[i] > self.noise_db + 8.0]
+        if len(slope_pts) < 3:
+            return None
+        xs = np.array([p[0] for p in slope_pts], dtype=float)
+        ys = np.array([p[1] for p in slope_pts], dtype=float)
+        return float(np.polyfit(xs, ys, 1)[0])
+
+    @cached_property
+    def hnr(self) -> float:
+        return compute_hnr(self.y, self.sr, self.f0)
+
+    @cached_property
+    def centroid_r(self) -> float:
+        """スペクトル重心 / f0"""
+        centroid = float(librosa.feature.spectral_centroid(y=self.y, sr=self.sr)[0, 0])
+        return centroid / self.f0 if self.f0 > 0 else 0.0
 
-    Args:
-        y:  音声波形（1フレーム分、2048サンプル程度）
-        sr: サンプリングレート
-        f0: 基本周波数 (Hz)
+
+def compute_spectral_frame(y: np.ndarray, sr: int, f0: float) -> SpectralFrame | None:
+    """
+    8192点FFTと H1〜H10 のピークを1回だけ計算して SpectralFrame を返す。
 
     Returns:
-        shape=(6,) の特徴量配列。抽出不能なら None。
+        SpectralFrame。f0 が不正またはフレームが短すぎる場合は None。
     """
     if f0 <= 0 or len(y) < 512:
         return None
@@ -83,32 +134,37 @@ def extract_features(y: np.ndarray, sr: int, f0: float) -> np.ndarray | None:
     noise_db = 20.0 * np.log10(float(np.percentile(fft, 5)) + 1e-12)
 
     H = [get_peak_db(fft, freqs, f0 * n, sr) for n in range(1, 11)]
-    h1 = H[0]
+    return SpectralFrame(y=y, sr=sr, f0=f0, H=H, noise_db=noise_db)
 
-    if h1 <= -60:
-        return None
 
-    h1_h2 = h1 - H[1]
-    if h1_h2 < -20.0:
+def features_from_spectral(spec: SpectralFrame) -> np.ndarray | None:
+    """SpectralFrame から6特徴量を組み立てる。判定不能フレームなら None"""
+    if not spec.is_voiced:
         return None
 
-    # 有効倍音本数
-    hcount = sum(1 for db in H[:10] if db > noise_db + 8.0)
-
-    # 倍音減衰スロープ
-    slope_pts = [(i + 1, H[i]) for i in range(8) if H[i] > noise_db + 8.0]
-    if len(slope_pts) >= 3:
-        xs = np.array([p[0] for p in slope_pts], dtype=float)
-        ys = np.array([p[1] for p in slope_pts], dtype=float)
-        slope = float(np.polyfit(xs, ys, 1)[0])
-    else:
+    slope = spec.slope
+    if slope is None:
         slope = -6.0  # デフォルト（中間的な値）
 
-    # HNR
-    hnr = compute_hnr(y, sr, f0)
+    return np.array(
+        [spec.h1_h2, spec.hcount, slope, spec.hnr, spec.centroid_r, spec.f0],
+        dtype=np.float32,
+    )
 
-    # スペクトル重心 / f0
-    centroid = float(librosa.feature.spectral_centroid(y=y, sr=sr)[0, 0])
-    centroid_r = centroid / f0 if f0 > 0 else 0.0
 
-    return np.array([h1_h2, hcount, slope, hnr, centroid_r, f0], dtype=np.float32)
\ No newline at end of file
+def extract_features(y: np.ndarray, sr: int, f0: float) -> np.ndarray | None:
+    """
+    音声フレームから6特徴量を抽出。
+
+    Args:
+        y:  音声波形（1フレーム分、2048サンプル程度）
+        sr: サンプリングレート
+        f0: 基本周波数 (Hz)
+
+    Returns:
+        shape=(6,) の特徴量配列。抽出不能なら None。
+    """
+    spec = compute_spectral_frame(y, sr, f0)
+    if spec is None:
+        return None
+    return features_from_spectral(spec)
@@ -0,0 +1,308 @@
+"""
+live_pitch.py — マイク入力のリアルタイム音域解析（/ws/live-pitch）
+
+ブラウザから届く 16kHz モノラル PCM を固定長の窓（LIVE_PITCH_WINDOW_SECONDS）ごとに CREPE にかけ、
+バッチ解析（analyzer.analyze_array）と同じ判定をフレームごとに逐次行う:
+  - 信頼度・人声範囲フィルタ（_filter_frames の最初の閾値 CONF_THRESHOLDS[0]）
+  - 中央値から見た現実的な音域（realistic_bounds）・オクターブ補正（fix_octave_error）
+  - 段階的信頼度要求（graduated_min_conf）・地声/裏声判定（classify_registers）
+  - 裏声の連続フレーム要件と RMS フィルタ（filter_falsetto_consecutive / filter_falsetto_rms）
+
+フレームは判定したらすぐ online_stats.SemitoneHistogram（0.1半音幅のヒストグラム）に積み、
+一覧は持たない。中央値・現実的な音域・オクターブ補正の基準は全体のヒストグラム、判定結果は
+地声・裏声のヒストグラムに入る。サマリーはヒストグラムの上で finalize_registers と同じ手順
+（最小比率・表示下限・外れ値除去・孤立値除去・最高音付近の混在解消・持続要件つき最高音）を
+たどるので、集計の手間は歌った長さによらず一定（約520ビン）。誤差はビン幅程度。
+
+バッチとの違い:
+  - 中央値はそれまでに届いたフレームだけから求め、オクターブ補正は判定した時点の中央値で確定する
+    （歌い始めの数秒は判定が揺れる）
+  - 音量正規化は曲全体のピークではなく、それまでのピークを基準にする
+  - 信頼度の閾値は固定（バッチは有効フレームが足りなければ閾値を下げる）
+  - 裏声の RMS フィルタの基準（地声 RMS の中央値）は、連続区間が要件を満たした時点のもの
+
+メモリは接続ごとに一定: 音声は窓と前後の文脈の分だけ、裏声は要件に満たない直近の連続区間
+（FALSETTO_MIN_CONSECUTIVE - 1 フレームまで）だけを保持する。CREPE の負荷を抑えるため、
+解析する長さは LIVE_PITCH_MAX_SECONDS までとする（超えたら LiveSessionFull）。
+"""
+import logging
+
+import numpy as np
+import torch
+
+from analyzer import run_crepe, fix_octave_error, realistic_bounds, graduated_min_conf
+from online_stats import SemitoneHistogram, clean_range, range_summary
+from register_classifier import (
+    classify_registers, new_register_stats, print_register_summary, record_register_metrics,
+)
+from note_converter import hz_to_label_and_hz
+from config import (
+    VOICE_MIN_HZ, VOICE_MAX_HZ, CREPE_SR, CREPE_HOP_LENGTH, CONF_THRESHOLDS,
+    CHEST_OUTLIER_PERCENTILE, CHEST_OUTLIER_GAP_ST,
+    FALSETTO_OUTLIER_PERCENTILE, FALSETTO_OUTLIER_GAP_ST,
+    NO_FALSETTO_OUTLIER_PERCENTILE, NO_FALSETTO_OUTLIER_GAP_ST,
+    FALSETTO_MIN_CONSECUTIVE, FALSETTO_RMS_RATIO, FALSETTO_MIN_RATIO, FALSETTO_RESCUE_SEMITONES,
+    FALSETTO_DISPLAY_MIN_HZ, CLEANUP_SEMITONES,
+    LIVE_PITCH_WINDOW_SECONDS, LIVE_PITCH_MAX_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+_REGISTER_FRAME = 2048          # classify_registers に渡すフレーム長（_classify_frames と同じ）
+_MIN_CONF = CONF_THRESHOLDS[0]
+_RMS_MIN = 1e-5                 # 地声 RMS のヒストグラムの下限（これ未満は下限に丸める）
+
+
+class LiveSessionFull(Exception):
+    """1接続で解析できる長さ（LIVE_PITCH_MAX_SECONDS）に達した"""
+
+
+def decode_pcm(data: bytes, sample_format: str = "f32") -> np.ndarray:
+    """WebSocket のバイナリメッセージ → float32 配列（f32: float32 LE, s16: int16 LE）"""
+    if sample_format == "s16":
+        if len(data) % 2:
+            raise ValueError("s16 の PCM は2バイト単位で送ってください")
+        return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+    if len(data) % 4:
+        raise ValueError("f32 の PCM は4バイト単位で送ってください")
+    return np.frombuffer(data, dtype="<f4").astype(np.float32)
+
+
+class LivePitchSession:
+    """1接続分の状態。feed() で PCM を渡し、summary() でそれまでの音域を取り出す"""
+
+    def __init__(self, no_falsetto: bool = False, hop_length: int = CREPE_HOP_LENGTH,
+                 max_seconds: float = LIVE_PITCH_MAX_SECONDS):
+        self.no_falsetto = no_falsetto
+        self.sr = CREPE_SR
+        self.hop = hop_length
+        self.window = max(1, round(LIVE_PITCH_WINDOW_SECONDS * self.sr / hop_length)) * hop_length
+        # 窓の前後に付ける文脈（hop の倍数）: 窓の端のフレームでもレジスター判定用の 2048 サンプルが取れる長さ
+        self.context = -(-(_REGISTER_FRAME // 2) // hop_length) * hop_length
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.stats = new_register_stats()
+
+        self._left = np.zeros(self.context, dtype=np.float32)   # 直前の窓の末尾
+        self._pending = np.zeros(0, dtype=np.float32)           # まだ窓として処理していない音声
+        self._peak = 0.0
+        self.frames_total = 0                                   # 処理済みのフレーム数（経過時間 / hop）
+        self.max_frames = int(max_seconds * self.sr / hop_length)
+
+        # 信頼度・人声範囲を通ったフレーム（中央値用）と、オクターブ補正後のフレーム（信頼度で重み付け）
+        self._raw = SemitoneHistogram()
+        self._fixed = SemitoneHistogram()
+        self._m = 0                                             # オクターブ補正後のフレーム数
+        self.median_freq = 0.0
+
+        # レジスター判定の結果（オクターブ補正後の音高）と、裏声の RMS フィルタに使う地声の RMS（対数ビン）
+        self._chest = SemitoneHistogram()
+        self._falsetto = SemitoneHistogram()
+        self._chest_rms = SemitoneHistogram(_RMS_MIN, 1.0, bins_per_semitone=1)
+        # 連続フレーム要件をまだ満たしていない直近の裏声の連続区間 [(fixed, rms), ...]
+        self._run: list = []
+        self._run_len = 0
+        self._run_last = -3                                     # 区間の最後の裏声フレームの通し番号
+        self.current_hz = None          # 直近の有声フレームの音高（画面表示用）
+
+    @property
+    def seconds(self) -> float:
+        return self.frames_total * self.hop / self.sr
+
+    def feed(self, pcm: np.ndarray) -> None:
+        """PCM を追加し、窓がそろった分だけ解析する"""
+        if self.frames_total >= self.max_frames:
+            raise LiveSessionFull()
+        self._pending = np.concatenate([self._pending, pcm])
+        need = self.window + self.context
+        while len(self._pending) >= need:
+            self._process(self._pending[:need], self.window // self.hop)
+            self._pending = self._pending[self.window:]
+            if self.frames_total >= self.max_frames:
+                raise LiveSessionFull()
+
+    def flush(self) -> None:
+        """残りの音声（窓に満たない末尾）を無音で埋めて解析する"""
+        need = self.window + self.context
+        while len(self._pending) and self.frames_total < self.max_frames:
+            block = np.zeros(need, dtype=np.float32)
+            block[:min(len(self._pending), need)] = self._pending[:need]
+            n_frames = min(-(-len(self._pending) // self.hop), self.window // self.hop)
+            self._process(block, n_frames)
+            self._pending = self._pending[self.window:]
+
+    def _process(self, block: np.ndarray, n_frames: int) -> None:
+        """窓（＋後ろの文脈）1つ分: CREPE → フィルタ → レジスター判定"""
+        seg = np.concatenate([self._left, block])
+        self._left = seg[self.window:self.window + self.context].copy()
+        n_frames = min(n_frames, self.max_frames - self.frames_total)
+
+        f0, conf = run_crepe(torch.from_numpy(seg).unsqueeze(0), self.sr, self.hop, self.device, 'tiny')
+        first = self.context // self.hop   # seg の先頭は前の窓の文脈
+        f0 = f0.squeeze(0).detach().cpu().numpy()[first:first + n_frames]
+        conf = conf.squeeze(0).detach().cpu().numpy()[first:first + n_frames]
+
+        # バッチと同じく音量を 0.95 に正規化（曲全体のピークの代わりにそれまでのピーク）
+        self._peak = max(self._peak, float(np.max(np.abs(block))))
+        scaled = seg * (0.95 / (self._peak + 1e-8))
+
+        valid = np.flatnonzero((conf >= _MIN_CONF) & (f0 >= VOICE_MIN_HZ) & (f0 <= VOICE_MAX_HZ))
+        self._raw.add(f0[valid])
+        self.frames_total += n_frames
+        if len(valid) == 0:
+            return
+        self.current_hz = float(f0[valid[-1]])
+
+        # 中央値 → 現実的な音域 → オクターブ補正の基準（_filter_frames と同じ順序）
+        raw_median = self._raw.quantile(0.5)
+        lower, upper = realistic_bounds(raw_median)
+        inside_median = self._raw.quantile(0.5, lo_hz=lower, hi_hz=upper)
+        reference = inside_median if inside_median is not None else raw_median
+
+        new_frames = []
+        for j in valid:
+            freq, c = float(f0[j]), float(conf[j])
+            if not (lower <= freq <= upper):
+                continue
+            fixed = fix_octave_error(freq, c, reference)
+            self._fixed.add(fixed, c)
+            new_frames.append((self._m, freq, fixed, c, self.context + int(j) * self.hop))
+            self._m += 1
+        if self._fixed.count == 0:
+            return
+        self.median_freq = self._fixed.quantile(0.5, weighted=True)
+
+        if self.no_falsetto:
+            return
+        targets = []   # (index, fixed, conf, rms, frame)
+        for index, freq, fixed, c, center in new_frames:
+            if not (VOICE_MIN_HZ <= fixed <= VOICE_MAX_HZ):
+                continue
+            if c < graduated_min_conf(freq, self.median_freq):
+                continue
+            frame = scaled[max(0, center - _REGISTER_FRAME // 2):center + _REGISTER_FRAME // 2]
+            frame_rms = float(np.sqrt(np.mean(frame ** 2)))
+            targets.append((index, fixed, c, frame_rms, frame))
+        # 窓内のフレームをまとめて判定する（ML推論は窓ごとに1回）
+        regs = classify_registers([(frame, fixed, c) for _, fixed, c, _, frame in targets],
+                                  self.sr, self.median_freq, False, stats=self.stats)
+        for (index, fixed, c, frame_rms, _), reg in zip(targets, regs):
+            if reg == "falsetto":
+                self._add_falsetto(index, fixed, frame_rms)
+            elif reg == "chest":
+                self._chest.add(fixed)
+                self._chest_rms.add(max(frame_rms, _RMS_MIN))
+
+    def _add_falsetto(self, index: int, fixed: float, rms: float) -> None:
+        """
+        裏声フレームを連続フレーム要件（間隔2以下を連続とみなす）→ RMS フィルタの順に通して積む。
+        区間が FALSETTO_MIN_CONSECUTIVE フレームに達したら保留分も含めて確定し、以降は1フレームずつ確定する
+        """
+        if index - self._run_last > 2:
+            self._run, self._run_len = [], 0
+        self._run_last = index
+        self._run_len += 1
+        self._run.append((fixed, rms))
+        if self._run_len < FALSETTO_MIN_CONSECUTIVE:
+            return
+        chest_rms_median = self._chest_rms.quantile(0.5)
+        for f, r in self._run:
+            if chest_rms_median is None or r >= chest_rms_median * FALSETTO_RMS_RATIO:
+                self._falsetto.add(f)
+        self._run = []
+
+    def summary(self) -> dict:
+        """それまでの音域（analyze_array の結果と同じキー名。該当なしのキーは含めない）"""
+        result = {"seconds": round(self.seconds, 2), "voiced_frames": self._m}
+        if self.current_hz is not None:
+            result["current_hz"] = round(self.current_hz, 1)
+            result["current_note"] = hz_to_label_and_hz(self.current_hz)[0]
+        if self._fixed.count == 0:
+            return result
+
+        # no_falsetto とレジスター判定の結果が無い場合（バッチの「全フレームを地声として処理」）は
+        # 補正後のフレーム全体を地声として集計する
+        if self.no_falsetto:
+            return self._histogram_summary(result, NO_FALSETTO_OUTLIER_PERCENTILE, NO_FALSETTO_OUTLIER_GAP_ST)
+        if self._chest.count == 0 and self._falsetto.count == 0:
+            return self._histogram_summary(result, CHEST_OUTLIER_PERCENTILE, CHEST_OUTLIER_GAP_ST)
+
+        chest, falsetto = self._finalize_registers()
+        total = chest.count + falsetto.count
+        if not total:
+            return result
+        registers = [h for h in (chest, falsetto) if h.count]
+        result["overall_min"], result["overall_min_hz"] = hz_to_label_and_hz(min(h.min() for h in registers))
+        result["overall_max"], result["overall_max_hz"] = hz_to_label_and_hz(max(h.max() for h in registers))
+        result.update(_range_fields(chest, "chest"))
+        result.update(_range_fields(falsetto, "falsetto"))
+        result["chest_ratio"] = round(chest.count / total * 100, 1)
+        result["falsetto_ratio"] = round(falsetto.count / total * 100, 1)
+        return result
+
+    def _finalize_registers(self) -> tuple:
+        """analyzer.finalize_registers の最小比率フィルタ以降をヒストグラムで行う → (地声, 裏声)"""
+        chest, falsetto = self._chest.copy(), self._falsetto
+        centers = chest.bin_hz(np.arange(chest.n_bins))
+
+        # 最小比率: 裏声が少なすぎれば、地声 P97 + FALSETTO_RESCUE_SEMITONES 以内は地声に戻し、残りは捨てる
+        if falsetto.count and falsetto.count / (chest.count + falsetto.count) < FALSETTO_MIN_RATIO:
+            if chest.count:
+                rescue = chest.percentile(97) * 2 ** (FALSETTO_RESCUE_SEMITONES / 12)
+                chest.merge(falsetto.subset(centers <= rescue))
+            falsetto = falsetto.subset(np.zeros(falsetto.n_bins, dtype=bool))
+
+        # 表示下限: FALSETTO_DISPLAY_MIN_HZ 未満の「裏声」は地声に再分類
+        low = centers < FALSETTO_DISPLAY_MIN_HZ
+        chest.merge(falsetto.subset(low))
+        falsetto = falsetto.subset(~low)
+
+        chest = clean_range(chest, CHEST_OUTLIER_PERCENTILE, CHEST_OUTLIER_GAP_ST)
+        falsetto = clean_range(falsetto, FALSETTO_OUTLIER_PERCENTILE, FALSETTO_OUTLIER_GAP_ST)
+
+        # 最高音付近の混在: 両方あれば裏声を優先し、裏声の最高音と同じ音名の地声も外す
+        if chest.count and falsetto.count:
+            threshold = max(chest.max(), falsetto.max()) / 2 ** (CLEANUP_SEMITONES / 12)
+            if chest.max() >= threshold and falsetto.max() >= threshold:
+                chest = chest.subset(centers < threshold)
+        if chest.count and falsetto.count:
+            f_label, f_hz = hz_to_label_and_hz(falsetto.max())
+            if hz_to_label_and_hz(chest.max())[0] == f_label:
+                same = np.zeros(chest.n_bins, dtype=bool)
+                for b in np.flatnonzero((chest.counts > 0) & (centers >= f_hz * 2 ** (-1 / 12))):
+                    same[b] = hz_to_label_and_hz(float(centers[b]))[0] == f_label
+                chest = chest.subset(~same)
+        return chest, falsetto
+
+    def _histogram_summary(self, result: dict, percentile: float, gap: float) -> dict:
+        """補正後のフレーム全体を地声として集計する"""
+        cleaned = clean_range(self._fixed, percentile, gap)
+        if not cleaned.count:
+            return result
+        result["overall_min"], result["overall_min_hz"] = hz_to_label_and_hz(cleaned.min())
+        result["overall_max"], result["overall_max_hz"] = hz_to_label_and_hz(cleaned.max())
+        result.update(_range_fields(cleaned, "chest"))
+        result["chest_ratio"] = 100.0
+        result["falsetto_ratio"] = 0.0
+        return result
+
+    def close(self) -> None:
+        """接続終了時: レジスター判定の集計をログ・メトリクスに出す"""
+        print_register_summary(self.stats)
+        record_register_metrics(self.stats)
+        logger.info("リアルタイム解析終了: %.1f秒, 有声%sフレーム", self.seconds, self._m)
+
+
+def _range_fields(hist: SemitoneHistogram, prefix: str) -> dict:
+    """analyzer.range_fields のヒストグラム版（外れ値除去済みのヒストグラムを渡す）。空なら {}"""
+    if not hist.count:
+        return {}
+    summary = range_summary(hist)
+    lo_label, lo_hz = hz_to_label_and_hz(summary["min_hz"])
+    hi_label, hi_hz = hz_to_label_and_hz(summary["max_hz"])
+    return {
+        f"{prefix}_min":    lo_label,
+        f"{prefix}_max":    hi_label,
+        f"{prefix}_min_hz": lo_hz,
+        f"{prefix}_max_hz": hi_hz,
+        f"{prefix}_count":  summary["count"],
+    }
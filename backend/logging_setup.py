@@ -0,0 +1,99 @@
+"""
+logging_setup.py — ログ出力の共通設定
+
+各モジュールは `logger = logging.getLogger(__name__)` でロガーを持ち、
+メッセージは `logger.debug("f0=%.0fHz", f0)` のように % 形式で渡す。
+% 形式なら、レベルが無効なときは文字列の組み立て自体が行われない。
+
+  LOG_LEVEL  : DEBUG / INFO (デフォルト) / WARNING / ERROR
+  LOG_FORMAT : text (デフォルト) / json（1行1JSON、ログ集約用）
+
+すべてのレコードにはリクエストID (request_id) が付く。app_factory のミドルウェアが
+X-Request-ID ヘッダー（無ければ新規採番）を contextvars に入れ、同じリクエストの
+ログを後から突き合わせられるようにする。
+"""
+import json
+import logging
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+
+from config import LOG_FORMAT, LOG_LEVEL
+
+_request_id: ContextVar[str] = ContextVar("request_id", default="-")
+
+# LogRecord の標準属性（extra= で渡された項目と区別するため）
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+_configured = False
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def get_request_id() -> str:
+    return _request_id.get()
+
+
+def set_request_id(request_id: str):
+    """リクエストIDを設定し、reset 用のトークンを返す"""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token) -> None:
+    _request_id.reset(token)
+
+
+class RequestIdFilter(logging.Filter):
+    """レコードに現在のリクエストIDを付与する"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコードを1行のJSONにする。extra= で渡した項目もそのままフィールドになる"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+                  + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+_TEXT_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+    """ルートロガーにハンドラーを1つだけ設定する（複数回呼んでも1回分）"""
+    global _configured
+    if _configured:
+        return
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.addFilter(RequestIdFilter())
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(_TEXT_FORMAT))
+
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(getattr(logging, level, logging.INFO))
+    # 依存ライブラリの DEBUG ログまで出さない
+    for noisy in ("numba", "urllib3", "httpx", "httpcore", "hpack", "matplotlib"):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+    _configured = True
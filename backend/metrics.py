@@ -0,0 +1,213 @@
+"""
+metrics.py — プロセス内メトリクスと /metrics 用テキスト出力
+
+外部コレクタなしで、プロセス内でレイテンシ・カウンタ等を集計し、
+Prometheus のテキスト形式 (text/plain; version=0.0.4) で出力する。
+ワーカープロセスごとに独立した値を持つ（スクレイプ側でワーカー単位に集計する）。
+"""
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# 秒単位のデフォルトバケット（ファイル変換〜Demucsまでカバー）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_REGISTRY: dict = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _label_key(labelnames: tuple, labels: dict) -> tuple:
+    return tuple(str(labels.get(n, "")) for n in labelnames)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple, key: tuple, extra: dict | None = None) -> str:
+    pairs = list(zip(labelnames, key)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """単調増加するカウンタ"""
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values: dict = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    """増減する値（処理中リクエスト数など）"""
+    type_name = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def replace(self, value: float, **labels) -> None:
+        """全サンプルを消して1件だけ設定する（info 系ゲージ用。スクレイプ中に空の状態が見えない）"""
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values = {key: value}
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram:
+    """ラベルごとにバケット別の件数・合計・件数を保持する"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict = {}  # labels(tuple) -> [bucket_counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            if idx < len(self.buckets):
+                entry[0][idx] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def snapshot(self) -> dict:
+        """labels(tuple) -> (累積バケット件数, 合計, 件数)"""
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._values.items()]
+        result = {}
+        for key, counts, total, count in items:
+            cumulative, running = [], 0
+            for c in counts:
+                running += c
+                cumulative.append(running)
+            result[key] = (cumulative, total, count)
+        return result
+
+    def render(self) -> list:
+        lines = []
+        for key, (cumulative, total, count) in self.snapshot().items():
+            for le, c in zip(self.buckets, cumulative):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': _format_value(float(le))})} {c}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def _get_or_create(cls, name: str, help_text: str, labelnames: tuple, **kwargs):
+    with _REGISTRY_LOCK:
+        metric = _REGISTRY.get(name)
+        if metric is None:
+            metric = _REGISTRY[name] = cls(name, help_text, labelnames, **kwargs)
+        return metric
+
+
+def counter(name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+    """名前で登録済みのカウンタを返す（なければ作成）"""
+    return _get_or_create(Counter, name, help_text, labelnames)
+
+
+def gauge(name: str, help_text: str, labelnames: tuple = ()) -> Gauge:
+    """名前で登録済みのゲージを返す（なければ作成）"""
+    return _get_or_create(Gauge, name, help_text, labelnames)
+
+
+def histogram(name: str, help_text: str, labelnames: tuple = (),
+              buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    """名前で登録済みのヒストグラムを返す（なければ作成）"""
+    return _get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+
+def timed(metric: Histogram, **labels):
+    """関数の処理時間をヒストグラムに記録するデコレータ"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with metric.time(**labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render_text() -> str:
+    """登録済み全メトリクスをテキスト形式で出力"""
+    with _REGISTRY_LOCK:
+        metrics = list(_REGISTRY.values())
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ============================================================
+# 共通メトリクス
+# ============================================================
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds", "HTTPリクエストの処理時間（秒）", ("method", "route", "status"),
+)
+SQLITE_QUERY_SECONDS = histogram(
+    "sqlite_query_duration_seconds", "songs.db へのクエリ時間（秒）", ("caller",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+SUPABASE_CALL_SECONDS = histogram(
+    "supabase_call_duration_seconds", "Supabase 呼び出しのレイテンシ（秒）", ("call",),
+)
@@ -10,7 +10,8 @@ train_classifier.py — 地声/裏声 ML分類器の学習
      python train_classifier.py
 
   3. モデルが models/register_model.joblib に保存される
-     → register_classifier.py が自動的にロードして使用
+     同時に推論用の軽量形式 models/register_model.npz も書き出される
+     → register_classifier.py が自動的にロードして使用（.npz を優先、sklearn 不要）
 
 オプション:
   --no-cv          交差検証をスキップ
@@ -34,11 +35,13 @@ from sklearn.pipeline import Pipeline
 import joblib
 
 from feature_extractor import FEATURE_NAMES
+from compact_model import export_compact_model, load_compact_model
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "training_data")
 DATASET_PATH = os.path.join(DATA_DIR, "dataset.npz")
 MODEL_DIR = os.path.join(os.path.dirname(__file__), "models")
 MODEL_PATH = os.path.join(MODEL_DIR, "register_model.joblib")
+COMPACT_MODEL_PATH = os.path.join(MODEL_DIR, "register_model.npz")
 
 
 def load_dataset():
@@ -140,9 +143,31 @@ def train_and_save(X, y, model_name, pipeline):
     os.makedirs(MODEL_DIR, exist_ok=True)
     joblib.dump(pipeline, MODEL_PATH)
     print(f"\n[OK] モデル保存: {MODEL_PATH}")
+
+    export_and_verify(pipeline, X)
     print(f"     register_classifier.py がこのモデルを自動的にロードします。")
 
 
+def export_and_verify(pipeline, X):
+    """推論用の軽量形式 (.npz) を書き出し、sklearn と同じ確率が出ることを確認"""
+    # 書き出し途中のファイルをサーバーが読まないよう、一時ファイルに書いてから置き換える
+    tmp_path = COMPACT_MODEL_PATH + ".tmp"
+    export_compact_model(pipeline, tmp_path)
+
+    compact = load_compact_model(tmp_path)
+    X32 = np.asarray(X, dtype=np.float32)
+    max_diff = float(np.max(np.abs(compact.predict_proba(X32) - pipeline.predict_proba(X32))))
+    if max_diff > 1e-4:
+        os.remove(tmp_path)
+        print(f"[WARN] 軽量モデルの出力がsklearnと一致しません (max diff={max_diff:.2e})。書き出しを中止します")
+        if os.path.exists(COMPACT_MODEL_PATH):
+            os.remove(COMPACT_MODEL_PATH)  # 古い軽量モデルが優先されないように削除
+        return
+
+    os.replace(tmp_path, COMPACT_MODEL_PATH)
+    print(f"[OK] 軽量モデル保存: {COMPACT_MODEL_PATH} (sklearnとの最大差={max_diff:.2e})")
+
+
 def main():
     parser = argparse.ArgumentParser(description="地声/裏声分類器の学習")
     parser.add_argument("--no-cv", action="store_true", help="交差検証をスキップ")
@@ -0,0 +1,107 @@
+"""
+model_registry.py — 地声/裏声 MLモデルのロードとホットリロード
+
+軽量形式 (.npz, compact_model.py) があればそれを優先し、無ければ joblib の Pipeline を使う。
+モデルファイルの更新チェック（stat）は解析リクエストごとに1回だけ行い、
+フレーム単位の推論ではロード済みスナップショットをそのまま使う。
+再ロード時は新しい LoadedModel を組み立ててから参照を差し替えるため、
+解析中のリクエストは古いモデルのまま最後まで一貫して判定できる。
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class LoadedModel:
+    model: Any
+    path: str
+    mtime: float
+    version: str      # モデルファイルの sha256 先頭12桁
+    loaded_at: float
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _load_model_file(path: str) -> Any:
+    if path.endswith(".npz"):
+        # scikit-learn を import しない軽量ランタイム
+        from compact_model import load_compact_model
+        return load_compact_model(path)
+    import joblib
+    return joblib.load(path)
+
+
+def _stat_first(paths: tuple) -> Optional[tuple]:
+    """優先順に並んだ候補のうち、存在する最初のファイルの (path, mtime) を返す"""
+    for path in paths:
+        try:
+            return path, os.path.getmtime(path)
+        except OSError:
+            continue
+    return None
+
+
+class ModelRegistry:
+    """モデルファイルの候補パス（優先順）を持ち、最新のロード結果を保持する"""
+
+    def __init__(self, *paths: str):
+        self.paths = paths
+        self._current: Optional[LoadedModel] = None
+        self._checked = False
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[LoadedModel]:
+        """ロード済みモデルを返す（ファイルは見に行かない）。未チェックなら1回だけ refresh する"""
+        if not self._checked:
+            return self.refresh()
+        return self._current
+
+    def refresh(self) -> Optional[LoadedModel]:
+        """モデルファイルが更新されていたら再ロード（学習後にサーバー再起動不要）"""
+        found = _stat_first(self.paths)
+        if found is None:
+            if self._current is not None:
+                logger.info("MLモデルが削除されました: %s", self._current.path)
+            self._current = None
+            self._checked = True
+            return None
+
+        path, mtime = found
+        current = self._current
+        if current is not None and current.path == path and current.mtime == mtime:
+            return current  # 変更なし、キャッシュ済みモデルを使用
+
+        with self._lock:
+            # 別スレッドが先に再ロードしていればそれを使う
+            current = self._current
+            if current is not None and current.path == path and current.mtime == mtime:
+                return current
+            try:
+                loaded = LoadedModel(
+                    model=_load_model_file(path),
+                    path=path,
+                    mtime=mtime,
+                    version=_file_sha256(path)[:12],
+                    loaded_at=time.time(),
+                )
+                logger.info("MLモデルをロード: %s (version=%s)", path, loaded.version)
+            except Exception as e:
+                logger.warning("MLモデルのロード失敗 (%s): %s", path, e)
+                loaded = None
+            self._current = loaded  # 参照の差し替えのみ（アトミック）
+            self._checked = True
+            return loaded
@@ -0,0 +1,184 @@
+"""
+online_stats.py — 音域推定のオンライン統計（ストリーミング・長時間入力向け）
+
+バッチ解析（analyzer）の統計は全フレームを配列で持ち、argsort / percentile / 総当たりで求める。
+ここではフレームを VOICE_MIN_HZ〜VOICE_MAX_HZ の対数周波数ビン（1/ONLINE_STATS_BINS_PER_SEMITONE 半音幅）の
+ヒストグラムに積むだけにし、メモリと集計コストを入力の長さによらず一定（約520ビン）にする。
+
+  SemitoneHistogram  重み付き / 重みなしの分位点（中央値・パーセンタイル）、±n 半音内のフレーム数
+  robust_max         持続フレーム要件つきの最高音（analyzer._get_robust_max のヒストグラム版）
+  clean_range        remove_statistical_outliers → remove_isolated_extremes をヒストグラム上で行う
+  summarize_range    clean_range → 最低音・最高音（_get_robust_max）をまとめて求める
+
+誤差: 分位点はビン内を対数補間するのでビン幅（既定 0.1 半音 = 10 セント）以内。外れ値・孤立値の判定と
+±1 半音の近傍数はビン単位で行うため、境界付近のフレームの扱いがバッチと1ビンずれることがある。
+最低音・最高音は各ビンに入った実際の周波数の最小・最大を返す。
+バッチとの差は benchmarks/run_benchmarks.py の online_stats/<シナリオ> で測り、thresholds.json で上限を決めている。
+"""
+from typing import Optional
+
+import numpy as np
+
+from config import VOICE_MIN_HZ, VOICE_MAX_HZ, MIN_SUSTAIN_FRAMES, ONLINE_STATS_BINS_PER_SEMITONE
+
+
+class SemitoneHistogram:
+    """対数周波数ビンの重み付きヒストグラム（ビンごとの実際の最小・最大周波数も持つ）"""
+
+    def __init__(self, fmin: float = VOICE_MIN_HZ, fmax: float = VOICE_MAX_HZ,
+                 bins_per_semitone: int = ONLINE_STATS_BINS_PER_SEMITONE):
+        self.fmin, self.fmax = float(fmin), float(fmax)
+        self.bins_per_semitone = bins_per_semitone
+        self.n_bins = int(np.floor(12 * np.log2(self.fmax / self.fmin) * bins_per_semitone)) + 1
+        self.counts = np.zeros(self.n_bins, dtype=np.int64)      # フレーム数（持続・近傍の判定用）
+        self.weights = np.zeros(self.n_bins, dtype=np.float64)   # 重み（CREPE 信頼度など）の合計
+        self.lo = np.full(self.n_bins, np.inf)
+        self.hi = np.full(self.n_bins, -np.inf)
+
+    # ---- 追加 ----
+    def bin_of(self, freqs) -> np.ndarray:
+        b = np.floor(12 * np.log2(np.asarray(freqs, dtype=np.float64) / self.fmin) * self.bins_per_semitone)
+        return np.clip(b, 0, self.n_bins - 1).astype(np.int64)
+
+    def add(self, freqs, weights=None) -> None:
+        """周波数（スカラー or 配列）を追加する。範囲外（fmin 未満・fmax 超）は無視する"""
+        freqs = np.atleast_1d(np.asarray(freqs, dtype=np.float64))
+        weights = np.ones_like(freqs) if weights is None else np.broadcast_to(
+            np.asarray(weights, dtype=np.float64), freqs.shape)
+        keep = (freqs >= self.fmin) & (freqs <= self.fmax)
+        freqs, weights = freqs[keep], weights[keep]
+        if len(freqs) == 0:
+            return
+        b = self.bin_of(freqs)
+        np.add.at(self.counts, b, 1)
+        np.add.at(self.weights, b, weights)
+        np.minimum.at(self.lo, b, freqs)
+        np.maximum.at(self.hi, b, freqs)
+
+    def merge(self, other: "SemitoneHistogram") -> None:
+        """other（同じビン構成）のフレームをこのヒストグラムに足す"""
+        self.counts = self.counts + other.counts
+        self.weights = self.weights + other.weights
+        self.lo = np.minimum(self.lo, other.lo)
+        self.hi = np.maximum(self.hi, other.hi)
+
+    def copy(self) -> "SemitoneHistogram":
+        return self.subset(np.ones(self.n_bins, dtype=bool))
+
+    def subset(self, keep: np.ndarray) -> "SemitoneHistogram":
+        """keep（ビンごとの bool）のビンだけを残したコピー"""
+        out = SemitoneHistogram(self.fmin, self.fmax, self.bins_per_semitone)
+        out.counts = np.where(keep, self.counts, 0)
+        out.weights = np.where(keep, self.weights, 0.0)
+        out.lo = np.where(keep, self.lo, np.inf)
+        out.hi = np.where(keep, self.hi, -np.inf)
+        return out
+
+    # ---- 集計 ----
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def bin_hz(self, b) -> np.ndarray:
+        """ビンの中心周波数"""
+        return self.fmin * 2 ** ((np.asarray(b) + 0.5) / (12 * self.bins_per_semitone))
+
+    def min(self) -> Optional[float]:
+        nonzero = np.flatnonzero(self.counts)
+        return float(self.lo[nonzero[0]]) if len(nonzero) else None
+
+    def max(self) -> Optional[float]:
+        nonzero = np.flatnonzero(self.counts)
+        return float(self.hi[nonzero[-1]]) if len(nonzero) else None
+
+    def quantile(self, q: float, weighted: bool = False,
+                 lo_hz: Optional[float] = None, hi_hz: Optional[float] = None) -> Optional[float]:
+        """
+        分位点（q=0.5 で中央値）。weighted=True なら重み付き。lo_hz〜hi_hz を指定するとその範囲の
+        ビンだけで求める。ビン内は対数周波数で線形補間し、そのビンの実際の最小〜最大に収める。
+        """
+        mass = (self.weights if weighted else self.counts).astype(np.float64)
+        if lo_hz is not None or hi_hz is not None:
+            centers = self.bin_hz(np.arange(self.n_bins))
+            keep = np.ones(self.n_bins, dtype=bool)
+            if lo_hz is not None:
+                keep &= centers >= lo_hz
+            if hi_hz is not None:
+                keep &= centers <= hi_hz
+            mass = np.where(keep, mass, 0.0)
+        total = mass.sum()
+        if total <= 0:
+            return None
+        cum = np.cumsum(mass)
+        target = q * total
+        b = int(np.searchsorted(cum, target))
+        b = min(b, self.n_bins - 1)
+        below = cum[b] - mass[b]
+        frac = (target - below) / mass[b] if mass[b] > 0 else 0.5
+        hz = self.fmin * 2 ** ((b + frac) / (12 * self.bins_per_semitone))
+        return float(np.clip(hz, self.lo[b], self.hi[b]))
+
+    def percentile(self, p: float) -> Optional[float]:
+        """重みなしのパーセンタイル（np.percentile 相当）"""
+        return self.quantile(p / 100)
+
+    def window_counts(self, semitones: float = 1.0) -> np.ndarray:
+        """各ビンの ±semitones 半音内にあるフレーム数"""
+        w = int(round(semitones * self.bins_per_semitone))
+        cs = np.concatenate([[0], np.cumsum(self.counts)])
+        idx = np.arange(self.n_bins)
+        return cs[np.minimum(self.n_bins, idx + w + 1)] - cs[np.maximum(0, idx - w)]
+
+
+# ============================================================
+# 音域の集計（バッチ解析の外れ値除去・最高音堅牢化と同じ手順）
+# ============================================================
+def robust_max(hist: SemitoneHistogram, min_sustain: int = MIN_SUSTAIN_FRAMES) -> Optional[float]:
+    """
+    ±1 半音内に min_sustain フレーム以上ある最も高いビンの最大周波数（一瞬のノイズを最高音にしない）。
+    条件を満たすビンが無ければ最大値（analyzer._get_robust_max と同じ）。
+    """
+    candidates = np.flatnonzero((hist.counts > 0) & (hist.window_counts(1.0) >= min_sustain))
+    if len(candidates):
+        return float(hist.hi[candidates[-1]])
+    return hist.max()
+
+
+def remove_statistical_outliers(hist: SemitoneHistogram, percentile: float,
+                                max_semitones_gap: float) -> SemitoneHistogram:
+    """P{percentile} から max_semitones_gap 半音以上高いビンを除く（analyzer 版と同じく10フレーム未満はそのまま）"""
+    if hist.count < 10:
+        return hist
+    threshold = hist.percentile(percentile) * 2 ** (max_semitones_gap / 12)
+    return hist.subset(hist.bin_hz(np.arange(hist.n_bins)) <= threshold)
+
+
+def remove_isolated_extremes(hist: SemitoneHistogram, min_neighbors: int = 4) -> SemitoneHistogram:
+    """中央値の1.5倍以上のビンのうち、±1 半音内のフレームが min_neighbors 未満のものを除く"""
+    if hist.count < min_neighbors:
+        return hist
+    high_threshold = hist.quantile(0.5) * 1.5
+    isolated = (hist.bin_hz(np.arange(hist.n_bins)) >= high_threshold) & (hist.window_counts(1.0) < min_neighbors)
+    out = hist.subset(~isolated)
+    return out if out.count else hist   # 全除去を防止
+
+
+def clean_range(hist: SemitoneHistogram, percentile: float, max_semitones_gap: float) -> SemitoneHistogram:
+    """外れ値除去 → 孤立値除去（analyzer の remove_statistical_outliers → remove_isolated_extremes と同じ手順）"""
+    return remove_isolated_extremes(remove_statistical_outliers(hist, percentile, max_semitones_gap))
+
+
+def range_summary(cleaned: SemitoneHistogram, min_sustain: int = MIN_SUSTAIN_FRAMES) -> dict:
+    """{"min_hz", "max_hz"（持続要件つき）, "raw_max_hz", "count"}（analyzer の min / _get_robust_max 相当）"""
+    return {
+        "min_hz": cleaned.min(),
+        "max_hz": robust_max(cleaned, min_sustain),
+        "raw_max_hz": cleaned.max(),
+        "count": cleaned.count,
+    }
+
+
+def summarize_range(hist: SemitoneHistogram, percentile: float, max_semitones_gap: float,
+                    min_sustain: int = MIN_SUSTAIN_FRAMES) -> dict:
+    """外れ値除去 → 孤立値除去 → range_summary"""
+    return range_summary(clean_range(hist, percentile, max_semitones_gap), min_sustain)
@@ -0,0 +1,45 @@
+"""
+progress.py — 解析パイプラインの進捗通知
+
+使い方:
+    def on_progress(stage: str, fraction: float) -> None:
+        ...   # 例: ジョブの stage / progress を更新する
+
+    with progress_reporter(on_progress):
+        analyze_array(...)          # パイプライン内の report_progress が on_progress を呼ぶ
+
+パイプライン側はステージの開始時・途中で report_progress(stage, fraction) を呼ぶだけ
+（fraction はそのステージ内の進み具合 0.0〜1.0）。通知先は tracing と同じく contextvars で
+引き回すため、パイプライン関数に引数を追加する必要はない。通知先が無ければ何もしない。
+"""
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[str, float], None]
+
+_current_reporter: ContextVar[Optional[ProgressCallback]] = ContextVar("analysis_progress", default=None)
+
+
+@contextmanager
+def progress_reporter(callback: ProgressCallback):
+    """この with の中（同じコンテキスト）で呼ばれた report_progress を callback に渡す"""
+    token = _current_reporter.set(callback)
+    try:
+        yield
+    finally:
+        _current_reporter.reset(token)
+
+
+def report_progress(stage: str, fraction: float = 0.0) -> None:
+    """ステージの進捗を通知する（通知先の例外は解析を止めないようにログだけ出す）"""
+    callback = _current_reporter.get()
+    if callback is None:
+        return
+    try:
+        callback(stage, min(max(fraction, 0.0), 1.0))
+    except Exception:
+        logger.exception("進捗通知に失敗: %s", stage)
@@ -11,13 +11,19 @@ analyzeの結果とsongs.dbを照合して:
   - DISCOVERY_SLOTS(4曲)は必ずお気に入り以外のアーティストから選ぶ
   - 残り枠(最大6曲)はお気に入りアーティストの曲で埋める
   - お気に入り登録がない場合は全枠を通常推薦に使用
+
+enrich_analysis_result は解析結果に 2・3・声質タイプをまとめて付ける
+（解析直後・履歴の詳細表示の両方で使う）。
 """
 
+import logging
 import math
 import numpy as np
 from note_converter import NOTE_TABLE, hz_to_label_and_hz
 from database import get_connection
 
+logger = logging.getLogger(__name__)
+
 # ============================================================
 # カラオケ表記 ↔ Hz 変換
 # ============================================================
@@ -548,4 +554,52 @@ def recommend_key_for_song(
     else:
         fit = "hard"
 
-    return {"recommended_key": best_shift, "fit": fit}
\ No newline at end of file
+    return {"recommended_key": best_shift, "fit": fit}
+
+
+# ============================================================
+# 6. 解析結果への付加情報
+# ============================================================
+def enrich_analysis_result(result: dict, favorite_artist_ids: list[int] | None = None) -> dict:
+    """
+    解析結果（または履歴に保存したコンパクトな結果）におすすめ曲・似てるアーティスト・
+    声質タイプを追加する。履歴にはこれらを保存せず、表示時にこの関数で再計算する。
+    """
+    if "error" in result:
+        return result
+
+    chest_min_hz = result.get("chest_min_hz", 0)
+    chest_max_hz = result.get("chest_max_hz", 0)
+    chest_avg_hz = result.get("chest_avg_hz", 0)
+    falsetto_max_hz = result.get("falsetto_max_hz")
+
+    result.setdefault("recommended_songs", [])
+    result.setdefault("similar_artists", [])
+    result.setdefault("voice_type", {})
+
+    if chest_min_hz > 0 and chest_max_hz > 0:
+        try:
+            result["recommended_songs"] = recommend_songs(
+                chest_min_hz, chest_max_hz, chest_avg_hz, falsetto_max_hz,
+                limit=10, favorite_artist_ids=favorite_artist_ids or [],
+            )
+        except Exception as e:
+            logger.warning("おすすめ曲取得失敗: %s", e)
+
+        try:
+            result["similar_artists"] = find_similar_artists(
+                chest_min_hz, chest_max_hz, chest_avg_hz, limit=5
+            )
+        except Exception as e:
+            logger.warning("似てるアーティスト取得失敗: %s", e)
+
+        try:
+            result["voice_type"] = classify_voice_type(
+                chest_min_hz, chest_max_hz, chest_avg_hz,
+                falsetto_max_hz,
+                result.get("chest_ratio", 100.0),
+            )
+        except Exception as e:
+            logger.warning("声質タイプ判定失敗: %s", e)
+
+    return result
@@ -3,10 +3,10 @@ register_classifier.py  —  地声 / 裏声 判定
 
 """
 
+import logging
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import numpy as np
-import librosa
 
 from config import (
     FALSETTO_HARD_MIN_HZ,
@@ -16,13 +16,18 @@ from config import (
     FALSETTO_RATIO_HIGH, FALSETTO_RATIO_MID, FALSETTO_RATIO_DEFAULT,
     REGISTER_LOG_LEVEL, REGISTER_LOG_INTERVAL,
 )
+from model_registry import ModelRegistry, LoadedModel
+from metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
 
 # ============================================================
 # MLモデルのロード（ホットリロード対応）
 # ============================================================
-_ML_MODEL = None
-_MODEL_PATH = os.path.join(os.path.dirname(__file__), "ml", "models", "register_model.joblib")
-_MODEL_MTIME = 0.0  # モデルファイルの更新日時を記録
+_MODEL_DIR = os.path.join(os.path.dirname(__file__), "ml", "models")
+_MODEL_PATH = os.path.join(_MODEL_DIR, "register_model.joblib")
+_COMPACT_MODEL_PATH = os.path.join(_MODEL_DIR, "register_model.npz")  # 軽量形式（優先）
+_REGISTRY = ModelRegistry(_COMPACT_MODEL_PATH, _MODEL_PATH)
 _ML_STATUS_LOGGED = False  # MLモデルの初回状態ログ出力済みフラグ
 
 @dataclass
@@ -33,127 +38,122 @@ class RegisterStats:
     rule_only: int = 0
     chest: int = 0
     falsetto: int = 0
+    # 解析開始時に固定したモデル（解析中はファイルを見に行かない）
+    model: LoadedModel | None = field(default=None, repr=False)
 
 
-def new_register_stats() -> "RegisterStats":
-    return RegisterStats()
+# リクエストをまたいで集計するカウンタ（/metrics）
+_FRAMES_BY_PATH = counter(
+    "register_classifier_frames_total", "レジスター判定フレーム数（判定方式別）", ("path",),
+)
+_FRAMES_BY_LABEL = counter(
+    "register_classifier_labels_total", "レジスター判定フレーム数（判定結果別）", ("label",),
+)
+_MODEL_INFO = gauge(
+    "register_model_info", "使用中のレジスター判定モデル（version=ファイルハッシュ）", ("version",),
+)
 
 
-def _load_model_if_needed():
-    """モデルファイルが更新されていたら再ロード（学習後にサーバー再起動不要）"""
-    global _ML_MODEL, _MODEL_MTIME
+def new_register_stats() -> "RegisterStats":
+    """解析1回分の統計を作成。モデル更新チェックはここで1回だけ行う"""
+    return RegisterStats(model=_REGISTRY.refresh())
 
-    if not os.path.exists(_MODEL_PATH):
-        if _ML_MODEL is not None:
-            _ML_MODEL = None
-            _MODEL_MTIME = 0.0
-        return
 
-    current_mtime = os.path.getmtime(_MODEL_PATH)
-    if current_mtime == _MODEL_MTIME and _ML_MODEL is not None:
-        return  # 変更なし、キャッシュ済みモデルを使用
+def preload_model() -> None:
+    """MLモデルを先にロードしておく（解析ワーカー起動時）"""
+    _set_model_info(_REGISTRY.refresh())
 
-    try:
-        import joblib
-        _ML_MODEL = joblib.load(_MODEL_PATH)
-        _MODEL_MTIME = current_mtime
-        print(_MODEL_PATH)
-    except Exception as e:
-        print( e)
-        _ML_MODEL = None
+
+def _set_model_info(model: LoadedModel | None) -> None:
+    _MODEL_INFO.replace(1, version=model.version if model is not None else "none")
 
 
-# 起動時に1回チェック
-_load_model_if_needed()
+def record_register_metrics(stats: RegisterStats) -> None:
+    """解析1回分の判定統計をプロセス全体のカウンタに加算する"""
+    _FRAMES_BY_PATH.inc(stats.ml_success, path="ml_success")
+    _FRAMES_BY_PATH.inc(stats.ml_fallback, path="ml_fallback")
+    _FRAMES_BY_PATH.inc(stats.rule_only, path="rule_only")
+    _FRAMES_BY_LABEL.inc(stats.chest, label="chest")
+    _FRAMES_BY_LABEL.inc(stats.falsetto, label="falsetto")
+    _set_model_info(stats.model)
 
 
 # ============================================================
 # 共通特徴量抽出（feature_extractor.pyを使用）
 # ============================================================
 try:
-    from feature_extractor import extract_features, get_peak_db, compute_hnr
+    from feature_extractor import SpectralFrame, compute_spectral_frame, features_from_spectral
 except ImportError:
-    extract_features = None
-    get_peak_db = None
-    compute_hnr = None
+    SpectralFrame = None
+    compute_spectral_frame = None
+    features_from_spectral = None
 
 
 # ============================================================
 # ML推論
 # ============================================================
-def _classify_ml(y: np.ndarray, sr: int, f0: float,
-                  stats: RegisterStats,
-                  crepe_conf: float = 1.0) -> str | None:
-    """MLモデルで判定。モデルがないか特徴抽出に失敗したら None を返す"""
-    _load_model_if_needed()  # モデル更新チェック（mtime比較のみ、軽量）
-
-    if _ML_MODEL is None or extract_features is None:
-        return None
-
-    feat = extract_features(y, sr, f0)
-    if feat is None:
+def _predict_batch(feats: list, stats: RegisterStats) -> np.ndarray | None:
+    """特徴量 (6,) のリスト → predict_proba を1回だけ呼んだ (n, 2) の確率。モデルがないか失敗したら None"""
+    if stats.model is None or not feats:
         return None
-
     try:
-        X = feat.reshape(1, -1)
-        proba = _ML_MODEL.predict_proba(X)[0]
-        pred = int(np.argmax(proba))
-        label = "chest" if pred == 0 else "falsetto"
-        confidence = float(proba[pred])
-
-        # 遷移帯域（<500Hz）では地声/裏声の音響特徴が類似するため高い信頼度を要求
-        if f0 < 500:
-            threshold = ML_CONF_THRESHOLD_LOW_F0
-        elif crepe_conf < 0.55:
-            # CREPE信頼度低 + 高f0 → ノイズの可能性高い。ML確信を強く要求
-            threshold = ML_CONF_THRESHOLD_NOISY
-        else:
-            threshold = ML_CONF_THRESHOLD_HIGH
-
-        # 高音域で「地声」判定する場合は追加の信頼度要求
-        # f0>=400Hzは男声の地声域上限付近。MLが「地声」と判定するにはより強い根拠が必要。
-        # 裏声判定は通常閾値のままにし、高音の裏声検出を阻害しない。
-        if label == "chest" and f0 >= 400:
-            threshold = max(threshold, ML_CONF_CHEST_HIGH_F0)
-
-        if confidence < threshold:
-            stats.ml_fallback += 1
-            if REGISTER_LOG_LEVEL >= 3 or (REGISTER_LOG_LEVEL == 2 and stats.log_counter % REGISTER_LOG_INTERVAL == 0):
-                print(f"[REGISTER/ML→RULE] f0={f0:.0f}Hz ML={label}({confidence:.3f}) < thresh={threshold:.2f} ")
-            return None
-
-        stats.ml_success += 1
-        if label == "chest":
-            stats.chest += 1
-        else:
-            stats.falsetto += 1
-        if REGISTER_LOG_LEVEL >= 3 or (REGISTER_LOG_LEVEL == 2 and stats.log_counter % REGISTER_LOG_INTERVAL == 0):
-            print(f"[REGISTER/ML] f0={f0:.0f}Hz label={label} conf={confidence:.3f} thresh={threshold:.2f} crepe={crepe_conf:.2f}")
-        return label
+        return stats.model.model.predict_proba(np.stack(feats))
     except Exception as e:
-        print(f"[WARN] ML推論失敗: {e}")
+        logger.warning("ML推論失敗: %s", e)
         return None
 
 
-def _classify_rules(y: np.ndarray, sr: int, f0: float, median_freq: float,
+def _ml_decision(f0: float, proba: np.ndarray, stats: RegisterStats,
+                 crepe_conf: float = 1.0) -> str | None:
+    """1フレーム分の確率から判定する。信頼度が閾値に届かなければ None（ルール判定へ）"""
+    pred = int(np.argmax(proba))
+    label = "chest" if pred == 0 else "falsetto"
+    confidence = float(proba[pred])
+
+    # 遷移帯域（<500Hz）では地声/裏声の音響特徴が類似するため高い信頼度を要求
+    if f0 < 500:
+        threshold = ML_CONF_THRESHOLD_LOW_F0
+    elif crepe_conf < 0.55:
+        # CREPE信頼度低 + 高f0 → ノイズの可能性高い。ML確信を強く要求
+        threshold = ML_CONF_THRESHOLD_NOISY
+    else:
+        threshold = ML_CONF_THRESHOLD_HIGH
+
+    # 高音域で「地声」判定する場合は追加の信頼度要求
+    # f0>=400Hzは男声の地声域上限付近。MLが「地声」と判定するにはより強い根拠が必要。
+    # 裏声判定は通常閾値のままにし、高音の裏声検出を阻害しない。
+    if label == "chest" and f0 >= 400:
+        threshold = max(threshold, ML_CONF_CHEST_HIGH_F0)
+
+    if confidence < threshold:
+        stats.ml_fallback += 1
+        if _should_log_frame(stats):
+            logger.debug("[REGISTER/ML→RULE] f0=%.0fHz ML=%s(%.3f) < thresh=%.2f",
+                         f0, label, confidence, threshold)
+        return None
+
+    stats.ml_success += 1
+    if label == "chest":
+        stats.chest += 1
+    else:
+        stats.falsetto += 1
+    if _should_log_frame(stats):
+        logger.debug("[REGISTER/ML] f0=%.0fHz label=%s conf=%.3f thresh=%.2f crepe=%.2f",
+                     f0, label, confidence, threshold, crepe_conf)
+    return label
+
+
+def _classify_rules(spec: "SpectralFrame", median_freq: float,
                     stats: RegisterStats,
                     crepe_conf: float = 1.0) -> str:
-    # FFT
-    n_fft    = 8192
-    win      = np.hanning(len(y))
-    y_pad    = np.zeros(n_fft)
-    y_pad[:len(y)] = y * win
-    fft      = np.abs(np.fft.rfft(y_pad))
-    freqs    = np.fft.rfftfreq(n_fft, 1.0 / sr)
-    noise_db = 20.0 * np.log10(float(np.percentile(fft, 5)) + 1e-12)
-
-    H  = [get_peak_db(fft, freqs, f0 * n, sr) for n in range(1, 11)]
-    h1 = H[0]
-
-    if h1 <= -60:
+    """ルールベース判定。FFT・倍音ピーク・HNR・重心は spec のものを再利用する"""
+    f0 = spec.f0
+    H  = spec.H
+
+    if spec.h1 <= -60:
         return "unknown"
 
-    h1_h2 = h1 - H[1]
+    h1_h2 = spec.h1_h2
 
     if h1_h2 < -20.0:
         return "unknown"
@@ -162,8 +162,8 @@ def _classify_rules(y: np.ndarray, sr: int, f0: float, median_freq: float,
     if h1_h2 < -2.0 and f0 <= 400:
         stats.rule_only += 1
         stats.chest += 1
-        if REGISTER_LOG_LEVEL >= 3 or (REGISTER_LOG_LEVEL == 2 and stats.log_counter % REGISTER_LOG_INTERVAL == 0):
-            print(f"[REGISTER/RULE] f0={f0:.0f}Hz H1-H2={h1_h2:.1f}dB → 地声確定(即決)")
+        if _should_log_frame(stats):
+            logger.debug("[REGISTER/RULE] f0=%.0fHz H1-H2=%.1fdB → 地声確定(即決)", f0, h1_h2)
         return "chest"
 
     # スコア判定
@@ -188,7 +188,7 @@ def _classify_rules(y: np.ndarray, sr: int, f0: float, median_freq: float,
         chest_score += 2.0
 
     # hcount
-    hcount = sum(1 for db in H[:10] if db > noise_db + 8.0)
+    hcount = spec.hcount
     if hcount <= 2:
         falsetto_score += 6.0
     elif hcount <= 4:
@@ -199,11 +199,8 @@ def _classify_rules(y: np.ndarray, sr: int, f0: float, median_freq: float,
         chest_score += 3.0
 
     # slope
-    slope_pts = [(i + 1, H[i]) for i in range(8) if H[i] > noise_db + 8.0]
-    if len(slope_pts) >= 3:
-        xs    = np.array([p[0] for p in slope_pts], dtype=float)
-        ys    = np.array([p[1] for p in slope_pts], dtype=float)
-        slope = float(np.polyfit(xs, ys, 1)[0])
+    slope = spec.slope
+    if slope is not None:
         if slope < -10:
             falsetto_score += 3.0
         elif slope < -7:
@@ -212,11 +209,9 @@ def _classify_rules(y: np.ndarray, sr: int, f0: float, median_freq: float,
             chest_score += 3.0
         elif slope > -6:
             chest_score += 1.5
-    else:
-        slope = None
 
     # HNR
-    hnr = compute_hnr(y, sr, f0)
+    hnr = spec.hnr
     if hnr < 0.35:
         falsetto_score += 4.0
     elif hnr < 0.50:
@@ -227,8 +222,7 @@ def _classify_rules(y: np.ndarray, sr: int, f0: float, median_freq: float,
         chest_score += 1.5
 
     # centroid / f0
-    centroid = float(librosa.feature.spectral_centroid(y=y, sr=sr)[0, 0])
-    cr = centroid / f0
+    cr = spec.centroid_r
     if cr < 2.5:
         falsetto_score += 3.0
     elif cr < 4.0:
@@ -271,21 +265,17 @@ def _classify_rules(y: np.ndarray, sr: int, f0: float, median_freq: float,
         ratio_threshold = FALSETTO_RATIO_DEFAULT
     result = "falsetto" if falsetto_ratio >= ratio_threshold else "chest"
 
-    # [FIX] f-string内で条件式をフォーマット指定子に使うとValueError → 事前に文字列変換
-    slope_str = f"{slope:.1f}" if slope is not None else "N/A"
     stats.rule_only += 1
     if result == "chest":
         stats.chest += 1
     else:
         stats.falsetto += 1
-    if REGISTER_LOG_LEVEL >= 3 or (REGISTER_LOG_LEVEL == 2 and stats.log_counter % REGISTER_LOG_INTERVAL == 0):
-        print(
-            f"[REGISTER/RULE] f0={f0:.0f}Hz "
-            f"H1-H2={h1_h2:.1f} hcount={hcount} "
-            f"slope={slope_str} "
-            f"HNR={hnr:.2f} cr={cr:.2f} "
-            f"C={chest_score:.1f} F={falsetto_score:.1f} ratio={falsetto_ratio:.2f} "
-            f"→ {result}"
+    if _should_log_frame(stats):
+        logger.debug(
+            "[REGISTER/RULE] f0=%.0fHz H1-H2=%.1f hcount=%s slope=%s HNR=%.2f cr=%.2f "
+            "C=%.1f F=%.1f ratio=%.2f → %s",
+            f0, h1_h2, hcount, "N/A" if slope is None else f"{slope:.1f}", hnr, cr,
+            chest_score, falsetto_score, falsetto_ratio, result,
         )
     return result
 
@@ -298,49 +288,105 @@ def classify_register(y: np.ndarray, sr: int, f0: float, median_freq: float = 0,
                       crepe_conf: float = 1.0,
                       stats: RegisterStats | None = None) -> str:
     """
-    地声/裏声を判定する。
+    地声/裏声を判定する（1フレーム版。複数フレームは classify_registers でまとめて判定する）。
 
     1. crepe_conf < CREPE_NOISE_GATE → unknown（ノイズゲート）
     2. f0 < FALSETTO_HARD_MIN_HZ → 地声確定
     """
-    global _ML_STATUS_LOGGED
+    return classify_registers([(y, f0, crepe_conf)], sr, median_freq, already_separated, stats)[0]
 
-    # 初回のみMLモデル状態をログ出力
-    if not _ML_STATUS_LOGGED:
-        _load_model_if_needed()
-        if _ML_MODEL is not None and extract_features is not None:
-            print(_MODEL_PATH)
-        else:
-            if not os.path.exists(_MODEL_PATH):
-                print(_MODEL_PATH)
-                
-        _ML_STATUS_LOGGED = True
-
-    if f0 <= 0 or len(y) < 512:
-        return "unknown"
-
-    # CREPE信頼度ノイズゲート: ピッチ推定自体が不確かなフレームは判定しない
-    if crepe_conf < CREPE_NOISE_GATE:
-        return "unknown"
-
-    if f0 < FALSETTO_HARD_MIN_HZ:
-        return "chest"
-
-    # ML判定を試行（crepe_confを伝搬）
-    local_stats = stats or RegisterStats()
-    ml_result = _classify_ml(y, sr, f0, local_stats, crepe_conf=crepe_conf)
-    if ml_result is not None:
-        local_stats.log_counter += 1
-        return ml_result
 
+def classify_registers(frames: list, sr: int, median_freq: float = 0,
+                       already_separated: bool = False,
+                       stats: RegisterStats | None = None) -> list:
+    """
+    複数フレームをまとめて地声/裏声判定する → frames と同じ順の "chest" / "falsetto" / "unknown"。
 
-    local_stats.log_counter += 1
-    return _classify_rules(y, sr, f0, median_freq, local_stats, crepe_conf=crepe_conf)
+    frames: (y, f0, crepe_conf) のリスト。スペクトル解析はフレームごとに1回、
+    MLモデルの predict_proba は全フレーム分の特徴量 (n, 6) に対して1回だけ呼ぶ。
+    ML の信頼度が足りないフレームだけルールベースで判定する（結果は1フレームずつ判定した場合と同じ）。
+    判定中に例外が出たフレームは "unknown"。
+    """
+    _log_ml_status_once()
+    local_stats = stats or RegisterStats(model=_REGISTRY.current())
+    results = ["unknown"] * len(frames)
+
+    # 1. 即決できるフレームを除き、FFT・倍音ピーク等を1回だけ計算する（ML判定とルール判定で共有）
+    specs = []   # (フレーム番号, SpectralFrame, crepe_conf)
+    for k, (y, f0, crepe_conf) in enumerate(frames):
+        if f0 <= 0 or len(y) < 512:
+            continue
+        # CREPE信頼度ノイズゲート: ピッチ推定自体が不確かなフレームは判定しない
+        if crepe_conf < CREPE_NOISE_GATE:
+            continue
+        if f0 < FALSETTO_HARD_MIN_HZ:
+            results[k] = "chest"
+            continue
+        # compute_spectral_frame が None を返す条件（f0 <= 0・512サンプル未満）は上のチェックと同じで、
+        # 短いフレームは従来からルール判定の前に unknown になっているため、ここで判定結果は変わらない
+        try:
+            spec = compute_spectral_frame(y, sr, f0)
+        except Exception:
+            continue
+        if spec is not None:
+            specs.append((k, spec, crepe_conf))
+
+    # 2. 特徴量が取れるフレームをまとめて ML で推論する
+    feats = {}
+    failed = set()
+    if local_stats.model is not None:
+        for k, spec, _ in specs:
+            try:
+                feat = features_from_spectral(spec)
+            except Exception:
+                failed.add(k)
+                continue
+            if feat is not None:
+                feats[k] = feat
+    proba = _predict_batch(list(feats.values()), local_stats)
+    proba_of = dict(zip(feats.keys(), proba)) if proba is not None else {}
+
+    # 3. ML の信頼度が閾値に届かないフレームはルールベースで判定（crepe_confを伝搬）
+    for k, spec, crepe_conf in specs:
+        if k in failed:
+            continue
+        try:
+            label = None
+            if k in proba_of:
+                label = _ml_decision(spec.f0, proba_of[k], local_stats, crepe_conf=crepe_conf)
+            local_stats.log_counter += 1
+            if label is None:
+                label = _classify_rules(spec, median_freq, local_stats, crepe_conf=crepe_conf)
+            results[k] = label
+        except Exception:
+            continue
+    return results
+
+
+def _log_ml_status_once() -> None:
+    """初回のみMLモデル状態をログ出力"""
+    global _ML_STATUS_LOGGED
+    if _ML_STATUS_LOGGED:
+        return
+    model = _REGISTRY.current()
+    if model is not None and compute_spectral_frame is not None:
+        logger.info("地声/裏声判定: MLモデル使用 (%s, version=%s)",
+                    os.path.basename(model.path), model.version)
+    else:
+        logger.info("地声/裏声判定: MLモデルなし、ルールベースで判定 (%s)", _MODEL_DIR)
+    _ML_STATUS_LOGGED = True
 
 
 # ============================================================
 # ログ制御とサマリー
 # ============================================================
+def _should_log_frame(stats: RegisterStats) -> bool:
+    """フレーム単位のログを出すか。DEBUG 無効時は文字列を組み立てる前に False を返す"""
+    if REGISTER_LOG_LEVEL < 2 or not logger.isEnabledFor(logging.DEBUG):
+        return False
+    return REGISTER_LOG_LEVEL >= 3 or stats.log_counter % REGISTER_LOG_INTERVAL == 0
+
+
 def print_register_summary(stats: RegisterStats):
     """レジスター判定のサマリーを出力"""
     if REGISTER_LOG_LEVEL == 0:
@@ -350,12 +396,9 @@ def print_register_summary(stats: RegisterStats):
     if total == 0:
         return
 
-    print(f"\n[REGISTER SUMMARY] 合計判定数: {total}フレーム")
-    print(f"  ├─ 地声: {stats.chest}フレーム ({stats.chest/total*100:.1f}%)")
-    print(f"  └─ 裏声: {stats.falsetto}フレーム ({stats.falsetto/total*100:.1f}%)")
+    logger.info("[REGISTER SUMMARY] 合計判定数: %dフレーム 地声=%d (%.1f%%) 裏声=%d (%.1f%%)",
+                total, stats.chest, stats.chest / total * 100, stats.falsetto, stats.falsetto / total * 100)
 
-    if _ML_MODEL is not None:
-        print(f"  判定方式:")
-        print(f"    ├─ ML判定成功: {stats.ml_success}フレーム")
-        print(f"    ├─ ML→ルール: {stats.ml_fallback}フレーム")
-        print(f"    └─ ルールのみ: {stats.rule_only}フレーム")
+    if stats.model is not None:
+        logger.info("[REGISTER SUMMARY] MLモデル version=%s: ML判定成功=%d ML→ルール=%d ルールのみ=%d",
+                    stats.model.version, stats.ml_success, stats.ml_fallback, stats.rule_only)
@@ -0,0 +1,454 @@
+"""
+supabase_memory.py — ローカル負荷試験・開発用のインメモリ Supabase クライアント
+
+SUPABASE_BACKEND=memory のとき database_supabase.py が create_client の代わりに使う。
+database_supabase.py / auth.py が使っている範囲だけを実装している。
+
+  supabase.table("favorite_songs").select("id").eq("user_id", uid).order("created_at", desc=True)
+          .limit(10).execute()                          → .data / .count
+  supabase.rpc("push_vocal_entry", {...}).execute()      → supabase_migration.sql の関数（_RPC に実装したもの）
+  supabase.auth.sign_up / sign_in_with_password / get_user / refresh_session / update_user ...
+
+  - id は UUID（user_profiles 以外）、created_at は ISO8601 文字列を自動付与
+  - UNIQUE 制約（お気に入りの重複登録）は例外で再現する
+  - sign_up 時に user_profiles 行を作る（本番の on_auth_user_created トリガー相当）
+  - SUPABASE_MEMORY_LATENCY_MS を指定すると、execute / 認証呼び出しごとにその時間だけ待つ
+    （ネットワーク往復を模して、ワーカーの並行処理モデルを測るため）
+
+AsyncMemoryClient は同じストアを共有する非同期版（database_supabase_async.py 用）。
+execute() が awaitable になり、待ち時間は asyncio.sleep で模す。
+
+データはプロセス内の dict に保持されるので、ワーカーごとに独立している。
+負荷試験は uvicorn を --workers 1 で起動するか、ユーザー登録から同じワーカーで行うこと。
+"""
+
+import asyncio
+import copy
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Optional
+
+# UNIQUE 制約（supabase_migration.sql と同じ）
+_UNIQUE = {
+    "user_profiles": [("email",)],
+    "favorite_songs": [("user_id", "song_id")],
+    "favorite_artists": [("user_id", "artist_id")],
+}
+# 埋め込み select（"artists(name)"）の外部キー
+_EMBED_FK = {"artists": "artist_id", "songs": "song_id"}
+
+
+class MemoryAPIError(Exception):
+    """postgrest.exceptions.APIError 相当"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class _Model(SimpleNamespace):
+    """supabase-py の User / Session と同じく model_dump() を持つ"""
+
+    def model_dump(self) -> dict:
+        return {k: (v.model_dump() if isinstance(v, _Model) else copy.deepcopy(v))
+                for k, v in vars(self).items()}
+
+
+class _Response:
+    def __init__(self, data: Any, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+# ============================================================
+# テーブル
+# ============================================================
+class _Query:
+    """PostgREST のクエリビルダー（チェーン）の最小実装"""
+
+    def __init__(self, store: "MemoryStore", table: str):
+        self._store = store
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._count: Optional[str] = None
+        self._payload: Any = None
+        self._on_conflict: tuple = ("id",)
+        self._filters: list = []
+        self._order: list = []
+        self._limit: Optional[int] = None
+        self._offset = 0
+        self._single = False
+
+    # --- 操作 ---
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "_Query":
+        self._op, self._columns, self._count = "select", columns, count
+        return self
+
+    def insert(self, data) -> "_Query":
+        self._op, self._payload = "insert", data
+        return self
+
+    def upsert(self, data, on_conflict: str = "id") -> "_Query":
+        self._op, self._payload = "upsert", data
+        self._on_conflict = tuple(c.strip() for c in on_conflict.split(","))
+        return self
+
+    def update(self, data: dict) -> "_Query":
+        self._op, self._payload = "update", data
+        return self
+
+    def delete(self) -> "_Query":
+        self._op = "delete"
+        return self
+
+    # --- フィルタ ---
+    def eq(self, column: str, value) -> "_Query":
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def neq(self, column: str, value) -> "_Query":
+        self._filters.append(lambda row: row.get(column) != value)
+        return self
+
+    def lt(self, column: str, value) -> "_Query":
+        self._filters.append(lambda row: row.get(column) is not None and row[column] < value)
+        return self
+
+    def in_(self, column: str, values) -> "_Query":
+        values = set(values)
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def ilike(self, column: str, pattern: str) -> "_Query":
+        regex = re.compile(
+            "^" + re.escape(pattern).replace("%", ".*").replace("_", ".") + "$",
+            re.IGNORECASE | re.DOTALL,
+        )
+        self._filters.append(lambda row: row.get(column) is not None and bool(regex.match(str(row[column]))))
+        return self
+
+    # --- 並び・件数 ---
+    def order(self, column: str, desc: bool = False) -> "_Query":
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, n: int) -> "_Query":
+        self._limit = n
+        return self
+
+    def range(self, start: int, end: int) -> "_Query":
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def single(self) -> "_Query":
+        self._single = True
+        return self
+
+    def maybe_single(self) -> "_Query":
+        return self.single()
+
+    def execute(self) -> _Response:
+        self._store.simulate_latency()
+        with self._store.lock:
+            return getattr(self, f"_exec_{self._op}")()
+
+    # --- 実行 ---
+    def _matches(self) -> list:
+        return [r for r in self._store.rows(self._table) if all(f(r) for f in self._filters)]
+
+    def _exec_select(self) -> _Response:
+        rows = self._matches()
+        count = len(rows) if self._count else None
+        for column, desc in reversed(self._order):
+            rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        end = None if self._limit is None else self._offset + self._limit
+        rows = [self._project(r) for r in rows[self._offset:end]]
+        if self._single:
+            if len(rows) != 1:
+                raise MemoryAPIError(f"single() で {len(rows)} 行が返りました ({self._table})")
+            return _Response(rows[0], count)
+        return _Response(rows, count)
+
+    def _project(self, row: dict) -> dict:
+        if self._columns.strip() == "*":
+            return copy.deepcopy(row)
+        out = {}
+        for col in _split_columns(self._columns):
+            m = re.fullmatch(r"(\w+)\((.*)\)", col)
+            if m:
+                table, sub = m.group(1), m.group(2)
+                fk = row.get(_EMBED_FK.get(table, f"{table.rstrip('s')}_id"))
+                target = next((r for r in self._store.rows(table) if r.get("id") == fk), None)
+                out[table] = None if target is None else {
+                    c: target.get(c) for c in _split_columns(sub)
+                }
+            else:
+                out[col] = copy.deepcopy(row.get(col))
+        return out
+
+    def _exec_insert(self) -> _Response:
+        payload = self._payload if isinstance(self._payload, list) else [self._payload]
+        table = self._store.rows(self._table)
+        inserted = []
+        for item in payload:
+            row = {"id": str(uuid.uuid4()), "created_at": _now(), **copy.deepcopy(item)}
+            for columns in _UNIQUE.get(self._table, []):
+                key = tuple(row.get(c) for c in columns)
+                if any(tuple(r.get(c) for c in columns) == key for r in table):
+                    raise MemoryAPIError(
+                        f'duplicate key value violates unique constraint ({self._table}: {", ".join(columns)})'
+                    )
+            table.append(row)
+            inserted.append(copy.deepcopy(row))
+        return _Response(inserted)
+
+    def _exec_upsert(self) -> _Response:
+        payload = self._payload if isinstance(self._payload, list) else [self._payload]
+        table = self._store.rows(self._table)
+        out = []
+        for item in payload:
+            key = tuple(item.get(c) for c in self._on_conflict)
+            row = next((r for r in table if tuple(r.get(c) for c in self._on_conflict) == key), None)
+            if row is None:
+                row = {"id": str(uuid.uuid4()), "created_at": _now(), **copy.deepcopy(item)}
+                table.append(row)
+            else:
+                row.update(copy.deepcopy(item))
+                row["updated_at"] = _now()
+            out.append(copy.deepcopy(row))
+        return _Response(out)
+
+    def _exec_update(self) -> _Response:
+        rows = self._matches()
+        for row in rows:
+            row.update(copy.deepcopy(self._payload))
+            row["updated_at"] = _now()
+        return _Response([copy.deepcopy(r) for r in rows])
+
+    def _exec_delete(self) -> _Response:
+        rows = self._matches()
+        ids = {id(r) for r in rows}
+        self._store.tables[self._table] = [r for r in self._store.rows(self._table) if id(r) not in ids]
+        return _Response([copy.deepcopy(r) for r in rows])
+
+
+class _AsyncQuery(_Query):
+    """AsyncClient 用: execute() を await する以外は _Query と同じ"""
+
+    async def execute(self) -> _Response:
+        await self._store.simulate_latency_async()
+        with self._store.lock:
+            return getattr(self, f"_exec_{self._op}")()
+
+
+# ============================================================
+# RPC（supabase_migration.sql の関数の Python 実装。ストアのロック下で実行するので原子的）
+# ============================================================
+def _rpc_push_vocal_entry(store: "MemoryStore", p_user_id, p_entry, p_window) -> bool:
+    row = next((r for r in store.rows("user_vocal_aggregates") if r.get("user_id") == p_user_id), None)
+    if row is None:
+        return False
+    rest = [e for e in row.get("entries") or [] if e.get("id") != p_entry.get("id")]
+    row["entries"] = ([copy.deepcopy(p_entry)] + rest)[:p_window]
+    row["updated_at"] = _now()
+    return True
+
+
+def _rpc_merge_vocal_entries(store: "MemoryStore", p_user_id, p_entries, p_window) -> list:
+    rows = store.rows("user_vocal_aggregates")
+    row = next((r for r in rows if r.get("user_id") == p_user_id), None)
+    if row is None:
+        row = {"user_id": p_user_id, "entries": [], "updated_at": _now()}
+        rows.append(row)
+    created = {h["id"]: h.get("created_at") for h in store.rows("analysis_history")
+               if h.get("user_id") == p_user_id}
+    merged: dict = {}
+    for e in (row.get("entries") or []) + list(p_entries):
+        if e.get("id") in created:
+            merged.setdefault(e["id"], copy.deepcopy(e))
+    entries = sorted(merged.values(), key=lambda e: created[e["id"]], reverse=True)
+    row["entries"] = entries[:p_window]
+    row["updated_at"] = _now()
+    return [copy.deepcopy(row)]
+
+
+_RPC = {
+    "push_vocal_entry": _rpc_push_vocal_entry,
+    "merge_vocal_entries": _rpc_merge_vocal_entries,
+}
+
+
+class _Rpc:
+    """supabase.rpc(name, params) の戻り値（execute() で関数を実行する）"""
+
+    def __init__(self, store: "MemoryStore", name: str, params: dict):
+        if name not in _RPC:
+            raise MemoryAPIError(f"function {name} does not exist")
+        self._store, self._fn, self._params = store, _RPC[name], params or {}
+
+    def execute(self) -> _Response:
+        self._store.simulate_latency()
+        with self._store.lock:
+            return _Response(self._fn(self._store, **self._params))
+
+
+class _AsyncRpc(_Rpc):
+    async def execute(self) -> _Response:
+        await self._store.simulate_latency_async()
+        with self._store.lock:
+            return _Response(self._fn(self._store, **self._params))
+
+
+def _split_columns(columns: str) -> list:
+    """select の列指定を分割する（括弧内のカンマは分割しない）: "id, artists(name)" → ["id", "artists(name)"]"""
+    out, depth, buf = [], 0, ""
+    for ch in columns:
+        if ch == "," and depth == 0:
+            out.append(buf.strip())
+            buf = ""
+            continue
+        depth += (ch == "(") - (ch == ")")
+        buf += ch
+    if buf.strip():
+        out.append(buf.strip())
+    return out
+
+
+# ============================================================
+# 認証
+# ============================================================
+class _MemoryAuth:
+    def __init__(self, store: "MemoryStore"):
+        self._store = store
+        self._users: dict = {}      # email -> {"id", "email", "password", "user_metadata"}
+        self._by_id: dict = {}      # user_id -> 同じ dict
+        self._tokens: dict = {}     # access_token -> user_id
+        self._refresh: dict = {}    # refresh_token -> user_id
+
+    def _user(self, user_id: str) -> _Model:
+        u = self._by_id.get(user_id)
+        if u is None:
+            raise MemoryAPIError("User not found")
+        return _Model(id=user_id, email=u["email"], user_metadata=dict(u["user_metadata"]),
+                      aud="authenticated", role="authenticated")
+
+    def _session(self, user_id: str) -> SimpleNamespace:
+        access, refresh = f"memory-{uuid.uuid4().hex}", uuid.uuid4().hex
+        self._tokens[access] = user_id
+        self._refresh[refresh] = user_id
+        user = self._user(user_id)
+        session = _Model(access_token=access, refresh_token=refresh, token_type="bearer",
+                         expires_in=3600, user=user)
+        return SimpleNamespace(user=user, session=session)
+
+    def sign_up(self, credentials: dict) -> SimpleNamespace:
+        self._store.simulate_latency()
+        email = credentials["email"]
+        metadata = credentials.get("options", {}).get("data", {})
+        with self._store.lock:
+            if email in self._users:
+                raise MemoryAPIError("User already registered")
+            user_id = str(uuid.uuid4())
+            u = {"id": user_id, "email": email, "password": credentials["password"], "user_metadata": metadata}
+            self._users[email] = self._by_id[user_id] = u
+            self._store.rows("user_profiles").append({
+                "id": user_id, "email": email, "display_name": metadata.get("display_name"),
+                "created_at": _now(), "updated_at": _now(),
+            })
+            return self._session(user_id)
+
+    def sign_in_with_password(self, credentials: dict) -> SimpleNamespace:
+        self._store.simulate_latency()
+        with self._store.lock:
+            u = self._users.get(credentials["email"])
+            if u is None or u["password"] != credentials["password"]:
+                raise MemoryAPIError("Invalid login credentials")
+            return self._session(u["id"])
+
+    def get_user(self, token: str) -> SimpleNamespace:
+        self._store.simulate_latency()
+        with self._store.lock:
+            user_id = self._tokens.get(token)
+            if user_id is None:
+                raise MemoryAPIError("invalid JWT")
+            return SimpleNamespace(user=self._user(user_id))
+
+    def refresh_session(self, refresh_token: str) -> SimpleNamespace:
+        self._store.simulate_latency()
+        with self._store.lock:
+            user_id = self._refresh.pop(refresh_token, None)
+            if user_id is None:
+                raise MemoryAPIError("Invalid Refresh Token")
+            return self._session(user_id)
+
+    def sign_out(self) -> None:
+        self._store.simulate_latency()
+
+    def reset_password_for_email(self, email: str) -> None:
+        self._store.simulate_latency()
+
+    def update_user(self, attributes: dict) -> SimpleNamespace:
+        # 本番クライアントと同じく「ログイン中のセッション」を対象にするが、
+        # インメモリ版はサーバー側にセッションを持たないため何もしない
+        self._store.simulate_latency()
+        return SimpleNamespace(user=None)
+
+
+# ============================================================
+# クライアント
+# ============================================================
+class MemoryStore:
+    def __init__(self, latency_ms: float = 0.0):
+        self.tables: dict = {}
+        self.lock = threading.RLock()
+        self.latency = max(0.0, latency_ms) / 1000
+
+    def rows(self, table: str) -> list:
+        return self.tables.setdefault(table, [])
+
+    def simulate_latency(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    async def simulate_latency_async(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class MemoryClient:
+    """supabase.Client の代わりに使うインメモリ実装"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self._store = MemoryStore(latency_ms)
+        self.auth = _MemoryAuth(self._store)
+
+    def table(self, name: str) -> _Query:
+        return _Query(self._store, name)
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> _Rpc:
+        return _Rpc(self._store, name, params)
+
+    def reset(self) -> None:
+        """全テーブル・ユーザーを消す（負荷試験の繰り返し用）"""
+        with self._store.lock:
+            self._store.tables.clear()
+            self.auth = _MemoryAuth(self._store)
+
+
+class AsyncMemoryClient:
+    """supabase.AsyncClient の代わり。テーブル操作と RPC のみ（認証は同期版の MemoryClient.auth を使う）"""
+
+    def __init__(self, client: MemoryClient):
+        self._client = client
+
+    def table(self, name: str) -> _AsyncQuery:
+        # 同期版と同じストアを使うので、sign_up で作られた user_profiles なども見える
+        return _AsyncQuery(self._client._store, name)
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> _AsyncRpc:
+        return _AsyncRpc(self._client._store, name, params)
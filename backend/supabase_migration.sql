@@ -227,4 +227,103 @@ DROP TRIGGER IF EXISTS update_user_profiles_updated_at ON user_profiles;
 CREATE TRIGGER update_user_profiles_updated_at
     BEFORE UPDATE ON user_profiles
     FOR EACH ROW
-    EXECUTE FUNCTION update_updated_at_column();
\ No newline at end of file
+    EXECUTE FUNCTION update_updated_at_column();
+-- ============================================================
+-- 7. 統合音域の集計テーブル
+--    直近の分析履歴から取り出した数値（Hz・比率・スコア）を新しい順に保持する。
+--    履歴の作成・削除時にバックエンドが push_vocal_entry / merge_vocal_entries で更新し、
+--    /analysis/integrated-range はこの1行だけを読む
+-- ============================================================
+CREATE TABLE IF NOT EXISTS user_vocal_aggregates (
+    user_id UUID PRIMARY KEY REFERENCES user_profiles(id) ON DELETE CASCADE,
+    entries JSONB NOT NULL DEFAULT '[]'::jsonb,  -- [{"id", "chest_min_hz", ..., "overall_score", "valid"}]
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- RLS
+ALTER TABLE user_vocal_aggregates ENABLE ROW LEVEL SECURITY;
+
+DO $$ BEGIN
+    DROP POLICY IF EXISTS "Users can manage own vocal aggregate" ON user_vocal_aggregates;
+END $$;
+
+CREATE POLICY "Users can manage own vocal aggregate" 
+    ON user_vocal_aggregates FOR ALL 
+    USING (auth.uid() = user_id)
+    WITH CHECK (auth.uid() = user_id);
+
+DROP TRIGGER IF EXISTS update_user_vocal_aggregates_updated_at ON user_vocal_aggregates;
+CREATE TRIGGER update_user_vocal_aggregates_updated_at
+    BEFORE UPDATE ON user_vocal_aggregates
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- 集計行の更新は読み出し→書き戻しにせず、行ロックを取ったうえで1文で書き換える
+-- （同じユーザーの解析が複数のワーカーで同時に終わっても entries が失われない）
+
+-- 新しい履歴の数値を先頭に追加する（同じ id は重複させず、p_window 件まで）。
+-- 集計行がまだ無ければ何もせず FALSE を返す（呼び出し側が merge_vocal_entries で作る）
+CREATE OR REPLACE FUNCTION push_vocal_entry(p_user_id UUID, p_entry JSONB, p_window INT)
+RETURNS BOOLEAN AS $$
+BEGIN
+    UPDATE user_vocal_aggregates
+    SET entries = (
+        SELECT COALESCE(jsonb_agg(w.e ORDER BY w.ord), '[]'::jsonb)
+        FROM (
+            SELECT c.e, c.ord FROM (
+                SELECT p_entry AS e, 0::BIGINT AS ord
+                UNION ALL
+                SELECT t.e, t.ord FROM jsonb_array_elements(entries) WITH ORDINALITY AS t(e, ord)
+                WHERE t.e->>'id' IS DISTINCT FROM p_entry->>'id'
+            ) c
+            ORDER BY c.ord
+            LIMIT p_window
+        ) w
+    )
+    WHERE user_id = p_user_id;
+    RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 現在の entries と p_entries（直近の履歴から作った数値）を id で合わせ、まだ残っている履歴だけを
+-- 新しい順に p_window 件まで残す。集計行が無ければ作る。履歴の削除時・集計行の作成時に使う。
+-- 先に行ロックを取るので、後の UPDATE はロック取得後のスナップショットで履歴を見る
+CREATE OR REPLACE FUNCTION merge_vocal_entries(p_user_id UUID, p_entries JSONB, p_window INT)
+RETURNS SETOF user_vocal_aggregates AS $$
+BEGIN
+    INSERT INTO user_vocal_aggregates (user_id) VALUES (p_user_id)
+    ON CONFLICT (user_id) DO NOTHING;
+    PERFORM 1 FROM user_vocal_aggregates WHERE user_id = p_user_id FOR UPDATE;
+
+    UPDATE user_vocal_aggregates a
+    SET entries = (
+        SELECT COALESCE(jsonb_agg(w.e ORDER BY w.created_at DESC), '[]'::jsonb)
+        FROM (
+            SELECT m.e, m.created_at FROM (
+                SELECT DISTINCT ON (h.id) c.e, h.created_at
+                FROM (
+                    SELECT t.e, 0 AS pri FROM jsonb_array_elements(a.entries) AS t(e)
+                    UNION ALL
+                    SELECT t.e, 1 AS pri FROM jsonb_array_elements(p_entries) AS t(e)
+                ) c
+                JOIN analysis_history h ON h.id::TEXT = c.e->>'id' AND h.user_id = p_user_id
+                ORDER BY h.id, c.pri
+            ) m
+            ORDER BY m.created_at DESC
+            LIMIT p_window
+        ) w
+    )
+    WHERE a.user_id = p_user_id;
+
+    RETURN QUERY SELECT * FROM user_vocal_aggregates WHERE user_id = p_user_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- 8. 既存の result_json から派生データを削除
+--    おすすめ曲・似てるアーティスト・声質タイプは表示時に再計算するため保存しない
+--    （何度実行しても同じ結果になる）
+-- ============================================================
+UPDATE analysis_history
+SET result_json = result_json - 'recommended_songs' - 'similar_artists' - 'voice_type' - 'timings'
+WHERE result_json ?| ARRAY['recommended_songs', 'similar_artists', 'voice_type', 'timings'];
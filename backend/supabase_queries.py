@@ -0,0 +1,463 @@
+"""
+supabase_queries.py — Supabase データ層の共通部分（クエリの組み立て・応答の整形・統合音域の計算）
+
+database_supabase.py（同期）と database_supabase_async.py（非同期）は、ここで組み立てたクエリを
+.execute() するか await ... .execute() するかだけが違う。PostgREST のクエリビルダーは同期・非同期の
+クライアント（とインメモリ実装 supabase_memory.py）で同じ API なので、クエリ関数は client を受け取って
+未実行のクエリを返す。書き込む行の組み立て、応答の整形、統合音域の計算もここに置き、
+2つのデータ層には I/O（execute とエラー処理・キャッシュ）だけを書く。
+
+  songs_by_title(client, query, limit, offset).execute()          → 曲名の部分一致
+  merge_search_results(title_rows, artist_rows, limit)            → 検索結果の重複除去と整形
+  push_vocal_entry(client, user_id, record).execute()             → 集計行への追加（RPC）
+  summarize_vocal_entries(entries, limit)                         → 統合音域の計算
+"""
+import math
+from typing import Optional, List, Dict, Any
+
+from config import INTEGRATED_RANGE_WINDOW
+
+SONG_COLUMNS = "id, title, lowest_note, highest_note, falsetto_note, note, source, artists(name)"
+
+# result_json に保存するキー（解析で得た数値・ラベルのみ）。おすすめ曲・似てるアーティスト・
+# 声質タイプは保存せず、詳細表示時に recommender.enrich_analysis_result で再計算する
+RESULT_JSON_FIELDS = (
+    "overall_min", "overall_max", "overall_min_hz", "overall_max_hz",
+    "chest_min", "chest_max", "chest_min_hz", "chest_max_hz", "chest_count",
+    "falsetto_min", "falsetto_max", "falsetto_min_hz", "falsetto_max_hz", "falsetto_count",
+    "chest_ratio", "falsetto_ratio", "chest_avg_hz",
+    "singing_analysis", "register_model",
+)
+# 履歴一覧で返す列（result_json は含めない。詳細は get_analysis_record）
+HISTORY_LIST_COLUMNS = "id, user_id, vocal_range_min, vocal_range_max, falsetto_max, source_type, file_name, created_at"
+
+FAVORITE_ARTISTS_LIMIT = 10   # お気に入りアーティストの上限
+
+
+def first_row(response) -> Optional[Dict[str, Any]]:
+    """insert / update / limit(1) の応答の先頭行（無ければ None）"""
+    return response.data[0] if response.data else None
+
+
+# ============================================================
+# 楽曲
+# ============================================================
+def songs_by_title(client, query: str, limit: int, offset: int):
+    return client.table("songs").select(SONG_COLUMNS).ilike(
+        "title", f"%{query}%"
+    ).range(offset, offset + limit - 1)
+
+
+def artist_ids_by_name(client, query: str):
+    return client.table("artists").select("id").ilike("name", f"%{query}%")
+
+
+def songs_by_artists(client, artist_ids: List[int], limit: int):
+    """一致したアーティストの曲は in_ で1クエリにまとめて取得（アーティストごとの往復をしない）"""
+    return client.table("songs").select(SONG_COLUMNS).in_("artist_id", artist_ids).range(0, limit - 1)
+
+
+def song_by_id(client, song_id: int):
+    return client.table("songs").select(SONG_COLUMNS).eq("id", song_id).single()
+
+
+def all_songs(client, limit: int, offset: int):
+    return client.table("songs").select(SONG_COLUMNS).range(offset, offset + limit - 1)
+
+
+def artist_by_id(client, artist_id: int):
+    return client.table("artists").select("id, name, slug, song_count").eq("id", artist_id).single()
+
+
+def artists_page(client, limit: int, offset: int):
+    return client.table("artists").select("id, name, slug, song_count").order("name").range(offset, offset + limit - 1)
+
+
+def songs_of_artist(client, artist_id: int):
+    return client.table("songs").select(SONG_COLUMNS).eq("artist_id", artist_id).order("title")
+
+
+def flatten_song(song: Dict[str, Any]) -> Dict[str, Any]:
+    """埋め込みの artists(name) を "artist" キーに平らにする"""
+    return {
+        **{k: v for k, v in song.items() if k != "artists"},
+        "artist": song["artists"]["name"] if song.get("artists") else None,
+    }
+
+
+def merge_search_results(
+    title_songs: List[Dict[str, Any]], artist_songs: List[Dict[str, Any]], limit: int
+) -> List[Dict[str, Any]]:
+    """曲名一致とアーティスト一致の結果をIDで重複除去し、artistsをフラットに変換する"""
+    seen_ids: set = set()
+    merged: List[Dict[str, Any]] = []
+    for song in title_songs + artist_songs:
+        if song["id"] not in seen_ids:
+            seen_ids.add(song["id"])
+            merged.append(song)
+    return [flatten_song(song) for song in merged[:limit]]
+
+
+# ============================================================
+# ユーザープロファイル
+# ============================================================
+def profile_by_id(client, user_id: str):
+    return client.table("user_profiles").select("*").eq("id", user_id).single()
+
+
+def update_profile(client, user_id: str, data: Dict[str, Any]):
+    return client.table("user_profiles").update(data).eq("id", user_id)
+
+
+def vocal_range_update(
+    vocal_min: Optional[str] = None,
+    vocal_max: Optional[str] = None,
+    falsetto: Optional[str] = None,
+) -> Dict[str, Any]:
+    """最新声域の更新内容（指定されたものだけ）"""
+    data = {}
+    if vocal_min:
+        data["current_vocal_range_min"] = vocal_min
+    if vocal_max:
+        data["current_vocal_range_max"] = vocal_max
+    if falsetto:
+        data["current_falsetto_max"] = falsetto
+    return data
+
+
+# ============================================================
+# 分析履歴
+# ============================================================
+def slim_result_json(result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """解析結果から履歴に保存するキーだけを残す（古い形式の result_json にも使える）"""
+    if not result:
+        return result
+    return {k: result[k] for k in RESULT_JSON_FIELDS if k in result}
+
+
+def analysis_record_row(
+    user_id: str,
+    vocal_min: Optional[str],
+    vocal_max: Optional[str],
+    falsetto: Optional[str],
+    source_type: str,
+    file_name: Optional[str] = None,
+    result_json: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "vocal_range_min": vocal_min,
+        "vocal_range_max": vocal_max,
+        "falsetto_max": falsetto,
+        "source_type": source_type,
+        "file_name": file_name,
+        "result_json": slim_result_json(result_json),
+    }
+
+
+def insert_analysis_record(client, row: Dict[str, Any]):
+    return client.table("analysis_history").insert(row)
+
+
+def history_page(client, user_id: str, limit: int, before: Optional[str] = None):
+    """新しい順の履歴（result_json なし）。before は前ページ最後の created_at（カーソルページネーション）"""
+    query = client.table("analysis_history").select(HISTORY_LIST_COLUMNS).eq("user_id", user_id)
+    if before:
+        query = query.lt("created_at", before)
+    return query.order("created_at", desc=True).limit(limit)
+
+
+def analysis_record(client, user_id: str, record_id: str):
+    """履歴1件（result_json 付き）。他人の履歴は空になる"""
+    return client.table("analysis_history").select("*").eq("id", record_id).eq("user_id", user_id).limit(1)
+
+
+def delete_analysis_record(client, user_id: str, record_id: str):
+    return client.table("analysis_history").delete().eq("id", record_id).eq("user_id", user_id)
+
+
+# ============================================================
+# お気に入り楽曲・アーティスト
+# ============================================================
+def insert_favorite_song(client, user_id: str, song_id: int):
+    return client.table("favorite_songs").insert({"user_id": user_id, "song_id": song_id})
+
+
+def delete_favorite_song(client, user_id: str, song_id: int):
+    return client.table("favorite_songs").delete().eq("user_id", user_id).eq("song_id", song_id)
+
+
+def favorite_songs(client, user_id: str, limit: int):
+    return client.table("favorite_songs").select(
+        "id, song_id, created_at"
+    ).eq("user_id", user_id).order("created_at", desc=True).limit(limit)
+
+
+def favorite_song_exists(client, user_id: str, song_id: int):
+    return client.table("favorite_songs").select("id").eq("user_id", user_id).eq("song_id", song_id)
+
+
+def join_favorite_songs(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """favorite_songs の行にローカル SQLite の楽曲情報を付ける（SQLite に無い曲は除外）"""
+    import database
+
+    favorites = []
+    for fav in rows:
+        song = database.get_song(fav["song_id"])
+        # SQLite側に曲が存在すればリストに追加
+        if song:
+            favorites.append({
+                "favorite_id": fav["id"],
+                "created_at": fav["created_at"],
+                "song_id": song.get("id"),
+                "title": song.get("title"),
+                "artist": song.get("artist"),
+                "lowest_note": song.get("lowest_note"),
+                "highest_note": song.get("highest_note"),
+                "falsetto_note": song.get("falsetto_note"),
+            })
+    return favorites
+
+
+def favorite_artist_count(client, user_id: str):
+    return client.table("favorite_artists").select("id", count="exact").eq("user_id", user_id)
+
+
+def insert_favorite_artist(client, user_id: str, artist_id: int, artist_name: str):
+    return client.table("favorite_artists").insert({
+        "user_id": user_id,
+        "artist_id": artist_id,
+        "artist_name": artist_name,
+    })
+
+
+def delete_favorite_artist(client, user_id: str, artist_id: int):
+    return client.table("favorite_artists").delete().eq("user_id", user_id).eq("artist_id", artist_id)
+
+
+def favorite_artists(client, user_id: str, limit: int):
+    """登録が古い順"""
+    return client.table("favorite_artists").select(
+        "id, artist_id, artist_name, created_at"
+    ).eq("user_id", user_id).order("created_at", desc=False).limit(limit)
+
+
+def favorite_artist_exists(client, user_id: str, artist_id: int):
+    return client.table("favorite_artists").select("id").eq("user_id", user_id).eq("artist_id", artist_id)
+
+
+def favorite_artist_ids(client, user_id: str):
+    return client.table("favorite_artists").select("artist_id").eq("user_id", user_id)
+
+
+# ============================================================
+# 統合音域（user_vocal_aggregates による集計）
+# ============================================================
+# 集計行には、直近 INTEGRATED_RANGE_WINDOW 件の履歴それぞれから取り出した数値
+# （Hz・地声比率・歌唱力スコア）だけを新しい順に持つ。履歴の作成・削除時に更新するので、
+# /analysis/integrated-range は集計行1件の読み出しで済み、result_json 全体を読まない。
+# 更新は supabase_migration.sql の push_vocal_entry / merge_vocal_entries（行ロック下の1文の UPDATE）で行い、
+# 読み出し→書き戻しをしない（複数ワーカーで同時に解析が終わっても entries を失わない）。
+
+_VOCAL_FIELDS = ("chest_min_hz", "chest_max_hz", "falsetto_max_hz", "overall_min_hz", "overall_max_hz", "chest_ratio")
+_SCORE_FIELDS = ("range_score", "stability_score", "expression_score", "overall_score")
+
+
+def vocal_aggregate(client, user_id: str):
+    return client.table("user_vocal_aggregates").select("entries, updated_at").eq("user_id", user_id).limit(1)
+
+
+def push_vocal_entry(client, user_id: str, record: Dict[str, Any]):
+    """新しい履歴を集計行の先頭に追加する RPC（集計行がまだ無ければ data は False）"""
+    return client.rpc("push_vocal_entry", {
+        "p_user_id": user_id, "p_entry": vocal_entry(record), "p_window": INTEGRATED_RANGE_WINDOW,
+    })
+
+
+def merge_vocal_entries(client, user_id: str, records: List[Dict[str, Any]]):
+    """直近の履歴（aggregate_source の行）を集計行に合わせる RPC（集計行が無ければ作る）。data は集計行"""
+    return client.rpc("merge_vocal_entries", {
+        "p_user_id": user_id, "p_entries": [vocal_entry(r) for r in records], "p_window": INTEGRATED_RANGE_WINDOW,
+    })
+
+
+def aggregate_source(client, user_id: str):
+    """集計行の作成・削除後の補充に使う直近 INTEGRATED_RANGE_WINDOW 件の履歴"""
+    return client.table("analysis_history").select(
+        "id, result_json"
+    ).eq("user_id", user_id).order("created_at", desc=True).limit(INTEGRATED_RANGE_WINDOW)
+
+
+def aggregate_row(response) -> Optional[Dict[str, Any]]:
+    """vocal_aggregate / merge_vocal_entries の応答 → {"entries", "updated_at"}（集計行が無ければ None）"""
+    if not response.data:
+        return None
+    row = response.data[0]
+    return {"entries": row.get("entries") or [], "updated_at": row.get("updated_at")}
+
+
+def vocal_entry(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    分析履歴1件から統合音域の計算に使う数値だけを取り出す。
+    統合対象外の履歴（結果なし）は {"id": ...} のみ（limit の件数には数える）。
+    """
+    entry: Dict[str, Any] = {"id": record.get("id")}
+    result = record.get("result_json")
+    if result:
+        sa = result.get("singing_analysis") or {}
+        entry.update({k: result.get(k) for k in _VOCAL_FIELDS})
+        entry.update({k: sa.get(k) for k in _SCORE_FIELDS})
+        entry["valid"] = True
+    # 古い形式の場合は直接取得
+    elif record.get("vocal_range_min_hz") or record.get("vocal_range_max_hz"):
+        vmin, vmax = record.get("vocal_range_min_hz"), record.get("vocal_range_max_hz")
+        entry.update({
+            "chest_min_hz": vmin, "overall_min_hz": vmin,
+            "chest_max_hz": vmax, "overall_max_hz": vmax,
+            "falsetto_max_hz": record.get("falsetto_max_hz"),
+            "valid": True,
+        })
+    return {k: v for k, v in entry.items() if v is not None}
+
+
+def summarize_vocal_entries(entries: List[Dict[str, Any]], limit: int) -> Optional[Dict[str, Any]]:
+    """
+    vocal_entry のリストから統合音域・声質タイプ・似ているアーティスト・歌唱力指標を計算する
+    （おすすめ曲は attach_recommended_songs で別途付与）。統合できる履歴がなければNone。
+    """
+    from note_converter import hz_to_label_and_hz
+    from recommender import find_similar_artists, classify_voice_type
+
+    valid = [e for e in entries if e.get("valid")]
+    if not valid:
+        return None
+
+    def collect(key: str) -> list:
+        # Hz は 0 / None を除外、比率・スコアは None のみ除外（従来の集計と同じ）
+        if key.endswith("_hz"):
+            return [e[key] for e in valid if e.get(key)]
+        return [e[key] for e in valid if e.get(key) is not None]
+
+    # Hz値のリストを収集
+    chest_min_values = collect("chest_min_hz")
+    chest_max_values = collect("chest_max_hz")
+    falsetto_max_values = collect("falsetto_max_hz")
+    overall_min_values = collect("overall_min_hz")
+    overall_max_values = collect("overall_max_hz")
+    chest_ratio_values = collect("chest_ratio")
+
+    # 歌唱力指標の収集
+    range_scores = collect("range_score")
+    stability_scores = collect("stability_score")
+    expression_scores = collect("expression_score")
+    overall_scores = collect("overall_score")
+
+    valid_count = len(valid)
+
+    # 統合値を計算（最小値と最大値を採用）
+    result = {
+        "data_count": valid_count,
+        "limit": limit
+    }
+
+    # 音域情報
+    if overall_min_values:
+        overall_min_hz = min(overall_min_values)
+        overall_min_label, overall_min_hz_defined = hz_to_label_and_hz(overall_min_hz)
+        result["overall_min"] = overall_min_label
+        result["overall_min_hz"] = overall_min_hz_defined
+
+    if overall_max_values:
+        overall_max_hz = max(overall_max_values)
+        overall_max_label, overall_max_hz_defined = hz_to_label_and_hz(overall_max_hz)
+        result["overall_max"] = overall_max_label
+        result["overall_max_hz"] = overall_max_hz_defined
+
+    chest_min_hz_defined = None
+    if chest_min_values:
+        chest_min_hz = min(chest_min_values)
+        chest_min_label, chest_min_hz_defined = hz_to_label_and_hz(chest_min_hz)
+        result["chest_min"] = chest_min_label
+        result["chest_min_hz"] = chest_min_hz_defined
+
+    chest_max_hz_defined = None
+    if chest_max_values:
+        chest_max_hz = max(chest_max_values)
+        chest_max_label, chest_max_hz_defined = hz_to_label_and_hz(chest_max_hz)
+        result["chest_max"] = chest_max_label
+        result["chest_max_hz"] = chest_max_hz_defined
+
+    falsetto_max_hz_defined = None
+    if falsetto_max_values:
+        falsetto_max_hz = max(falsetto_max_values)
+        falsetto_max_label, falsetto_max_hz_defined = hz_to_label_and_hz(falsetto_max_hz)
+        result["falsetto_max"] = falsetto_max_label
+        result["falsetto_max_hz"] = falsetto_max_hz_defined
+
+    # 地声比率の平均
+    avg_chest_ratio = sum(chest_ratio_values) / len(chest_ratio_values) if chest_ratio_values else 0.8
+    result["chest_ratio"] = avg_chest_ratio
+    result["falsetto_ratio"] = 1.0 - avg_chest_ratio
+
+    # 歌唱力指標の平均
+    if range_scores or stability_scores or expression_scores or overall_scores:
+        result["singing_analysis"] = {}
+        if range_scores:
+            result["singing_analysis"]["range_score"] = sum(range_scores) / len(range_scores)
+        if stability_scores:
+            result["singing_analysis"]["stability_score"] = sum(stability_scores) / len(stability_scores)
+        if expression_scores:
+            result["singing_analysis"]["expression_score"] = sum(expression_scores) / len(expression_scores)
+        if overall_scores:
+            result["singing_analysis"]["overall_score"] = sum(overall_scores) / len(overall_scores)
+
+        # 音域の半音数を計算
+        if chest_min_hz_defined and chest_max_hz_defined:
+            result["singing_analysis"]["range_semitones"] = round(
+                12 * math.log2(chest_max_hz_defined / chest_min_hz_defined)
+            )
+
+    # 声質タイプを判定（chest_avg_hzを計算）
+    if chest_min_hz_defined and chest_max_hz_defined:
+        chest_avg_hz = math.sqrt(chest_min_hz_defined * chest_max_hz_defined)  # 幾何平均
+
+        # voice_typeを分類
+        voice_type_data = classify_voice_type(
+            chest_min_hz_defined,
+            chest_max_hz_defined,
+            chest_avg_hz,
+            falsetto_max_hz_defined,
+            avg_chest_ratio
+        )
+        result["voice_type"] = voice_type_data
+
+        # 似ているアーティストを取得
+        similar_artists = find_similar_artists(
+            chest_min_hz_defined,
+            chest_max_hz_defined,
+            chest_avg_hz,
+            limit=5
+        )
+        result["similar_artists"] = similar_artists
+
+    return result
+
+
+def attach_recommended_songs(result: Dict[str, Any], favorite_artist_ids: List[int]) -> Dict[str, Any]:
+    """summarize_vocal_entries の結果に、お気に入りアーティストを優先したおすすめ曲を付ける"""
+    from recommender import recommend_songs
+
+    chest_min_hz = result.get("chest_min_hz")
+    chest_max_hz = result.get("chest_max_hz")
+    if not (chest_min_hz and chest_max_hz):
+        return result
+
+    result["recommended_songs"] = recommend_songs(
+        chest_min_hz,
+        chest_max_hz,
+        math.sqrt(chest_min_hz * chest_max_hz),  # 幾何平均
+        result.get("falsetto_max_hz"),
+        limit=10,
+        favorite_artist_ids=favorite_artist_ids
+    )
+    return result
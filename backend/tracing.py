@@ -0,0 +1,142 @@
+"""
+tracing.py — 解析パイプラインのステージ別計測
+
+使い方:
+    with start_trace("analyze_karaoke") as trace:
+        with trace_stage("convert_to_wav_hq"):
+            ...
+        with trace_stage("separate_vocals"):
+            ...
+    trace.to_dict()  # {"name": ..., "total_ms": ..., "stages": [{"name": ..., "ms": ...}, ...]}
+
+trace_stage はトレース中でなくても計測し、ステージ別ヒストグラム
+(analysis_stage_seconds) に集計する。リクエストのトレースは contextvars で
+引き回すため、パイプライン関数に引数を追加する必要はない。
+
+各ステージにはメモリも記録する（stages の rss_mb / peak_rss_mb / peak_growth_mb）。
+  rss_mb          ステージ終了時の RSS（Linux のみ。取れない環境では None）
+  peak_rss_mb     ステージ終了時点のプロセスの最大 RSS（getrusage の ru_maxrss）
+  peak_growth_mb  そのステージで最大 RSS が伸びた量（= そのステージが新たなピークを作った量）
+ピークはプロセス全体の値なので、同時に複数の解析が走っていると互いの分が混ざる。
+"""
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from metrics import gauge, histogram
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = histogram(
+    "analysis_stage_seconds", "解析パイプラインのステージ別処理時間（秒）", ("stage",),
+)
+REQUEST_SECONDS = histogram(
+    "analysis_request_seconds", "解析リクエスト全体の処理時間（秒）", ("request",),
+)
+
+STAGE_PEAK_RSS_GROWTH = gauge(
+    "analysis_stage_peak_rss_growth_bytes", "直近の解析でステージ中に最大 RSS が伸びた量（バイト）", ("stage",),
+)
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("analysis_trace", default=None)
+
+
+class Trace:
+    """1リクエスト分のステージ計測結果"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.stages: list = []
+
+    def add(self, stage: str, seconds: float, **extra) -> None:
+        self.stages.append({"name": stage, "ms": round(seconds * 1000, 1), **extra})
+
+    @property
+    def total_seconds(self) -> float:
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return end - self.started
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "total_ms": round(self.total_seconds * 1000, 1),
+            "stages": list(self.stages),
+        }
+
+
+# ============================================================
+# メモリ計測
+# ============================================================
+# ru_maxrss の単位: Linux は KB、macOS はバイト
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """プロセス開始以来の最大 RSS（バイト）"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_UNIT
+
+
+def current_rss_bytes() -> Optional[int]:
+    """現在の RSS（バイト）。/proc の無い環境では None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _mb(n: Optional[int]) -> Optional[float]:
+    return round(n / (1024 * 1024), 1) if n is not None else None
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def start_trace(name: str):
+    """リクエスト単位のトレースを開始。終了時に1行JSONで内訳を出力する"""
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.finished = time.perf_counter()
+        _current_trace.reset(token)
+        REQUEST_SECONDS.observe(trace.total_seconds, request=name)
+        logger.info("[TIMING] %s", json.dumps(trace.to_dict(), ensure_ascii=False))
+
+
+@contextmanager
+def trace_stage(name: str):
+    """ステージの処理時間とメモリを計測して、現在のトレースとメトリクスに記録する"""
+    peak_before = peak_rss_bytes()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        peak_after = peak_rss_bytes()
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        growth = peak_after - peak_before if peak_after is not None else None
+        if growth is not None:
+            STAGE_PEAK_RSS_GROWTH.set(growth, stage=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, elapsed, rss_mb=_mb(current_rss_bytes()),
+                      peak_rss_mb=_mb(peak_after), peak_growth_mb=_mb(growth))
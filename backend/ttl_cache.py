@@ -0,0 +1,84 @@
+"""
+ttl_cache.py — プロセス内の TTL 付き LRU キャッシュ
+
+Supabase への往復を減らすための小さなキャッシュ。エントリごとに有効期限を持ち、
+上限件数を超えたら最も古く使われたものから捨てる。ワーカープロセスごとに独立しているため、
+書き込み側（同じプロセス）での invalidate と短い TTL で整合性を保つ。
+
+ヒット率は /metrics の cache_requests_total{cache, result} で確認できる。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from metrics import counter
+
+CACHE_REQUESTS = counter(
+    "cache_requests_total", "プロセス内キャッシュの参照回数", ("cache", "result"),
+)
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, name: str, ttl: float, max_entries: int = 10000):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: OrderedDict = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if not self.enabled:
+            return default
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > now:
+                self._data.move_to_end(key)
+                CACHE_REQUESTS.inc(cache=self.name, result="hit")
+                return entry[1]
+            if entry is not _MISSING:
+                del self._data[key]
+        CACHE_REQUESTS.inc(cache=self.name, result="miss")
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """ttl を渡すと self.ttl より短い期限にできる（長くはしない）"""
+        if not self.enabled:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]) -> None:
+        """条件に合うエントリをまとめて捨てる（ユーザー単位のトークン破棄など）"""
+        with self._lock:
+            for key in [k for k, (_, v) in self._data.items() if predicate(k, v)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
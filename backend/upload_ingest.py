@@ -0,0 +1,156 @@
+"""
+upload_ingest.py — 音声アップロードの取り込み
+
+UploadFile はエンドポイントが呼ばれる時点で FastAPI が受信を終え、一時ファイル（SpooledTemporaryFile）に
+置いている。ここではそれを UPLOAD_CHUNK_BYTES ずつ読みながら:
+  - サイズ上限（MAX_UPLOAD_BYTES）を超えた時点でデコードを打ち切る（413）。受信そのものは済んでいるので、
+    受信前に断れるのは Content-Length が上限を超えるリクエストだけ（app_factory.reject_oversized_body）
+  - sha256 を計算する（解析結果キャッシュのキー）
+  - 先頭チャンクからコンテナ形式を判定し、対応していない形式は残りを読む前・ffmpeg を起動する前に拒否する（415）
+  - ffmpeg の標準入力に流して float32 配列にデコードする（uploads/ に元ファイルのコピーも WAV も作らない）
+
+取り込みの入口は ingest_upload_array だけで、配列は CREPE / Demucs にそのまま渡す。
+MP4 / M4A / MOV は moov atom がファイル末尾にあることが多く、パイプ入力では
+デコードできないため、一度ディスクに保存してからデコードする（デコードはスレッドプールで行う）。
+長さの上限（MAX_UPLOAD_SECONDS）はデコード時に ffmpeg の -t で適用する（それ以降は解析しない）。
+"""
+import hashlib
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+import numpy as np
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from audio_converter import decode_stream_to_array, decode_to_array
+from config import CREPE_SR, MAX_UPLOAD_BYTES, MAX_UPLOAD_SECONDS, UPLOAD_CHUNK_BYTES
+
+logger = logging.getLogger(__name__)
+
+# ffmpeg がシークなしで読めない（ディスクに保存してから変換する）形式
+_SEEKABLE_FORMATS = {"mp4"}
+
+
+class UploadRejected(Exception):
+    """アップロードを受け付けない（サイズ超過・非対応形式・空ファイル）"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class IngestedUpload:
+    sha256: str
+    size: int            # バイト数
+    input_format: str    # ffmpeg のデマルチプレクサ名
+    audio: np.ndarray    # float32 波形
+    sr: int
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """先頭バイトから ffmpeg のデマルチプレクサ名を判定する（判定できなければ None）"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[4:8] == b"ftyp":                       # mp4 / m4a / mov / 3gp
+        return "mp4"
+    if head[:4] == b"OggS":                        # ogg / opus
+        return "ogg"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:4] == b"\x1aE\xdf\xa3":               # webm / mkv（ブラウザの MediaRecorder）
+        return "matroska"
+    if head[:3] == b"ID3":
+        return "mp3"
+    if head[:4] == b"FORM" and head[8:12] in (b"AIFF", b"AIFC"):
+        return "aiff"
+    if head[:4] == b"caff":
+        return "caf"
+    if head[:6] == b"#!AMR\n":
+        return "amr"
+    if head[:4] == b"\x30\x26\xb2\x75":            # ASF (wma)
+        return "asf"
+    if len(head) >= 2 and head[0] == 0xFF:
+        if head[1] & 0xF6 == 0xF0:                 # ADTS (aac)
+            return "aac"
+        if head[1] & 0xE0 == 0xE0:                 # MPEG audio フレーム同期（ID3 なし mp3）
+            return "mp3"
+    return None
+
+
+async def _read_chunks(upload: UploadFile, head: bytes, hasher, state: dict,
+                       max_bytes: int) -> AsyncIterator[bytes]:
+    """受信済みのアップロードを一時ファイルから読みながらハッシュとサイズを更新する（上限超過で UploadRejected）"""
+    chunk = head
+    while chunk:
+        state["size"] += len(chunk)
+        if state["size"] > max_bytes:
+            raise UploadRejected(
+                f"ファイルサイズが上限（{max_bytes // (1024 * 1024)}MB）を超えています", 413,
+            )
+        hasher.update(chunk)
+        yield chunk
+        chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+
+
+async def _open_upload(upload: UploadFile, max_bytes: int):
+    """先頭チャンクだけを読んで空・非対応形式を拒否し、(形式, チャンク列, hasher, state) を返す"""
+    head = await upload.read(UPLOAD_CHUNK_BYTES)
+    if not head:
+        raise UploadRejected("ファイルが空です", 400)
+    input_format = sniff_format(head)
+    if input_format is None:
+        raise UploadRejected("対応していない音声形式です", 415)
+
+    hasher = hashlib.sha256()
+    state = {"size": 0}
+    return input_format, _read_chunks(upload, head, hasher, state, max_bytes), hasher, state
+
+
+async def ingest_upload_array(
+    upload: UploadFile,
+    output_dir: str = "uploads",
+    sr: int = CREPE_SR,
+    channels: int = 1,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    max_seconds: float = MAX_UPLOAD_SECONDS,
+) -> IngestedUpload:
+    """
+    アップロードを一時ファイルから読みながら float32 配列にデコードする。
+    既定は CREPE 用（16kHz モノラル）、Demucs 用は sr=44100, channels=2 で (frames, 2) になる。
+    output_dir は MP4 を一時保存する場合にだけ使う。
+    """
+    input_format, chunks, hasher, state = await _open_upload(upload, max_bytes)
+
+    if input_format in _SEEKABLE_FORMATS:
+        audio, sr = await _decode_via_disk(chunks, output_dir, sr, channels, max_seconds)
+    else:
+        audio, sr = await decode_stream_to_array(chunks, input_format, sr=sr, channels=channels,
+                                                  max_seconds=max_seconds)
+
+    digest = hasher.hexdigest()
+    logger.info("取り込み完了: %s (%d bytes, %.1fs, sha256=%s…)",
+                input_format, state["size"], len(audio) / sr, digest[:12])
+    return IngestedUpload(sha256=digest, size=state["size"], input_format=input_format, audio=audio, sr=sr)
+
+
+async def _decode_via_disk(chunks: AsyncIterator[bytes], output_dir: str, sr: int, channels: int,
+                           max_seconds: Optional[float]):
+    """
+    シークが必要な形式: 一度ディスクに書いてから decode_to_array し、元ファイルはすぐ消す。
+    decode_to_array は ffmpeg の完了を待つ同期関数なので、イベントループを止めないようスレッドプールで実行する
+    """
+    temp_path = os.path.join(output_dir, f"{uuid.uuid4()}.mp4")
+    try:
+        with open(temp_path, "wb") as buffer:
+            async for chunk in chunks:
+                buffer.write(chunk)
+        return await run_in_threadpool(
+            decode_to_array, temp_path, sr=sr, channels=channels, max_seconds=max_seconds,
+        )
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -0,0 +1,210 @@
+"""
+vocal_regions.py — ボーカル区間の推定（Demucs の前処理）
+
+イントロ・間奏・アウトロのように歌が入っていない区間は音域に何も寄与しないので、
+ミックス音源のまま安く「歌っていそうな区間」を推定し、Demucs はその区間だけに使う。
+
+推定方法（11.025kHz に落としたモノラルの STFT、200Hz〜4kHz の帯域のみ）:
+  - 調波成分比: 時間方向 / 周波数方向のメディアンフィルタで調波・打楽器成分に分け（HPSS）、
+                帯域内エネルギーのうち調波成分が占める割合
+  - 帯域エネルギー比: 全体のエネルギーのうち 200Hz〜4kHz が占める割合（歌声の主要帯域）
+  - スペクトルフラックス: 帯域内の対数スペクトルの増加量（歌詞・ビブラートで変化し続ける）
+の積を約1秒で平滑化し、大津の方法で2クラスに分けた閾値を超える区間をボーカル区間とする。
+短い隙間はつなぎ、短すぎる区間は捨てる（前後の余白は vocal_separator が Demucs の文脈として付ける）。
+推定した区間が全体に対して少なすぎる・多すぎる場合は推定を信用せず、曲全体を返す。
+
+ユーザー指定の区間（parse_time_ranges）がある場合は推定より優先する。
+best_window は速報モード用に、いちばん歌が詰まった一定長の区間（サビなど）を選ぶ。
+"""
+import logging
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    VOCAL_REGION_MIN_GAP_SECONDS, VOCAL_REGION_MIN_SECONDS,
+    VOCAL_REGION_MIN_COVERAGE, VOCAL_REGION_MAX_COVERAGE,
+)
+
+logger = logging.getLogger(__name__)
+
+Region = Tuple[float, float]   # (開始秒, 終了秒)
+
+_ANALYSIS_SR = 11025
+_N_FFT = 1024
+_HOP = 512                     # 約46ms
+_BAND_HZ = (200.0, 4000.0)
+_HPSS_KERNEL = 17
+_SMOOTH_SECONDS = 1.0
+_SILENCE_DB = -50.0            # 曲の最大フレームからこれ以上小さいフレームは無音扱い
+_MAX_USER_RANGES = 50
+
+
+# ============================================================
+# ユーザー指定の区間
+# ============================================================
+def parse_time_ranges(text: Optional[str]) -> Optional[List[Region]]:
+    """
+    "45-90, 130.5-180" や "0:45-1:30,2:10-3:00" 形式の区間指定 → [(45.0, 90.0), ...]
+    未指定（None・空文字）なら None。書式が不正なら ValueError。
+    """
+    if not text or not text.strip():
+        return None
+    ranges = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_text, sep, end_text = part.partition("-")
+        if not sep:
+            raise ValueError(f"区間の書式が不正です: {part}（例: 45-90 または 0:45-1:30）")
+        start, end = _parse_seconds(start_text), _parse_seconds(end_text)
+        if start < 0 or end <= start:
+            raise ValueError(f"区間の開始・終了が不正です: {part}")
+        ranges.append((start, end))
+    if not ranges:
+        return None
+    if len(ranges) > _MAX_USER_RANGES:
+        raise ValueError(f"区間は{_MAX_USER_RANGES}個までです")
+    return merge_regions(ranges, min_gap=0.0)
+
+
+def _parse_seconds(text: str) -> float:
+    """"75" / "75.5" / "1:15" / "1:15.5" → 秒"""
+    text = text.strip()
+    try:
+        if ":" in text:
+            minutes, seconds = text.split(":", 1)
+            return int(minutes) * 60 + float(seconds)
+        return float(text)
+    except ValueError:
+        raise ValueError(f"時刻の書式が不正です: {text}")
+
+
+# ============================================================
+# 区間の整形
+# ============================================================
+def merge_regions(regions: List[Region], min_gap: float) -> List[Region]:
+    """開始順に並べ、重なる区間・隙間が min_gap 秒以下の区間をつなぐ"""
+    merged: List[list] = []
+    for start, end in sorted(regions):
+        if merged and start - merged[-1][1] <= min_gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(s, e) for s, e in merged]
+
+
+def pad_regions(regions: List[Region], padding: float, duration: float) -> List[Region]:
+    """前後に padding 秒の余白を付け（0〜duration に収める）、重なった区間をつなぐ"""
+    padded = [(max(0.0, s - padding), min(duration, e + padding)) for s, e in regions]
+    return merge_regions([(s, e) for s, e in padded if e > s], min_gap=0.0)
+
+
+def coverage(regions: List[Region], duration: float) -> float:
+    return sum(e - s for s, e in regions) / duration if duration > 0 else 0.0
+
+
+# ============================================================
+# ミックス音源からの推定
+# ============================================================
+def _otsu_threshold(values: np.ndarray, bins: int = 64) -> float:
+    """大津の方法: クラス間分散が最大になる閾値"""
+    hist, edges = np.histogram(values, bins=bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    weight_lo = np.cumsum(hist)
+    weight_hi = weight_lo[-1] - weight_lo
+    sum_lo = np.cumsum(hist * centers)
+    mean_lo = sum_lo / np.maximum(weight_lo, 1)
+    mean_hi = (sum_lo[-1] - sum_lo) / np.maximum(weight_hi, 1)
+    between = weight_lo * weight_hi * (mean_lo - mean_hi) ** 2
+    return float(centers[int(np.argmax(between))])
+
+
+def vocal_activity(y: np.ndarray, sr: int) -> Tuple[np.ndarray, float]:
+    """フレームごとのボーカルらしさ（0以上、平滑化済み） → (score, フレーム間隔秒)"""
+    from scipy.ndimage import median_filter, uniform_filter1d
+    from scipy.signal import resample_poly, stft
+
+    if y.ndim > 1:
+        y = y.mean(axis=1)
+    g = np.gcd(int(sr), _ANALYSIS_SR)
+    y = resample_poly(y, _ANALYSIS_SR // g, int(sr) // g).astype(np.float32, copy=False)
+
+    freqs, _, spec = stft(y, fs=_ANALYSIS_SR, nperseg=_N_FFT, noverlap=_N_FFT - _HOP,
+                          boundary=None, padded=False)
+    power = np.abs(spec).astype(np.float32) ** 2          # (周波数, フレーム)
+    band = (freqs >= _BAND_HZ[0]) & (freqs <= _BAND_HZ[1])
+    mag = np.sqrt(power[band])
+
+    harmonic = median_filter(mag, size=(1, _HPSS_KERNEL))     # 時間方向に滑らか = 持続音
+    percussive = median_filter(mag, size=(_HPSS_KERNEL, 1))   # 周波数方向に滑らか = 打撃音
+    h2, p2 = (harmonic ** 2).sum(axis=0), (percussive ** 2).sum(axis=0)
+    harmonic_ratio = h2 / (h2 + p2 + 1e-10)
+
+    band_energy = power[band].sum(axis=0)
+    total_energy = power.sum(axis=0) + 1e-10
+    band_ratio = band_energy / total_energy
+
+    log_mag = np.log1p(mag * 100)
+    flux = np.concatenate([[0.0], np.maximum(np.diff(log_mag, axis=1), 0).sum(axis=0)])
+    flux = np.clip(flux / (np.percentile(flux, 95) + 1e-10), 0, 1)
+
+    score = harmonic_ratio * band_ratio * (0.5 + 0.5 * flux)
+    # 無音（曲の最大フレームより _SILENCE_DB 以上小さい）はボーカルなし
+    level_db = 10 * np.log10(total_energy / total_energy.max())
+    score[level_db < _SILENCE_DB] = 0.0
+
+    frame_seconds = _HOP / _ANALYSIS_SR
+    smooth = max(1, int(round(_SMOOTH_SECONDS / frame_seconds)))
+    return uniform_filter1d(score, smooth), frame_seconds
+
+
+def detect_vocal_regions(y: np.ndarray, sr: int) -> List[Region]:
+    """
+    ミックス音源 (frames,) or (frames, channels) からボーカル区間を推定する（余白なし）。
+    推定を信用できない場合は曲全体 [(0, duration)] を返す。
+    """
+    duration = len(y) / sr
+    full = [(0.0, duration)]
+    score, frame_seconds = vocal_activity(y, sr)
+    if len(score) < 2 or np.ptp(score) <= 0:
+        return full
+
+    active = score > _otsu_threshold(score)
+    # 連続する True の区間 → 秒
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], active.astype(np.int8), [0]])))
+    regions = [(s * frame_seconds, e * frame_seconds) for s, e in zip(edges[::2], edges[1::2])]
+    regions = merge_regions(regions, VOCAL_REGION_MIN_GAP_SECONDS)
+    regions = [(s, min(e, duration)) for s, e in regions if e - s >= VOCAL_REGION_MIN_SECONDS]
+
+    ratio = coverage(regions, duration)
+    if not (VOCAL_REGION_MIN_COVERAGE <= ratio <= VOCAL_REGION_MAX_COVERAGE):
+        logger.info("ボーカル区間推定: 全体の%.0f%%（範囲外のため曲全体を分離）", ratio * 100)
+        return full
+    logger.info("ボーカル区間推定: %d区間, 全体の%.0f%% (%.0f秒 / %.0f秒)",
+                len(regions), ratio * 100, ratio * duration, duration)
+    return regions
+
+
+def best_window(y: np.ndarray, sr: int, seconds: float,
+                regions: Optional[List[Region]] = None) -> Region:
+    """
+    ボーカルらしさの合計が最大になる長さ seconds の区間（サビなど、歌が詰まった部分）。
+    regions（ユーザー指定の区間）があれば、その外側のスコアは 0 として扱う。
+    """
+    duration = len(y) / sr
+    if duration <= seconds:
+        return (0.0, duration)
+    score, frame_seconds = vocal_activity(y, sr)
+    if regions:
+        times = np.arange(len(score)) * frame_seconds
+        inside = np.zeros(len(score), dtype=bool)
+        for start, end in regions:
+            inside |= (times >= start) & (times < end)
+        score = np.where(inside, score, 0.0)
+    width = max(1, min(len(score), int(seconds / frame_seconds)))
+    sums = np.convolve(score, np.ones(width), mode="valid")
+    start = int(np.argmax(sums)) * frame_seconds
+    start = min(start, duration - seconds)
+    return (start, start + seconds)
@@ -1,11 +1,337 @@
+import logging
+import multiprocessing
 import os
 import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
+import numpy as np
+import torch
+import torchaudio.functional as AF
+
+from config import (
+    CREPE_SR, DEMUCS_WORKERS, DEMUCS_THREADS_PER_WORKER, WEB_CONCURRENCY,
+    DEMUCS_SEGMENT_SECONDS, DEMUCS_CROSSFADE_SECONDS, DEMUCS_SHIFTS, DEMUCS_OVERLAP,
+    VOCAL_REGION_PADDING_SECONDS,
+)
+from progress import report_progress
+from vocal_regions import pad_regions
+
+logger = logging.getLogger(__name__)
+
+# Demucs 出力 → CREPE 用の高品質リサンプル（librosa の kaiser_best 相当）
+_RESAMPLE_KWARGS = dict(
+    lowpass_filter_width=64, rolloff=0.9475,
+    resampling_method="sinc_interp_kaiser", beta=14.769656459379492,
+)
+
+_models: dict = {}
+_models_lock = threading.Lock()
+
+# セグメント並列分離用のプロセスプール（モデル名ごとに1つ。各プロセスは起動時にモデルをロード）
+_pools: dict = {}
+_pools_lock = threading.Lock()
+
+
+def _select_model(fast_mode: bool, ultra_fast_mode: bool) -> tuple:
+    """モデル選択: ultra_fast > fast > default → (モデル名, ログ用ラベル)"""
+    if ultra_fast_mode:
+        return "htdemucs_6s", "⚡ ULTRA FAST MODE (3-5x faster)"
+    if fast_mode:
+        return "htdemucs", "🚀 FAST MODE (2-3x faster)"
+    return "htdemucs_ft", "💎 HIGH QUALITY"
+
+
+def _device() -> str:
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def get_model(model_name: str):
+    """Demucs モデルをプロセス内で1回だけロードして使い回す"""
+    with _models_lock:
+        model = _models.get(model_name)
+        if model is None:
+            from demucs.pretrained import get_model as load_pretrained
+            logger.info("Demucsモデルをロード中: %s", model_name)
+            model = load_pretrained(model_name)
+            model.eval()
+            _models[model_name] = model
+        return model
+
+
+def preload_model(ultra_fast_mode: bool = True) -> None:
+    """解析ワーカー起動時に Demucs の重みを先にロードしておく（並列分離のプロセスも起動する）"""
+    model_name, _ = _select_model(False, ultra_fast_mode)
+    try:
+        get_model(model_name)
+        pool = _get_pool(model_name) if _device() == "cpu" else None
+        if pool is not None:
+            for future in [pool.submit(os.getpid) for _ in range(_pool_size())]:
+                future.result()
+    except Exception as e:
+        logger.warning("Demucsモデルの事前ロード失敗: %s", e)
+
+
+def _vocals_from(model, mix: torch.Tensor, device: str) -> torch.Tensor:
+    """正規化済みミックス (channels, samples) → ボーカル (channels, samples)"""
+    from demucs.apply import apply_model
+
+    sources = apply_model(
+        model, mix[None], device=device,
+        shifts=DEMUCS_SHIFTS, split=True, overlap=DEMUCS_OVERLAP, progress=False,
+    )[0]
+    return sources[model.sources.index("vocals")]
+
+
+# ============================================================
+# セグメント並列分離（CPU のみ）
+# ============================================================
+def _cpu_cores() -> int:
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+
+
+def _pool_size() -> int:
+    """
+    1つの uvicorn ワーカーが持つプールのプロセス数。プールはワーカーごとに作られるので、
+    自動設定（DEMUCS_WORKERS=0）ではコアを WEB_CONCURRENCY 個のワーカーで分け合う。
+    WEB_CONCURRENCY が無ければワーカー数が分からないので、自動設定はせず並列化しない
+    """
+    if DEMUCS_WORKERS > 0:
+        return DEMUCS_WORKERS
+    if WEB_CONCURRENCY is None:
+        logger.warning("DEMUCS_WORKERS=0 ですが WEB_CONCURRENCY が未設定のため、Demucsの並列分離を行いません"
+                       "（uvicorn の --workers と同じ値を WEB_CONCURRENCY に設定してください）")
+        return 1
+    return max(1, _cpu_cores() // (max(1, DEMUCS_THREADS_PER_WORKER) * max(1, WEB_CONCURRENCY)))
+
+
+def _warn_if_oversubscribed(workers: int) -> None:
+    """全 uvicorn ワーカーのプールを合わせたスレッド数がコア数を超える設定なら警告する"""
+    cores = _cpu_cores()
+    if WEB_CONCURRENCY is None:
+        logger.warning(
+            "WEB_CONCURRENCY が未設定のため、全ワーカーのDemucsプロセス数を確認できません: "
+            "ワーカーごとに %dプロセス × %dスレッド（モデル %d 個）、コア数 %d",
+            workers, DEMUCS_THREADS_PER_WORKER, workers + 1, cores,
+        )
+        return
+    threads = max(1, WEB_CONCURRENCY) * workers * max(1, DEMUCS_THREADS_PER_WORKER)
+    if threads > cores:
+        logger.warning(
+            "Demucs並列分離のスレッド数がコア数を超えています: %dワーカー × %dプロセス × %dスレッド = %d > %dコア"
+            "（DEMUCS_WORKERS / DEMUCS_THREADS_PER_WORKER / WEB_CONCURRENCY を見直してください。"
+            "モデルはワーカーごとに %d 個ロードされます）",
+            WEB_CONCURRENCY, workers, DEMUCS_THREADS_PER_WORKER, threads, cores, workers + 1,
+        )
+
+
+def _init_pool_worker(model_name: str, threads: int) -> None:
+    """プールの各プロセスの初期化: torch のスレッド数を絞り、モデルをロードしておく"""
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    get_model(model_name)
+
+
+def _separate_segment(model_name: str, segment: np.ndarray) -> np.ndarray:
+    """プールのプロセスで実行: 正規化済みセグメント (channels, samples) → ボーカル"""
+    with torch.inference_mode():
+        vocals = _vocals_from(get_model(model_name), torch.from_numpy(segment), "cpu")
+        return vocals.numpy()
+
+
+def _get_pool(model_name: str):
+    """並列分離用のプロセスプール（1プロセス構成なら None）"""
+    workers = _pool_size()
+    if workers <= 1:
+        return None
+    with _pools_lock:
+        pool = _pools.get(model_name)
+        if pool is None:
+            # torch 読込済みのプロセスを fork すると OpenMP のスレッドプールが壊れるため spawn で起動する
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_pool_worker,
+                initargs=(model_name, max(1, DEMUCS_THREADS_PER_WORKER)),
+            )
+            _pools[model_name] = pool
+            logger.info("Demucs並列分離プール起動: %s (%dプロセス × %dスレッド)",
+                        model_name, workers, DEMUCS_THREADS_PER_WORKER)
+            _warn_if_oversubscribed(workers)
+        return pool
+
+
+def _discard_pool(model_name: str) -> None:
+    with _pools_lock:
+        pool = _pools.pop(model_name, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def split_segments(n_samples: int, segment: int, crossfade: int) -> list:
+    """[0, n_samples) を長さ segment・重なり crossfade の区間 (start, end) に分ける"""
+    if n_samples <= segment:
+        return [(0, n_samples)]
+    step = segment - crossfade
+    bounds, start = [], 0
+    while True:
+        end = min(start + segment, n_samples)
+        bounds.append((start, end))
+        if end >= n_samples:
+            return bounds
+        start += step
+
+
+def stitch_segments(parts: list, bounds: list, n_samples: int, crossfade: int) -> np.ndarray:
+    """
+    分離済みセグメント (channels, len) を線形クロスフェードでつなぐ。
+    重なり部分では前のセグメントのフェードアウトと次のフェードインの和が常に 1 になる。
+    """
+    out = np.zeros((parts[0].shape[0], n_samples), dtype=np.float32)
+    weight = np.zeros(n_samples, dtype=np.float32)
+    for i, (part, (start, end)) in enumerate(zip(parts, bounds)):
+        w = np.ones(end - start, dtype=np.float32)
+        if i > 0:
+            fade = min(crossfade, bounds[i - 1][1] - start)
+            w[:fade] = (np.arange(fade, dtype=np.float32) + 0.5) / fade
+        if i < len(bounds) - 1:
+            fade = min(crossfade, end - bounds[i + 1][0])
+            w[end - start - fade:] = 1.0 - (np.arange(fade, dtype=np.float32) + 0.5) / fade
+        out[:, start:end] += part * w
+        weight[start:end] += w
+    out /= np.maximum(weight, 1e-8)
+    return out
+
+
+def _separate_parallel(pool, model_name: str, mix: np.ndarray, spans: list, sr: int) -> list:
+    """
+    正規化済みミックス (channels, samples) の各区間 (start, end) をセグメントに分け、
+    全区間のセグメントをまとめてプールに投げる → 区間ごとにつないだボーカルのリスト
+    """
+    crossfade = int(DEMUCS_CROSSFADE_SECONDS * sr)
+    segment = max(int(DEMUCS_SEGMENT_SECONDS * sr), 2 * crossfade + 1)
+    jobs = []
+    for start, end in spans:
+        bounds = split_segments(end - start, segment, crossfade)
+        futures = [pool.submit(_separate_segment, model_name,
+                               np.ascontiguousarray(mix[:, start + s:start + e]))
+                   for s, e in bounds]
+        jobs.append((bounds, futures))
+    logger.info("Demucs並列分離: %d区間 / %dセグメント (%.0f秒, 重なり%.1f秒)",
+                len(spans), sum(len(b) for b, _ in jobs), DEMUCS_SEGMENT_SECONDS, DEMUCS_CROSSFADE_SECONDS)
+    # 終わった順にセグメント単位の進捗を通知（例外はつなぐときの result() で送出される）
+    all_futures = [f for _, futures in jobs for f in futures]
+    for done, _ in enumerate(as_completed(all_futures), 1):
+        report_progress("separate_vocals", done / len(all_futures))
+    return [stitch_segments([f.result() for f in futures], bounds, bounds[-1][1], crossfade)
+            for bounds, futures in jobs]
+
+
+def _edge_fade(length: int, fade: int, fade_in: bool, fade_out: bool, device) -> torch.Tensor:
+    """区間の端（曲の先頭・末尾以外）を余白の長さで線形にフェードする重み"""
+    w = torch.ones(length, device=device)
+    fade = min(fade, length // 2)
+    if fade > 0:
+        ramp = (torch.arange(fade, device=device, dtype=torch.float32) + 0.5) / fade
+        if fade_in:
+            w[:fade] = ramp
+        if fade_out:
+            w[length - fade:] = ramp.flip(0)
+    return w
+
+
+def _separate_tensor(model, model_name: str, wav: torch.Tensor, device: str,
+                     spans: list | None = None, fade: int = 0) -> torch.Tensor:
+    """
+    (channels, samples) のミックス → 同じ長さのボーカル (channels, samples)。demucs CLI と同じく
+    曲全体の平均・標準偏差で正規化する（セグメント並列・区間分離でも正規化は全体で1回）。
+
+    spans（サンプル単位の (start, end)、余白込み・重なりなし）を渡すとその区間だけを分離し、
+    それ以外は無音にする。区間の端は fade サンプルかけてフェードする。
+    """
+    n = wav.shape[1]
+    ref = wav.mean(0)
+    mean, std = ref.mean(), ref.std() + 1e-8
+    mix = (wav - mean) / std
+    spans = spans or [(0, n)]
+
+    parts = None
+    pool = _get_pool(model_name) if device == "cpu" else None
+    if pool is not None and (len(spans) > 1 or n > DEMUCS_SEGMENT_SECONDS * model.samplerate):
+        try:
+            parts = [torch.from_numpy(p)
+                     for p in _separate_parallel(pool, model_name, mix.numpy(), spans, model.samplerate)]
+        except BrokenProcessPool:
+            logger.exception("Demucs並列分離プールが異常終了。このリクエストはワーカー内で分離します")
+            _discard_pool(model_name)
+    if parts is None:
+        parts = [_vocals_from(model, mix[:, s:e], device) for s, e in spans]
+
+    if spans == [(0, n)]:
+        return parts[0] * std + mean
+    vocals = torch.zeros_like(mix)
+    for (s, e), part in zip(spans, parts):
+        w = _edge_fade(e - s, fade, fade_in=s > 0, fade_out=e < n, device=vocals.device)
+        vocals[:, s:e] = (part.to(vocals.device) * std + mean) * w
+    return vocals
+
+
+def separate_vocals_array(y: np.ndarray, sr: int, target_sr: int = CREPE_SR,
+                          fast_mode: bool = False, ultra_fast_mode: bool = False,
+                          regions: list | None = None) -> np.ndarray:
+    """
+    Demucs をプロセス内で実行し、ボーカルを target_sr（既定は CREPE 用 16kHz）のモノラル
+    float32 配列で返す。WAV の書き出し・読み直し、解析側でのモノラル化・リサンプルは不要になる。
+
+    Args:
+        y: ミックス音源 (frames, channels) または (frames,)。Demucs はステレオ 44.1kHz で最適に動作する
+        sr: y のサンプリングレート（モデルのレートと違えば同じデバイス上でリサンプル）
+        regions: ボーカル区間 [(開始秒, 終了秒), ...]（vocal_regions）。指定すると前後に
+                 VOCAL_REGION_PADDING_SECONDS の余白を付けた区間だけを分離し、残りは無音として返す
+                 （長さ・時刻は入力と同じ）
+    """
+    model_name, mode_label = _select_model(fast_mode, ultra_fast_mode)
+    duration = len(y) / sr
+    logger.info("Starting Demucs separation (in-process): %.1fs", duration)
+    logger.info("Model: %s %s", model_name, mode_label)
+    model = get_model(model_name)
+    device = _device()
+
+    with torch.inference_mode():
+        wav = torch.from_numpy(np.ascontiguousarray(y.T if y.ndim > 1 else y[None])).to(device)
+        if wav.shape[0] != model.audio_channels:
+            wav = wav.mean(0, keepdim=True).repeat(model.audio_channels, 1)
+        if sr != model.samplerate:
+            wav = AF.resample(wav, sr, model.samplerate, **_RESAMPLE_KWARGS)
+
+        spans = None
+        if regions:
+            n = wav.shape[1]
+            padded = pad_regions(regions, VOCAL_REGION_PADDING_SECONDS, duration)
+            spans = [(int(s * model.samplerate), min(n, int(e * model.samplerate))) for s, e in padded]
+            spans = [(s, e) for s, e in spans if e > s] or None
+            if spans:
+                logger.info("分離対象: %d区間, 全体の%.0f%%",
+                            len(spans), 100 * sum(e - s for s, e in spans) / n)
+        vocals = _separate_tensor(model, model_name, wav, device, spans=spans,
+                                  fade=int(VOCAL_REGION_PADDING_SECONDS * model.samplerate))
+
+        # ボーカルを同じデバイス上でモノラル化 → target_sr にリサンプル
+        mono = vocals.mean(0)
+        if target_sr != model.samplerate:
+            mono = AF.resample(mono, model.samplerate, target_sr, **_RESAMPLE_KWARGS)
+        out = mono.to("cpu", torch.float32).numpy()
+
+    logger.info("Separation complete: %.1fs @ %sHz", len(out) / target_sr, target_sr)
+    return out
+
+
 def separate_vocals(input_wav_path: str, output_dir: str = "separated", 
                     fast_mode: bool = False, ultra_fast_mode: bool = False) -> str:
     """
-    Demucsを使ってボーカル分離を行う
+    Demucs（CLI）を使ってボーカル分離を行う。API からは separate_vocals_array を使う
     
     Args:
         input_wav_path: 入力WAVファイルのパス
@@ -19,16 +345,7 @@ def separate_vocals(input_wav_path: str, output_dir: str = "separated",
     if not input_file.exists():
         raise FileNotFoundError(f"Input file not found: {input_wav_path}")
 
-    # モデル選択: ultra_fast > fast > default
-    if ultra_fast_mode:
-        model_name = "htdemucs_6s"
-        mode_label = "⚡ ULTRA FAST MODE (3-5x faster)"
-    elif fast_mode:
-        model_name = "htdemucs"
-        mode_label = "🚀 FAST MODE (2-3x faster)"
-    else:
-        model_name = "htdemucs_ft"
-        mode_label = "💎 HIGH QUALITY"
+    model_name, mode_label = _select_model(fast_mode, ultra_fast_mode)
     
     cmd = [
         "demucs",
@@ -42,8 +359,8 @@ def separate_vocals(input_wav_path: str, output_dir: str = "separated",
     
     cmd.append(str(input_wav_path))
     
-    print(f"[INFO] Starting Demucs separation for: {input_wav_path}")
-    print(f"[INFO] Model: {model_name} {mode_label}")
+    logger.info("Starting Demucs separation for: %s", input_wav_path)
+    logger.info("Model: %s %s", model_name, mode_label)
     try:
         subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     except subprocess.CalledProcessError as e:
@@ -76,5 +393,5 @@ def separate_vocals(input_wav_path: str, output_dir: str = "separated",
         else:
              expected_path = found[0]
         
-    print(f"[INFO] Separation complete: {expected_path}")
+    logger.info("Separation complete: %s", expected_path)
     return str(expected_path)
\ No newline at end of file
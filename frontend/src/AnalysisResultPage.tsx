@@ -168,6 +168,17 @@ const AnalysisResultPage: React.FC<AnalysisResultPageProps> = ({ result }) => {
           </div>
         )}
 
+        {/* 速報バッジ */}
+        {!useIntegrated && result?.provisional && (
+          <div className="mb-6 flex justify-center">
+            <div className="inline-flex bg-slate-900/60 backdrop-blur-md rounded-full px-6 py-3 border border-amber-500/30">
+              <span className="text-sm font-medium text-amber-400">
+                ⏳ 速報（曲の一部から算出）— 曲全体の解析が終わると自動で更新されます
+              </span>
+            </div>
+          </div>
+        )}
+
         <div className="grid grid-cols-1 lg:grid-cols-3 gap-6">
 
           {/* 左カラム: メイン解析 */}
@@ -4,6 +4,7 @@ import {
   getAnalysisHistory,
   AnalysisHistoryRecord,
   deleteAnalysisHistory,
+  HISTORY_PAGE_SIZE,
 } from "./api";
 import { useAuth } from "./contexts/AuthContext";
 
@@ -29,6 +30,8 @@ const HistoryPage: React.FC<HistoryPageProps> = ({
   const [swipedId, setSwipedId] = useState<string | null>(null);
   const [deletingId, setDeletingId] = useState<string | null>(null);
   const [swipeOffset, setSwipeOffset] = useState<number>(0);
+  const [hasMore, setHasMore] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
   const swipeStates = useRef<Record<string, SwipeState>>({});
 
   useEffect(() => {
@@ -41,6 +44,7 @@ const HistoryPage: React.FC<HistoryPageProps> = ({
       try {
         const data = await getAnalysisHistory();
         setHistory(data);
+        setHasMore(data.length === HISTORY_PAGE_SIZE);
       } catch (err: any) {
         setError("履歴の取得に失敗しました。");
         console.error(err);
@@ -52,6 +56,23 @@ const HistoryPage: React.FC<HistoryPageProps> = ({
     fetchHistory();
   }, [isAuthenticated]);
 
+  // 続きを読み込む（最後の created_at より古い履歴）
+  const loadMore = async () => {
+    const last = history[history.length - 1];
+    if (!last || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const data = await getAnalysisHistory(HISTORY_PAGE_SIZE, last.created_at);
+      setHistory((prev) => [...prev, ...data]);
+      setHasMore(data.length === HISTORY_PAGE_SIZE);
+    } catch (err) {
+      alert("履歴の取得に失敗しました。");
+      console.error(err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // 削除処理（確認あり）
   const handleDelete = async (e: React.MouseEvent, recordId: string) => {
     e.stopPropagation(); // 親要素のクリックイベント（画面遷移）を防ぐ
@@ -313,6 +334,15 @@ const HistoryPage: React.FC<HistoryPageProps> = ({
               </div>
             </div>
           ))}
+          {hasMore && (
+            <button
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="w-full py-3 rounded-xl border border-cyan-500/50 text-cyan-300 font-bold tracking-widest hover:bg-cyan-500/10 transition-all duration-300 disabled:opacity-50"
+            >
+              {loadingMore ? "読み込み中..." : "もっと見る"}
+            </button>
+          )}
         </div>
       )}
     </div>
@@ -9,14 +9,18 @@ const API = axios.create({
   timeout: TIMEOUT_MS,
 });
 
+// Supabaseのセッショントークン（ログインしていなければ null）
+const getAccessToken = async (): Promise<string | null> => {
+  if (!supabase) return null;
+  const { data } = await supabase.auth.getSession();
+  return data.session?.access_token ?? null;
+};
+
 // Supabaseのセッショントークンを自動でAuthorizationヘッダーに付与
 API.interceptors.request.use(async (config) => {
-  if (supabase) {
-    const { data } = await supabase.auth.getSession();
-    const token = data.session?.access_token;
-    if (token) {
-      config.headers.Authorization = `Bearer ${token}`;
-    }
+  const token = await getAccessToken();
+  if (token) {
+    config.headers.Authorization = `Bearer ${token}`;
   }
   return config;
 });
@@ -121,6 +125,7 @@ export interface AnalysisResult {
   voice_type?: VoiceType;
   recommended_songs?: RecommendedSong[];
   similar_artists?: SimilarArtist[];
+  provisional?: boolean;  // 速報（曲の一部だけを粗く解析した暫定結果）
   error?: string;
 }
 
@@ -164,19 +169,170 @@ export const analyzeVoice = async (blob: Blob, noFalsetto: boolean = false): Pro
   return res.data;
 };
 
-/** カラオケ音源用 */
+/**
+ * カラオケ音源用
+ * vocalRanges: 歌っている区間（例: "0:45-1:30,2:10-3:00"）。指定するとその区間だけを分離・解析する
+ */
 export const analyzeKaraoke = async (
   file: File | Blob,
   filename: string,
   noFalsetto: boolean = false,
+  vocalRanges?: string,
 ): Promise<AnalysisResult> => {
   const formData = new FormData();
   formData.append("file", file, filename);
   if (noFalsetto) formData.append("no_falsetto", "true");
+  if (vocalRanges?.trim()) formData.append("vocal_ranges", vocalRanges.trim());
   const res = await API.post<AnalysisResult>("/analyze-karaoke", formData);
   return res.data;
 };
 
+/** 解析ジョブの状態（GET /analysis-jobs/{job_id}） */
+export interface AnalysisJob {
+  job_id: string;
+  status: "queued" | "running" | "preview" | "done" | "error";
+  stage: string | null;
+  progress: number;  // 全体の進み具合（0〜100）
+  preview: AnalysisResult | null;
+  result: AnalysisResult | null;
+  error: string | null;
+}
+
+/** 解析ジョブの進捗（SSE の progress イベント） */
+export type AnalysisJobProgress = Pick<AnalysisJob, "status" | "stage" | "progress">;
+
+const JOB_POLL_INTERVAL_MS = 2000;
+
+/** カラオケ音源の解析ジョブを開始（アップロードが終わるとすぐ job_id が返る） */
+export const startKaraokeJob = async (
+  file: File | Blob,
+  filename: string,
+  noFalsetto: boolean = false,
+  vocalRanges?: string,
+): Promise<string> => {
+  const formData = new FormData();
+  formData.append("file", file, filename);
+  if (noFalsetto) formData.append("no_falsetto", "true");
+  if (vocalRanges?.trim()) formData.append("vocal_ranges", vocalRanges.trim());
+  const res = await API.post<{ job_id: string }>("/analyze-karaoke/jobs", formData);
+  return res.data.job_id;
+};
+
+/** 解析ジョブの状態取得 */
+export const getAnalysisJob = async (jobId: string): Promise<AnalysisJob> => {
+  const res = await API.get<AnalysisJob>(`/analysis-jobs/${jobId}`);
+  return res.data;
+};
+
+interface JobHandlers {
+  onPreview?: (preview: AnalysisResult) => void;
+  onProgress?: (progress: AnalysisJobProgress) => void;
+}
+
+/**
+ * 解析ジョブの進捗を SSE（GET /analysis-jobs/{job_id}/events）で受け取り、最終結果を返す。
+ * EventSource は Authorization ヘッダーを付けられないため fetch のストリームを読む。
+ * ストリームが途中で切れた場合は null を返す（呼び出し側でポーリングに切り替える）
+ */
+const streamAnalysisJob = async (
+  jobId: string,
+  handlers: JobHandlers,
+  signal: AbortSignal,
+): Promise<AnalysisResult | null> => {
+  const token = await getAccessToken();
+  const res = await fetch(`${API.defaults.baseURL}/analysis-jobs/${jobId}/events`, {
+    headers: token ? { Authorization: `Bearer ${token}` } : {},
+    signal,
+  });
+  if (!res.ok || !res.body) return null;
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) return null;
+    buffer += decoder.decode(value, { stream: true });
+    // イベントは空行区切り。"event: 名前" と "data: JSON" の行からなる（":" で始まる行はコメント）
+    let sep: number;
+    while ((sep = buffer.indexOf("\n\n")) >= 0) {
+      const block = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      let event = "message";
+      let data = "";
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      if (!data) continue;
+      const payload = JSON.parse(data);
+      if (event === "progress") handlers.onProgress?.(payload);
+      else if (event === "preview") handlers.onPreview?.(payload);
+      else if (event === "done") return payload;
+      else if (event === "error") return { error: payload.error ?? "解析に失敗しました" } as AnalysisResult;
+    }
+  }
+};
+
+/** 解析ジョブをポーリングして最終結果を返す（SSE が使えないとき用） */
+const pollAnalysisJob = async (
+  jobId: string,
+  handlers: JobHandlers,
+  deadline: number,
+): Promise<AnalysisResult> => {
+  let previewShown = false;
+  while (Date.now() < deadline) {
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    const job = await getAnalysisJob(jobId);
+    handlers.onProgress?.({ status: job.status, stage: job.stage, progress: job.progress });
+    if (job.status === "done" && job.result) return job.result;
+    if (job.status === "error") return { error: job.error ?? "解析に失敗しました" } as AnalysisResult;
+    if (job.preview && !previewShown) {
+      previewShown = true;
+      handlers.onPreview?.(job.preview);
+    }
+  }
+  throw new Error("timeout");
+};
+
+/**
+ * カラオケ音源用（速報・進捗つき）
+ * 曲の一部だけを粗く解析した速報が出たら onPreview、進捗が変わるたびに onProgress を呼び、最終結果を返す
+ */
+export const analyzeKaraokeProgressive = async (
+  file: File | Blob,
+  filename: string,
+  noFalsetto: boolean = false,
+  vocalRanges?: string,
+  onPreview?: (preview: AnalysisResult) => void,
+  onProgress?: (progress: AnalysisJobProgress) => void,
+): Promise<AnalysisResult> => {
+  const jobId = await startKaraokeJob(file, filename, noFalsetto, vocalRanges);
+  const deadline = Date.now() + TIMEOUT_MS;
+  let previewShown = false;
+  const handlers: JobHandlers = {
+    onPreview: (preview) => {
+      if (previewShown) return;
+      previewShown = true;
+      onPreview?.(preview);
+    },
+    onProgress,
+  };
+
+  const controller = new AbortController();
+  const timer = setTimeout(() => controller.abort(), TIMEOUT_MS);
+  try {
+    const result = await streamAnalysisJob(jobId, handlers, controller.signal);
+    if (result) return result;
+  } catch (err) {
+    if (controller.signal.aborted) throw new Error("timeout");
+    console.warn("進捗ストリームが切断されたためポーリングに切り替えます", err);
+  } finally {
+    clearTimeout(timer);
+  }
+  return pollAnalysisJob(jobId, handlers, deadline);
+};
+
 /** 楽曲検索レスポンス */
 export interface SongsResponse {
   songs: Song[];
@@ -305,9 +461,21 @@ export interface AnalysisHistoryRecord {
   result_json?: AnalysisResult | null;
 }
 
-// 履歴取得API
-export const getAnalysisHistory = async (limit = 50): Promise<AnalysisHistoryRecord[]> => {
-  const res = await API.get<AnalysisHistoryRecord[]>("/analysis/history", { params: { limit } });
+/** 履歴一覧の1ページの件数 */
+export const HISTORY_PAGE_SIZE = 20;
+
+// 履歴取得API（一覧には result_json を含まない。before に前ページ最後の created_at を渡すと続きを取得）
+export const getAnalysisHistory = async (
+  limit = HISTORY_PAGE_SIZE,
+  before?: string,
+): Promise<AnalysisHistoryRecord[]> => {
+  const res = await API.get<AnalysisHistoryRecord[]>("/analysis/history", { params: { limit, before } });
+  return res.data;
+};
+
+/** 履歴詳細API（result_json 付き。おすすめ曲などはサーバーで再計算される） */
+export const getAnalysisRecord = async (recordId: string): Promise<AnalysisHistoryRecord> => {
+  const res = await API.get<AnalysisHistoryRecord>(`/analysis/history/${recordId}`);
   return res.data;
 };
 
@@ -1,5 +1,5 @@
 import React, { useState, useRef } from "react";
-import { analyzeKaraoke, AnalysisResult } from "../api";
+import { analyzeKaraokeProgressive, AnalysisResult } from "../api";
 import { CloudArrowUpIcon, DocumentArrowUpIcon } from "@heroicons/react/24/solid";
 import { useAnalysis } from '../contexts/AnalysisContext';
 
@@ -12,7 +12,7 @@ const KaraokeUploader: React.FC<Props> = ({ onResult }) => {
     isAnalyzing: loading, setIsAnalyzing: setLoading, 
     progress, setProgress, 
     stepLabel, setStepLabel,
-    startAnalysisTimer, stopAnalysisTimer 
+    startAnalysisTimer, stopAnalysisTimer, showJobProgress
   } = useAnalysis();
 
   const [error, setError] = useState("");
@@ -20,6 +20,7 @@ const KaraokeUploader: React.FC<Props> = ({ onResult }) => {
   const [isHovered, setIsHovered] = useState(false);
   const [isDragging, setIsDragging] = useState(false);
   const [noFalsetto, setNoFalsetto] = useState(false);
+  const [vocalRanges, setVocalRanges] = useState("");
 
   const fileInputRef = useRef<HTMLInputElement>(null);
 
@@ -47,7 +48,10 @@ const KaraokeUploader: React.FC<Props> = ({ onResult }) => {
     startAnalysisTimer('upload');
 
     try {
-      const data = await analyzeKaraoke(file, file.name, noFalsetto);
+      // 速報（曲の一部の暫定結果）が出たら先に表示し、最終結果で置き換える
+      const data = await analyzeKaraokeProgressive(
+        file, file.name, noFalsetto, vocalRanges, onResult, showJobProgress,
+      );
       stopAnalysisTimer();
       setProgress(100);
       setStepLabel("完了！");
@@ -138,6 +142,19 @@ const KaraokeUploader: React.FC<Props> = ({ onResult }) => {
         裏声を使わない（地声のみで判定）
       </label>
 
+      {/* 歌っている区間の指定（任意。未指定ならサーバーが自動で推定） */}
+      <label className="flex flex-col items-center gap-1 text-sm text-fuchsia-200 w-full max-w-md">
+        <span>歌っている区間（任意）</span>
+        <input
+          type="text"
+          value={vocalRanges}
+          onChange={(e) => setVocalRanges(e.target.value)}
+          disabled={loading}
+          placeholder="例: 0:45-1:30, 2:10-3:00"
+          className="w-full px-3 py-1.5 rounded border border-fuchsia-500/50 bg-fuchsia-950/50 text-fuchsia-100 placeholder-fuchsia-400/50 text-center focus:outline-none focus:ring-1 focus:ring-fuchsia-400"
+        />
+      </label>
+
       {/* Cyberpunk Dropzone ("Data Transfer Gate") */}
       <div className="w-full relative group perspective-[1000px] mt-2">
         <label
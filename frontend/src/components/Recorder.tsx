@@ -1,5 +1,5 @@
 import React, { useState, useRef, useEffect, useCallback } from "react";
-import { analyzeVoice, analyzeKaraoke, AnalysisResult } from "../api";
+import { analyzeVoice, analyzeKaraokeProgressive, AnalysisResult } from "../api";
 import { MicrophoneIcon, StopIcon } from "@heroicons/react/24/solid";
 import "./Recorder.css";
 import { useAnalysis } from '../contexts/AnalysisContext';
@@ -15,7 +15,7 @@ const Recorder: React.FC<Props> = ({ onResult, initialUseDemucs = false }) => {
     isAnalyzing: loading, setIsAnalyzing: setLoading,
     progress, setProgress,
     stepLabel, setStepLabel,
-    startAnalysisTimer, stopAnalysisTimer
+    startAnalysisTimer, stopAnalysisTimer, showJobProgress
   } = useAnalysis();
 
   const [noFalsetto, setNoFalsetto] = useState(false);
@@ -128,7 +128,7 @@ const Recorder: React.FC<Props> = ({ onResult, initialUseDemucs = false }) => {
 
         try {
           const data = initialUseDemucs
-            ? await analyzeKaraoke(blob, "recording.webm", noFalsetto)
+            ? await analyzeKaraokeProgressive(blob, "recording.webm", noFalsetto, undefined, undefined, showJobProgress)
             : await analyzeVoice(blob, noFalsetto);
 
           stopAnalysisTimer();
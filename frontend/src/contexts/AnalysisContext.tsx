@@ -1,4 +1,5 @@
 import React, { createContext, useState, useContext, ReactNode, useRef } from 'react';
+import { AnalysisJobProgress } from '../api';
 
 export type AnalysisMode = 'upload' | 'karaoke_record' | 'mic_record' | null;
 
@@ -11,6 +12,7 @@ interface AnalysisContextType {
   setStepLabel: (label: string) => void;
   startAnalysisTimer: (mode: AnalysisMode) => void;
   stopAnalysisTimer: () => void;
+  showJobProgress: (job: AnalysisJobProgress) => void;
 }
 
 const AnalysisContext = createContext<AnalysisContextType | undefined>(undefined);
@@ -29,6 +31,19 @@ const STEPS_DEMUCS = [
   { progress: 90, label: "📊 音域を解析中..." },
 ];
 
+// 解析ジョブのステージ（サーバーから届く実際の進捗）の表示名
+const STAGE_LABELS: Record<string, string> = {
+  preview_window: "⚡ 速報用にサビを探しています...",
+  detect_vocal_regions: "🔍 歌っている区間を探しています...",
+  separate_vocals: "🎤 ボーカル分離中...",
+  preprocess: "🎵 音声を整えています...",
+  pitch_detection: "🎵 音高を推定中...",
+  filter_frames: "📊 音域を解析中...",
+  register_filter: "📊 音域を解析中...",
+  classify_frames: "📊 地声・裏声を判定中...",
+  build_result: "📊 結果をまとめています...",
+};
+
 export const AnalysisProvider: React.FC<{ children: ReactNode }> = ({ children }) => {
   const [isAnalyzing, setIsAnalyzing] = useState(false);
   const [progress, setProgress] = useState(0);
@@ -80,12 +95,26 @@ export const AnalysisProvider: React.FC<{ children: ReactNode }> = ({ children }
     }
   };
 
+  // サーバーから進捗が届いたら、時間で進める疑似的な表示をやめて実際の進捗を表示する
+  const showJobProgress = (job: AnalysisJobProgress) => {
+    stopAnalysisTimer();
+    if (job.status === "queued") {
+      setStepLabel("⏳ 順番待ち中...");
+      return;
+    }
+    setProgress(Math.round(job.progress));
+    if (job.stage && STAGE_LABELS[job.stage]) {
+      setStepLabel(job.status === "preview" ? `${STAGE_LABELS[job.stage]}（速報表示中）` : STAGE_LABELS[job.stage]);
+    }
+  };
+
   return (
     <AnalysisContext.Provider value={{ 
       isAnalyzing, setIsAnalyzing, 
       progress, setProgress, 
       stepLabel, setStepLabel,
-      startAnalysisTimer, stopAnalysisTimer
+      startAnalysisTimer, stopAnalysisTimer,
+      showJobProgress
     }}>
       {children}
     </AnalysisContext.Provider>
@@ -2,13 +2,20 @@ import React from "react";
 import { useNavigate } from "react-router-dom";
 import HistoryPage from "../HistoryPage";
 import { useAppContext } from "../contexts/AppContext";
-import { AnalysisResult, AnalysisHistoryRecord } from "../api";
+import { AnalysisResult, AnalysisHistoryRecord, getAnalysisRecord } from "../api";
 
 const HistoryRoute: React.FC = () => {
   const navigate = useNavigate();
   const { setResult, setIsFromHistory } = useAppContext();
 
-  const handleSelectRecord = (record: AnalysisHistoryRecord) => {
+  const handleSelectRecord = async (summary: AnalysisHistoryRecord) => {
+    // 一覧には result_json が含まれないので、詳細を取得する（失敗時は一覧の情報だけで表示）
+    let record = summary;
+    try {
+      record = await getAnalysisRecord(summary.id);
+    } catch (err) {
+      console.error(err);
+    }
     if (record.result_json) {
       setResult(record.result_json);
     } else {